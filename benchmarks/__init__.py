@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# keep the settings, journals and caches written while benchmarking away from the real ones
+# (only honoured where appdirs follows the XDG variables, e.g. on Linux)
+_data_dir = tempfile.mkdtemp(prefix='musicbar-benchmarks-')
+for _variable in ('XDG_DATA_HOME', 'XDG_CACHE_HOME', 'XDG_CONFIG_HOME'):
+    os.environ[_variable] = os.path.join(_data_dir, _variable.lower())
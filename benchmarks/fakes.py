@@ -0,0 +1,168 @@
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Callable, Iterable, List, Optional, Sequence, Set, Tuple
+
+from musicbar.enums import PlayerApp, ScrobbleApp, Track
+from musicbar.utils import ScriptBackend, ScriptFailed, ScriptKey
+
+# queries which control a player, rather than read its state
+CONTROLS = {'activate', 'play', 'pause', 'next track', 'previous track'}
+
+
+@dataclass
+class FakePlayer:
+    """A running player, as seen by the FakeBackend"""
+    app: PlayerApp
+    state: str = 'playing'
+    # title, artist and album of the current track, or None if there is no current track
+    track: Optional[Tuple[str, str, str]] = ('Title', 'Artist', 'Album')
+    position: float = 0.0
+    duration: int = 240
+    # a hung player never answers, every script sent to it times out
+    hung: bool = False
+    controls: List[str] = field(default_factory=list)
+
+    def track_info(self) -> List[Any]:
+        if self.track is None:
+            return []
+
+        return [*self.track, int(self.position), self.duration]
+
+
+class FakeBackend(ScriptBackend):
+    """Answers the scripts MusicBar runs from in-memory state, without any Apple Events
+
+    Counts every script invocation, and can add a fixed latency to each of them to
+    model slow players."""
+
+    def __init__(self, installed: Iterable[Enum], players: Iterable[FakePlayer] = (),
+                 scrobblers: Iterable[ScrobbleApp] = (), latency: float = 0.0, hang: float = 0.02):
+        """Create a backend for the given apps.
+
+        Arguments:
+            installed {Iterable[Enum]} -- The installed players and scrobblers
+
+        Keyword Arguments:
+            players {Iterable[FakePlayer]} -- The running players (default: {()})
+            scrobblers {Iterable[ScrobbleApp]} -- The running scrobblers (default: {()})
+            latency {float} -- Seconds each script invocation takes (default: {0.0})
+            hang {float} -- Seconds a script waits on a hung player before timing out (default: {0.02})
+        """
+        self.installed: Set[str] = {app.value for app in installed}
+        self.players = {player.app.value: player for player in players}
+        self.scrobblers: Set[str] = {app.value for app in scrobblers}
+        self.latency = latency
+        self.hang = hang
+        # kinds of script, e.g. 'poll' or 'play', which fail the next time they are run
+        self.fail_next: Set[str] = set()
+
+        self.calls = 0
+        # scripts which waited on a hung player
+        self.timeouts = 0
+        # players asked for their position by a poll
+        self.position_queries = 0
+        self.calls_by_query: Counter = Counter()
+        self.compiled: Set[ScriptKey] = set()
+        # scripts may be run from several threads at once
+        self._lock = threading.Lock()
+
+    def player(self, app: PlayerApp) -> FakePlayer:
+        return self.players[app.value]
+
+    def is_running(self, app_id: str) -> bool:
+        return app_id in self.players or app_id in self.scrobblers
+
+    def execute(self, key: ScriptKey, source: Callable[[], str], args: Sequence[Any],
+                deadline: Optional[float] = None) -> Any:
+        app, query = key
+        with self._lock:
+            self.calls += 1
+            kind = query.split(' ')[0] if query.startswith('poll ') else query
+            self.calls_by_query[kind] += 1
+            failing = kind in self.fail_next
+            self.fail_next.discard(kind)
+
+            # build the source once per script, like the compiled script cache does
+            if key not in self.compiled:
+                source()
+                self.compiled.add(key)
+
+        if self.latency:
+            time.sleep(self.latency)
+        if failing:
+            raise ScriptFailed(f'{query} of {app or "MusicBar"} failed')
+
+        if query == 'apps_exist':
+            return [app_id in self.installed for app_id in args[0]]
+        if query == 'apps_running':
+            return [self.is_running(app_id) for app_id in args[0]]
+        if query.startswith('poll '):
+            return self._poll(query[len('poll '):], args[0], args[1])
+
+        player = self.players.get(app)
+        if player is None:
+            raise ScriptFailed(f'{app} is not running')
+
+        if player.hung:
+            self._wait_hung()
+            raise ScriptFailed(f'{app} got an error: AppleEvent timed out.', -1712)
+
+        if query == 'current track':
+            if player.track is None:
+                raise ScriptFailed(f'{app} has no current track')
+            return player.track_info()
+        if query == 'player state as string':
+            return player.state
+        if query == 'album artist of current track':
+            return player.track[1] if player.track else None
+        if query in CONTROLS:
+            player.controls.append(query)
+            return None
+
+        raise ScriptFailed(f'{app} does not understand {query}')
+
+    def _poll(self, player_ids: str, scrobbler_ids: List[str], want_positions: List[bool]) -> List[Any]:
+        player_states = []
+        for app_id, want_position in zip(filter(None, player_ids.split(',')), want_positions):
+            player = self.players.get(app_id)
+            if player is None:
+                player_states.append([False, '', []])
+            elif player.hung:
+                self._wait_hung()
+                player_states.append([True, 'timed out', []])
+            else:
+                track_info = player.track_info()
+                if track_info and want_position:
+                    with self._lock:
+                        self.position_queries += 1
+                elif track_info:
+                    track_info[3] = -1
+                player_states.append([True, player.state, track_info])
+
+        return [[self.is_running(app_id) for app_id in scrobbler_ids], player_states]
+
+    def _wait_hung(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+        time.sleep(self.hang)
+
+
+class FakeLastFm:
+    """Records now-playing updates and scrobbles instead of sending them"""
+
+    def __init__(self):
+        self.username = 'someone'
+        self.now_playing: List[Track] = []
+        self.scrobbles: List[Track] = []
+
+    def reset(self) -> None:
+        self.username = None
+
+    def update_now_playing(self, track: Track) -> None:
+        self.now_playing.append(track)
+
+    def scrobble(self, track: Track, position: int) -> None:
+        self.scrobbles.append(track)
@@ -0,0 +1,922 @@
+"""Benchmarks the refresh pipeline of MusicBar against a fake scripting backend
+
+Run from the root of the repository with `python -m benchmarks.run`. Results are
+written as JSON, and can be compared with the results of an earlier run using
+`--compare`. Needs no player, AppKit or Apple Events, so it also runs on Linux.
+"""
+import argparse
+import json
+import os
+import platform
+import plistlib
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from musicbar.artcache import AlbumArtCache, art_key, set_art_cache
+from musicbar.enums import Icons, PlayerApp, PlayerStatus, ScrobbleApp, Track
+from musicbar.events import FakeEventSource
+from musicbar.history import PlayHistory
+from musicbar.lastfm import LastFmApi
+from musicbar.menumodel import MenuEntry, diff_menu
+from musicbar.menus import MenuBuilder
+from musicbar.metrics import Metrics
+from musicbar.MusicBar import MusicBar
+from musicbar.position import PositionTracker
+from musicbar.refresh import RefreshPipeline
+from musicbar.resilience import POLL_TIMEOUT, UI_DEADLINE, resilience
+from musicbar.scheduler import RefreshScheduler
+from musicbar.scrobblers import ScrobblerResolver
+from musicbar.scrobblequeue import ScrobbleEntry
+from musicbar.scrobbling import ScrobbleEngine
+from musicbar.settings import Settings
+from musicbar.startup_profile import CORE_MODULE, check_budget, profile_imports, total_ms
+from musicbar.stats import ListeningStats, Period
+from musicbar.titles import FixedWidthMeasurer, TitleFitter
+from musicbar.transport import CachingTransport, KeepAliveTransport
+from musicbar.utils import ScriptFailed, execute, run, set_backend
+from musicbar.worker import LoopbackWorker, SubprocessWorker, WorkerBackend
+
+from .fakes import FakeBackend, FakeLastFm, FakePlayer
+from .stubserver import StubLastFm
+
+LONG_TITLE = 'The Ballad of a Title Which Is Far Too Long to Fit Into the Menu Bar, Part'
+LONG_ARTIST = 'An Artist Who Also Has an Unreasonably Long Name and Several Featured Guests'
+
+# bytes a refresh may allocate while nothing changes, mostly the output of the poll itself
+ALLOCATION_BUDGET = 4096
+
+Result = Dict[str, Any]
+
+
+def measure(func: Callable[[], Any], iterations: int, warmup: int = 10,
+            setup: Optional[Callable[[], Any]] = None) -> Result:
+    """Time the given function.
+
+    Arguments:
+        func {Callable[[], Any]} -- The function to time
+        iterations {int} -- Number of timed calls
+
+    Keyword Arguments:
+        warmup {int} -- Number of untimed calls made first (default: {10})
+        setup {Optional[Callable[[], Any]]} -- Called before every call, without being timed (default: {None})
+
+    Returns:
+        Result -- Statistics of the timed calls, in microseconds
+    """
+    for _ in range(warmup):
+        if setup:
+            setup()
+        func()
+
+    timings = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1e6)
+
+    timings.sort()
+    return {
+        'iterations': iterations,
+        'mean_us': statistics.mean(timings),
+        'median_us': statistics.median(timings),
+        'p95_us': timings[int(len(timings) * 0.95) - 1],
+        'min_us': timings[0]
+    }
+
+
+def make_pipeline(backend: FakeBackend, poll_plan: bool = True,
+                  lastfm: Optional[FakeLastFm] = None,
+                  positions: Optional[PositionTracker] = None,
+                  resolver: Optional[ScrobblerResolver] = None) -> RefreshPipeline:
+    set_backend(backend)
+    # breakers and failing queries of an earlier benchmark do not carry over
+    resilience.reset()
+    lastfm = lastfm or FakeLastFm()
+
+    return RefreshPipeline(MusicBar(poll_plan=poll_plan, positions=positions,
+                                    resolver=resolver),
+                           TitleFitter(FixedWidthMeasurer()),
+                           RefreshScheduler(), update_now_playing=lastfm.update_now_playing,
+                           scrobble=lastfm.scrobble, scrobbling=lambda: True)
+
+
+def make_backend() -> FakeBackend:
+    """Return a backend with iTunes playing, Spotify paused and a scrobbler running."""
+    return FakeBackend(installed=[PlayerApp.iTunes, PlayerApp.Spotify, PlayerApp.Vox,
+                                  ScrobbleApp.NepTunes, ScrobbleApp.MusicBar],
+                       players=[FakePlayer(PlayerApp.iTunes),
+                                FakePlayer(PlayerApp.Spotify, state='paused')],
+                       scrobblers=[ScrobbleApp.NepTunes, ScrobbleApp.MusicBar])
+
+
+def bench_tick(iterations: int, poll_plan: bool = True) -> Result:
+    """A refresh while the same track keeps playing."""
+    backend = make_backend()
+    pipeline = make_pipeline(backend, poll_plan)
+    player = backend.player(PlayerApp.iTunes)
+
+    def tick():
+        player.position = (player.position + 1) % player.duration
+        pipeline.refresh(force=True)
+
+    calls = backend.calls
+    result = measure(tick, iterations)
+    result['script_calls_per_tick'] = (backend.calls - calls) / (iterations + 10)
+
+    return result
+
+
+def bench_tick_interpolated(iterations: int) -> Result:
+    """A refresh while the same track keeps playing, predicting its position instead of asking for it."""
+    backend = make_backend()
+    clock = [0.0]
+    positions = PositionTracker(clock=lambda: clock[0])
+    pipeline = make_pipeline(backend, positions=positions)
+    player = backend.player(PlayerApp.iTunes)
+    player.duration = 100000
+
+    def tick():
+        # a second passes between refreshes, for the player and the tracker alike
+        clock[0] += 1
+        player.position += 1
+        pipeline.refresh(force=True)
+
+    result = measure(tick, iterations)
+    result['position_queries_per_tick'] = backend.position_queries / (iterations + 10)
+    result['seeks'] = positions.seeks
+    result['problems'] = []
+    if positions.seeks:
+        result['problems'].append(f'{positions.seeks} seeks detected while playing straight through')
+
+    # seeking is noticed by the next resync
+    player.position += 60
+    for _ in range(int(positions.resync_interval) + 1):
+        tick()
+    if not positions.seeks:
+        result['problems'].append('a seek went unnoticed')
+
+    return result
+
+
+def bench_scrobbler_checks(iterations: int, poll_plan: bool) -> Result:
+    """A refresh with every supported player running, resolving the scrobblers of each of them."""
+    backend = FakeBackend(installed=[*PlayerApp, *ScrobbleApp],
+                          players=[FakePlayer(app, state='paused') for app in PlayerApp],
+                          scrobblers=list(ScrobbleApp))
+    backend.player(PlayerApp.iTunes).state = 'playing'
+
+    with tempfile.TemporaryDirectory() as tmp:
+        plist_path = os.path.join(tmp, 'com.swinsian.Swinsian.plist')
+        with open(plist_path, 'wb') as f:
+            plistlib.dump({'LastFMConfigured': True}, f)
+
+        resolver = ScrobblerResolver(scrobble_enabled=lambda: True, swinsian_plist=plist_path)
+        pipeline = make_pipeline(backend, poll_plan, resolver=resolver)
+        player = backend.player(PlayerApp.iTunes)
+
+        def tick():
+            player.position = (player.position + 1) % player.duration
+            pipeline.refresh(force=True)
+
+        calls = backend.calls_by_query['apps_running']
+        result = measure(tick, iterations)
+
+    ticks = iterations + 10
+    result['scrobbler_checks_per_tick'] = resolver.checks / ticks
+    result['running_calls_per_tick'] = (backend.calls_by_query['apps_running'] - calls) / ticks
+    result['plist_reads'] = resolver.plists.reads
+    result['problems'] = []
+    if resolver.checks > ticks:
+        result['problems'].append(f'scrobblers were checked {resolver.checks / ticks:.1f} times per refresh')
+    if resolver.plists.reads > 1:
+        result['problems'].append(f'the unchanged Swinsian preferences were read {resolver.plists.reads} times')
+
+    return result
+
+
+def bench_hung_player(iterations: int, poll_plan: bool) -> Result:
+    """A refresh while Spotify is running but hung, its scripts timing out after 20ms."""
+    backend = make_backend()
+    backend.player(PlayerApp.Spotify).hung = True
+    pipeline = make_pipeline(backend, poll_plan)
+
+    result = measure(lambda: pipeline.refresh(force=True), iterations, warmup=2)
+    # a closed breaker would wait on the hung player every refresh
+    result['timeouts'] = backend.timeouts
+    result['problems'] = []
+    if backend.timeouts > resilience.failure_threshold:
+        result['problems'].append(f'the hung player was waited on {backend.timeouts} times, '
+                                  f'instead of being skipped by its breaker')
+
+    return result
+
+
+def bench_failed_queries() -> Result:
+    """A single failure of a control, the poll or the running apps, none of which may be skipped afterwards."""
+    backend = make_backend()
+    pipeline = make_pipeline(backend)
+    player = backend.player(PlayerApp.iTunes)
+    result: Result = {'checks': 0, 'problems': []}
+
+    def check(kind: str, action: Callable[[], Any], done: Callable[[], bool]) -> None:
+        backend.fail_next.add(kind)
+        action()
+        action()
+        result['checks'] += 1
+        if not done():
+            result['problems'].append(f'{kind} was skipped after failing once')
+
+    check('play', lambda: pipeline.mb.get_snapshot(max_age=0).player.play(),
+          lambda: player.controls == ['play'])
+    check('poll', lambda: pipeline.refresh(force=True), lambda: pipeline.mb.get_snapshot().player is not None)
+    pipeline.mb.poll_plan = False
+    check('apps_running', lambda: pipeline.refresh(force=True),
+          lambda: pipeline.mb.get_snapshot().player is not None)
+
+    return result
+
+
+def bench_worker(iterations: int) -> Result:
+    """A refresh with the scripts run by a worker, over the framed protocol on a pipe."""
+    backend = make_backend()
+    worker = WorkerBackend(LoopbackWorker(backend))
+    pipeline = make_pipeline(backend)
+    set_backend(worker)
+
+    result = measure(lambda: pipeline.refresh(force=True), iterations)
+    worker.close()
+
+    return result
+
+
+def bench_worker_hung_player(iterations: int, margin: float = 0.05) -> Result:
+    """A refresh with the scripts run by a worker, while Spotify hangs for as long as a poll gives each player.
+
+    Neither a refresh nor a control of the hung player may keep the menu bar waiting
+    for much longer than UI_DEADLINE."""
+    backend = make_backend()
+    backend.player(PlayerApp.Spotify).hung = True
+    backend.hang = POLL_TIMEOUT
+    worker = WorkerBackend(LoopbackWorker(backend))
+    pipeline = make_pipeline(backend)
+    set_backend(worker)
+    problems = []
+
+    # pausing the hung player gives up on it, while the worker carries on waiting for it
+    start = time.perf_counter()
+    run(PlayerApp.Spotify.value, 'pause')
+    control = time.perf_counter() - start
+    if control > UI_DEADLINE + margin:
+        problems.append(f'pausing the hung player blocked for {control * 1000:.0f}ms, '
+                        f'over the UI deadline of {UI_DEADLINE * 1000:.0f}ms')
+    if not resilience.breaker(PlayerApp.Spotify.value).failures:
+        problems.append('the unanswered control did not count towards the breaker of the hung player')
+
+    answered = False
+    missing = 0
+
+    def tick():
+        nonlocal answered, missing
+        pipeline.refresh(force=True)
+        player = pipeline.mb.get_snapshot(max_age=float('inf')).player
+        if player is not None and player.app == PlayerApp.iTunes:
+            answered = True
+        elif answered:
+            missing += 1
+
+    # every refresh counts, the first ones are the ones whose poll waits on the hung player
+    result = measure(tick, iterations, warmup=0)
+    result['control_us'] = control * 1e6
+    result['timeouts'] = backend.timeouts
+    result['problems'] = problems
+    if result['p95_us'] > (UI_DEADLINE + margin) * 1e6:
+        problems.append(f'a refresh blocked for {result["p95_us"] / 1000:.0f}ms, '
+                        f'over the UI deadline of {UI_DEADLINE * 1000:.0f}ms')
+    if not answered:
+        problems.append(f'the playing iTunes track was not shown by any of {iterations} refreshes')
+    if missing:
+        problems.append(f'the playing iTunes track went missing from {missing} of {iterations} refreshes')
+    # the control and the polls until the breaker opened
+    if backend.timeouts > resilience.failure_threshold + 1:
+        problems.append(f'the hung player was waited on {backend.timeouts} times, '
+                        f'instead of being skipped by its breaker')
+    worker.close()
+
+    return result
+
+
+def bench_worker_hang(iterations: int, deadline: float = 0.02) -> Result:
+    """A script which hangs the worker, which should neither block for long nor go unnoticed."""
+    backend = make_backend()
+    backend.player(PlayerApp.Spotify).hung = True
+    backend.hang = 0.2
+    worker = WorkerBackend(LoopbackWorker(backend), deadline=deadline, restart_after=deadline * 2)
+    set_backend(worker)
+    resilience.reset()
+
+    def hang():
+        try:
+            execute(PlayerApp.Spotify.value, 'player state as string', lambda: '')
+        except ScriptFailed:
+            pass
+        # the breaker would otherwise stop sending the hung scripts after a few tries
+        resilience.reset()
+
+    result = measure(hang, iterations, warmup=2)
+    result['restarts'] = worker.restarts
+    result['problems'] = []
+    if result['p95_us'] > deadline * 2 * 1e6:
+        result['problems'].append(f'a hung worker blocked for {result["p95_us"] / 1000:.1f}ms, '
+                                  f'over twice the deadline of {deadline * 1000:.0f}ms')
+    if not worker.restarts:
+        result['problems'].append('a hung worker was never restarted')
+    worker.close()
+
+    return result
+
+
+def bench_worker_start_failure(iterations: int) -> Result:
+    """Scripts sent to a worker process which exits right after starting, e.g. as it cannot import musicbar."""
+    backend = make_backend()
+    worker = WorkerBackend(SubprocessWorker([sys.executable, '-c', 'pass']), fallback=lambda: backend,
+                           backoff=0.0)
+    set_backend(worker)
+    resilience.reset()
+    failed = 0
+
+    def call():
+        nonlocal failed
+        try:
+            execute(PlayerApp.iTunes.value, 'player state as string', lambda: '')
+        except ScriptFailed:
+            failed += 1
+
+    result = measure(call, iterations, warmup=0)
+    result['failed_calls'] = failed
+    result['problems'] = []
+    if not worker.fell_back:
+        result['problems'].append(f'scripts were still sent to a worker which failed to start '
+                                  f'{worker.start_failures} times')
+    if failed > worker.max_start_failures:
+        result['problems'].append(f'{failed} of {iterations} scripts failed, instead of running in-process')
+    worker.close()
+
+    return result
+
+
+def bench_track_change(iterations: int) -> Result:
+    """A refresh which sees a new track, updating now playing and recording the finished play."""
+    backend = make_backend()
+    lastfm = FakeLastFm()
+    pipeline = make_pipeline(backend, lastfm=lastfm)
+    player = backend.player(PlayerApp.iTunes)
+    tracks = [(f'Title {idx}', 'Artist', f'Album {idx % 10}') for idx in range(iterations + 10)]
+    # listened time is measured with the clock, which has to move along with the position
+    clock = [0.0]
+    pipeline.engine.clock = lambda: clock[0]
+
+    calls = 0
+
+    def listen():
+        # the previous track was played for long enough to be scrobbled
+        clock[0] += 200
+        player.position = 200
+        pipeline.refresh(force=True)
+
+    def tick():
+        nonlocal calls
+        player.track = tracks.pop()
+        clock[0] += 1
+        player.position = 0
+        before = backend.calls
+        pipeline.refresh(force=True)
+        calls += backend.calls - before
+
+    result = measure(tick, iterations, setup=listen)
+    result['script_calls_per_tick'] = calls / (iterations + 10)
+    result['scrobbles'] = len(lastfm.scrobbles)
+
+    return result
+
+
+def bench_player_events(iterations: int) -> Result:
+    """A refresh made for a track change reported by the player, rather than found by polling."""
+    backend = make_backend()
+    pipeline = make_pipeline(backend)
+    source = FakeEventSource([PlayerApp.iTunes])
+    titles: List[str] = []
+    pipeline.listen(source, titles.append)
+    player = backend.player(PlayerApp.iTunes)
+    names = [f'Track {idx}' for idx in range(iterations + 10)]
+    missed = 0
+
+    def change():
+        nonlocal missed
+        player.track = (names.pop(), 'Artist', 'Album')
+        source.track_changed(PlayerApp.iTunes, player.track)
+        if not titles or player.track[0] not in titles[-1]:
+            missed += 1
+
+    result = measure(change, iterations)
+    result['problems'] = []
+    if missed:
+        result['problems'].append(f'{missed} reported track changes were not shown right away')
+    if pipeline.scheduler.interval < pipeline.scheduler.pushed_interval:
+        result['problems'].append(f'a player which reports its changes is still polled every '
+                                  f'{pipeline.scheduler.interval:.0f}s')
+
+    player.state = 'paused'
+    source.state_changed(PlayerApp.iTunes, PlayerStatus.PAUSED)
+    if not titles[-1].startswith(Icons.paused):
+        result['problems'].append('a reported pause was not shown right away')
+
+    return result
+
+
+def bench_title_fit(iterations: int, cached: bool) -> Result:
+    """Fitting a long title into the menu bar, either seen before or never seen before."""
+    fitter = TitleFitter(FixedWidthMeasurer())
+    # alternate between two titles, so the memoised last fit is never reused
+    titles = [LONG_TITLE, f'{LONG_TITLE} II'] * (iterations // 2 + 6)
+
+    def fit():
+        if not cached:
+            # trimmed titles share most of their candidates, which would otherwise be cached
+            fitter.clear()
+        fitter.fit(Icons.playing, titles.pop(), LONG_ARTIST)
+
+    result = measure(fit, iterations)
+    result.update(fitter.stats())
+
+    return result
+
+
+class MenuModel(MenuBuilder):
+    """Builds the menu of MenuBar from fakes, with the UI callbacks doing nothing"""
+
+    def __init__(self, mb: MusicBar, directory: str):
+        self.mb = mb
+        self.lastfm = FakeLastFm()
+        self.settings = Settings(os.path.join(directory, 'settings.json'))
+        self.history = PlayHistory(os.path.join(directory, 'history.db'))
+        self.stats = ListeningStats(os.path.join(directory, 'history.db'))
+        self.scrobble = True
+        self.setup_menu()
+
+    def refresh(self, _=None, force: bool = False) -> None:
+        pass
+
+    def force_refresh(self, _) -> None:
+        pass
+
+    def login_lastfm(self, _) -> None:
+        pass
+
+    def dump_metrics(self, _) -> None:
+        pass
+
+    def quit_app(self, _) -> None:
+        pass
+
+
+def bench_menu_build(iterations: int, track_changes: bool) -> Result:
+    """Building the menu model and diffing it against the displayed menu."""
+    backend = make_backend()
+    set_backend(backend)
+    mb = MusicBar()
+    player = backend.player(PlayerApp.iTunes)
+    displayed: List[MenuEntry] = []
+    changes = 0
+
+    def build():
+        nonlocal displayed, changes
+        if track_changes:
+            player.track = (f'Title {time.perf_counter()}', 'Artist', 'Album')
+            # taken by the refresh which noticed the change, before the menu is opened
+            mb.get_snapshot(max_age=0)
+        entries = model.build_menu()
+        changes += len(diff_menu(displayed, entries))
+        displayed = entries
+
+    with tempfile.TemporaryDirectory() as directory:
+        model = MenuModel(mb, directory)
+        set_art_cache(AlbumArtCache(os.path.join(directory, 'art')))
+        result = measure(build, iterations)
+        set_art_cache(None)
+        model.history.close()
+        model.stats.close()
+    result['changes_per_build'] = changes / (iterations + 10)
+
+    return result
+
+
+def bench_art_cache(iterations: int) -> Result:
+    """Looking up the artwork of an album which has none, after asking the player for it once.
+
+    Also checks which artwork is evicted after a relaunch, and that tracks without
+    an album are given no artwork."""
+    backend = make_backend()
+    set_backend(backend)
+    resilience.reset()
+    extractions = 0
+
+    def no_artwork(_: str) -> str:
+        nonlocal extractions
+        extractions += 1
+        return ''
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = AlbumArtCache(directory)
+        result = measure(lambda: cache.fetch('Artist', 'Album', no_artwork), iterations)
+        result['problems'] = problems = []
+        if extractions != 1:
+            problems.append(f'an album without artwork was asked for it {extractions} times')
+
+        # a player which did not answer may still have artwork
+        cache.fetch('Artist', 'Other Album', lambda _: None)
+        if cache.fetch('Artist', 'Other Album', no_artwork) is not None or extractions != 2:
+            problems.append('a player which did not answer was remembered as having no artwork')
+
+        # tracks without an album would all share the artwork of the first one
+        set_art_cache(cache)
+        backend.player(PlayerApp.iTunes).track = ('Title', 'Artist', '')
+        player = MusicBar().get_snapshot(max_age=0).player
+        if player.get_album_cover() is not None or backend.calls_by_query['artwork']:
+            problems.append('artwork was extracted for a track without an album')
+        set_art_cache(None)
+
+    with tempfile.TemporaryDirectory() as directory:
+        def store(cache: AlbumArtCache, album: str) -> None:
+            src = os.path.join(directory, 'artwork.jpg')
+            with open(src, 'wb') as f:
+                f.write(b'\0' * 1024)
+            cache.store(art_key('Artist', album), src, '.jpg')
+
+        cache = AlbumArtCache(os.path.join(directory, 'art'), max_bytes=2048)
+        store(cache, 'Old')
+        store(cache, 'New')
+        cache.lookup('Artist', 'Old')
+        # relaunched, with the album looked up last kept over the one stored last
+        cache = AlbumArtCache(os.path.join(directory, 'art'), max_bytes=2048)
+        store(cache, 'Newest')
+        if cache.lookup('Artist', 'Old') is None or cache.lookup('Artist', 'New') is not None:
+            problems.append('the recency of a lookup was lost after a relaunch')
+
+    return result
+
+
+def bench_stats_total(iterations: int, artists: int = 2000) -> Result:
+    """Reading the plays and listening time of all time, after plays by many different artists."""
+    with tempfile.TemporaryDirectory() as directory:
+        history = PlayHistory(os.path.join(directory, 'history.db'))
+        stats = ListeningStats(os.path.join(directory, 'history.db'))
+        now = int(time.time())
+        for idx in range(artists):
+            track = Track(f'Title {idx}', f'Artist {idx}', '' if idx % 2 else f'Album {idx}', 240)
+            stats.add(history.record(track, now - idx, 200, True))
+
+        result = measure(lambda: stats.total(Period.ALL), iterations)
+        result['problems'] = problems = []
+        counted = stats.total(Period.ALL)
+        stats.rebuild()
+        if counted != (artists, artists * 200) or stats.total(Period.ALL) != counted:
+            problems.append(f'{counted[0]} plays were counted, {stats.total(Period.ALL)[0]} after a rebuild, '
+                            f'instead of {artists}')
+        history.close()
+        stats.close()
+
+    return result
+
+
+def bench_scrobble_decision(iterations: int) -> Result:
+    """Accounting for listened time and deciding whether to scrobble, on every refresh."""
+    engine = ScrobbleEngine()
+    track = Track('Title', 'Artist', 'Album', 240)
+    now = 0.0
+
+    def decide():
+        nonlocal now
+        now += 1
+        engine.observe(track, int(now) % 240, True, now)
+        engine.take_eligible()
+        engine.eligible_at()
+
+    return measure(decide, iterations)
+
+
+# plays of a track as (title, duration, segments of (position, seconds) played from, or None while
+# paused), and whether it should be scrobbled
+SCROBBLE_PLAYS: List[Tuple[str, int, List[Tuple[Optional[int], int]], bool]] = [
+    ('Whole', 200, [(0, 200)], True),
+    # too short to scrobble at all
+    ('Short', 25, [(0, 25)], False),
+    # 240 seconds suffice for long tracks
+    ('Long', 600, [(0, 600)], True),
+    ('Skipped', 300, [(0, 100)], False),
+    # seeked past most of it
+    ('Seeked Forward', 300, [(0, 60), (250, 50)], False),
+    # seeked back, listening to 180 seconds in total
+    ('Seeked Back', 300, [(0, 100), (40, 80)], True),
+    # paused for longer than it was played
+    ('Paused', 300, [(0, 100), (None, 120), (100, 40)], False),
+    # the same track twice in a row, then once more but skipped
+    ('Repeated', 100, [(0, 100)], True),
+    ('Repeated', 100, [(0, 100)], True),
+    ('Repeated', 100, [(0, 20)], False)
+]
+
+
+def simulate_scrobbles(interval: int) -> List[bool]:
+    """Play SCROBBLE_PLAYS, observing every given number of seconds and at the scheduled checks.
+
+    Returns:
+        List[bool] -- Whether each play was scrobbled
+    """
+    engine = ScrobbleEngine()
+    scrobbled: List[bool] = []
+    now = 0
+
+    def observe(track: Optional[Track], position: int, playing: bool) -> None:
+        finished = engine.observe(track, position, playing, now)
+        if finished is not None:
+            engine.take_eligible(finished)
+            scrobbled.append(finished.scrobbled)
+        engine.take_eligible()
+
+    for title, duration, segments, _ in SCROBBLE_PLAYS:
+        track = Track(title, 'Artist', 'Album', duration)
+        position = 0
+        for start, seconds in segments:
+            playing = start is not None
+            position = start if playing else position
+            for _ in range(seconds):
+                now += 1
+                position += playing
+                eligible_at = engine.eligible_at()
+                if now % interval == 0 or (eligible_at is not None and eligible_at <= now):
+                    observe(track, position, playing)
+        # the next track starts within the next observation
+        now += 1
+    observe(None, 0, False)
+
+    return scrobbled
+
+
+def bench_scrobble_low_rate() -> Result:
+    """Scrobbling a series of plays with pauses, seeks and repeats, observed every 1, 5 and 15 seconds."""
+    expected = [scrobble for _, _, _, scrobble in SCROBBLE_PLAYS]
+    result: Result = {'plays': len(expected), 'problems': []}
+    for interval in (1, 5, 15):
+        scrobbled = simulate_scrobbles(interval)
+        result[f'scrobbles_every_{interval}s'] = sum(scrobbled)
+        if scrobbled != expected:
+            result['problems'].append(f'observing every {interval}s scrobbled {scrobbled}, expected {expected}')
+
+    return result
+
+
+def bench_tick_allocations(iterations: int, budget: int = ALLOCATION_BUDGET) -> Result:
+    """Memory allocated by a refresh while the same track keeps playing, measured with tracemalloc."""
+    backend = make_backend()
+    clock = [0.0]
+    pipeline = make_pipeline(backend, positions=PositionTracker(clock=lambda: clock[0]))
+    player = backend.player(PlayerApp.iTunes)
+    player.duration = 100000
+
+    def tick():
+        # a second passes between refreshes, for the player and the tracker alike
+        clock[0] += 1
+        player.position += 1
+        pipeline.refresh(force=True)
+
+    for _ in range(10):
+        tick()
+
+    peaks = []
+    live = 0
+    rebuilt = 0
+    for _ in range(iterations):
+        previous = pipeline.mb.get_snapshot(max_age=float('inf')).player
+        # restarting clears the traces, so the peak only covers this refresh
+        tracemalloc.start()
+        tick()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peaks.append(peak)
+        live += current
+        rebuilt += pipeline.mb.get_snapshot(max_age=float('inf')).player is not previous
+
+    peaks.sort()
+    result = {
+        'iterations': iterations,
+        'median_peak_bytes': statistics.median(peaks),
+        'max_peak_bytes': peaks[-1],
+        'live_bytes_per_tick': live / iterations,
+        'players_rebuilt': rebuilt,
+        'problems': []
+    }
+    if result['median_peak_bytes'] > budget:
+        result['problems'].append(f'a steady-state refresh allocates {result["median_peak_bytes"]} bytes, '
+                                  f'over the budget of {budget} bytes')
+    if rebuilt:
+        result['problems'].append(f'the player was rebuilt on {rebuilt} of {iterations} refreshes '
+                                  'while the same track kept playing')
+
+    return result
+
+
+def bench_metrics(iterations: int) -> Result:
+    """Recording a script call, like every call made through utils.execute does."""
+    recorder = Metrics()
+
+    def record():
+        recorder.observe('script.player state as string', 0.001)
+        recorder.observe('player.com.apple.itunes', 0.001)
+
+    return measure(record, iterations)
+
+
+def bench_lastfm_calls(iterations: int, keep_alive: bool) -> Result:
+    """Alternating now playing and scrobble calls, the way a listening session sends them."""
+    track = Track('Title', 'Artist', 'Album', 240)
+    entries = [ScrobbleEntry(1, 'Artist', 'Title', 'Album', 1600000000, 240)]
+    # without any idle connections to reuse, every call opens a new one like urlopen did
+    transport = KeepAliveTransport(pool_size=2 if keep_alive else 0)
+
+    with StubLastFm() as server:
+        api = LastFmApi('session', api_url=server.url, transport=transport)
+        calls = [0]
+
+        def call():
+            if calls[0] % 2:
+                api.scrobble_many(entries)
+            else:
+                api.update_now_playing(track)
+            calls[0] += 1
+
+        result = measure(call, iterations, warmup=2)
+        transport.close()
+        result['connections_per_call'] = server.connections / calls[0]
+
+    result['problems'] = []
+    if keep_alive and server.connections > 1:
+        result['problems'].append(f'{server.connections} connections were opened for {calls[0]} calls, '
+                                  f'instead of a single kept-alive one')
+
+    return result
+
+
+def bench_lastfm_user_info(iterations: int) -> Result:
+    """Repeated reads of the same profile, which should be answered from the cache."""
+    transport = CachingTransport(KeepAliveTransport())
+
+    with StubLastFm() as server:
+        api = LastFmApi('session', api_url=server.url, transport=transport)
+        result = measure(lambda: api.user_info('user'), iterations, warmup=2)
+        transport.close()
+
+    result['cache_hits'] = transport.hits
+    result['problems'] = []
+    if server.requests != 1:
+        result['problems'].append(f'the unchanged user info was requested {server.requests} times')
+
+    return result
+
+
+def bench_import(module: str = CORE_MODULE) -> Result:
+    """Importing the core of MusicBar in a fresh interpreter.
+
+    rumps and PyObjC are stood in for where they are not installed, so the menu bar
+    itself is profiled on any platform."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    timings = profile_imports(module, setup=f'import sys\nsys.path.insert(0, {root!r})\n'
+                                            f'import benchmarks.uistubs\nbenchmarks.uistubs.install()')
+
+    return {
+        'module': module,
+        'total_ms': total_ms(timings, module),
+        'modules': len(timings),
+        'problems': check_budget(timings, module)
+    }
+
+
+def run_benchmarks(iterations: int) -> Dict[str, Result]:
+    benchmarks: List[Tuple[str, Callable[[], Result]]] = [
+        ('tick_poll_plan', lambda: bench_tick(iterations)),
+        ('tick_interpolated', lambda: bench_tick_interpolated(iterations)),
+        ('tick_per_player', lambda: bench_tick(iterations, poll_plan=False)),
+        ('tick_track_change', lambda: bench_track_change(iterations)),
+        ('tick_all_players', lambda: bench_scrobbler_checks(iterations, poll_plan=True)),
+        ('tick_all_players_per_player', lambda: bench_scrobbler_checks(iterations, poll_plan=False)),
+        ('tick_hung_player', lambda: bench_hung_player(min(iterations, 50), poll_plan=True)),
+        ('tick_hung_player_per_player', lambda: bench_hung_player(min(iterations, 50), poll_plan=False)),
+        ('failed_queries', bench_failed_queries),
+        ('tick_worker', lambda: bench_worker(iterations)),
+        ('worker_hang', lambda: bench_worker_hang(min(iterations, 20))),
+        ('worker_start_failure', lambda: bench_worker_start_failure(min(iterations, 20))),
+        ('tick_worker_hung_player', lambda: bench_worker_hung_player(min(iterations, 20))),
+        ('tick_allocations', lambda: bench_tick_allocations(iterations)),
+        ('player_events', lambda: bench_player_events(iterations)),
+        ('title_fit_long_cold', lambda: bench_title_fit(iterations, cached=False)),
+        ('title_fit_long_cached', lambda: bench_title_fit(iterations, cached=True)),
+        ('menu_build_unchanged', lambda: bench_menu_build(iterations, track_changes=False)),
+        ('menu_build_track_change', lambda: bench_menu_build(iterations, track_changes=True)),
+        ('art_cache_missing', lambda: bench_art_cache(iterations)),
+        ('stats_total', lambda: bench_stats_total(iterations)),
+        ('scrobble_decision', lambda: bench_scrobble_decision(iterations)),
+        ('scrobble_low_rate', bench_scrobble_low_rate),
+        ('metrics_record', lambda: bench_metrics(iterations)),
+        ('lastfm_calls_keep_alive', lambda: bench_lastfm_calls(min(iterations, 100), keep_alive=True)),
+        ('lastfm_calls_new_connection', lambda: bench_lastfm_calls(min(iterations, 100), keep_alive=False)),
+        ('lastfm_user_info', lambda: bench_lastfm_user_info(iterations)),
+        ('import', bench_import),
+        # imported at launch by the menu bar, which itself needs AppKit
+        ('import_lastfm', lambda: bench_import('musicbar.lastfm'))
+    ]
+
+    results = {}
+    for name, bench in benchmarks:
+        results[name] = bench()
+        print(f'{name:<28} {format_result(results[name])}')
+
+    set_backend(None)
+    return results
+
+
+def format_result(result: Result) -> str:
+    if 'median_us' in result:
+        return f'{result["median_us"]:>10.1f}us median {result["p95_us"]:>10.1f}us p95'
+    if 'median_peak_bytes' in result:
+        return f'{result["median_peak_bytes"]:>10.0f}B median peak {result["live_bytes_per_tick"]:>6.1f}B live'
+    if 'checks' in result:
+        return f'{result["checks"]:>10} checks'
+    if 'plays' in result:
+        return f'{result["scrobbles_every_15s"]:>10} of {result["plays"]} plays scrobbled, observing every 15s'
+
+    return f'{result["total_ms"]:>10.1f}ms'
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True,
+                              universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old: Dict[str, Result], new: Dict[str, Result]) -> None:
+    """Print how the median of every benchmark changed since an earlier run."""
+    print('\ncompared to the earlier run:')
+    for name, result in new.items():
+        # results without a timing, e.g. checks, have nothing to compare
+        key = next((key for key in ('median_us', 'median_peak_bytes', 'total_ms') if key in result), None)
+        if key is None or name not in old or key not in old[name]:
+            continue
+
+        ratio = result[key] / old[name][key] if old[name][key] else float('inf')
+        print(f'{name:<28} {old[name][key]:>10.1f} -> {result[key]:>10.1f} ({ratio:.2f}x)')
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-o', '--output', default='benchmark-results.json',
+                        help='file to write the results to (default: benchmark-results.json)')
+    parser.add_argument('-n', '--iterations', type=int, default=1000,
+                        help='timed iterations per benchmark (default: 1000)')
+    parser.add_argument('--compare', metavar='RESULTS',
+                        help='results of an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    results = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': int(time.time()),
+        'benchmarks': run_benchmarks(args.iterations)
+    }
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f)['benchmarks'], results['benchmarks'])
+
+    problems = [problem for result in results['benchmarks'].values()
+                for problem in result.get('problems', [])]
+    for problem in problems:
+        print('error: ', problem)
+
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers the Last.fm calls MusicBar makes, over keep-alive connections"""
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, which would wait on delayed acks like no real server does
+    disable_nagle_algorithm = True
+    server: 'StubLastFm'
+
+    def setup(self):
+        super().setup()
+        # stands in for the TCP and TLS handshakes of a real connection
+        time.sleep(self.server.handshake)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        self.answer(urllib.parse.urlsplit(self.path).query)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.answer(self.rfile.read(length).decode('utf-8'))
+
+    def answer(self, query: str):
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests += 1
+
+        params = dict(urllib.parse.parse_qsl(query))
+        body = json.dumps(self.server.response(params.get('method', ''), params)).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubLastFm(ThreadingHTTPServer):
+    """A local stand-in for the Last.fm API, counting the connections and requests it gets
+
+    Use as a context manager, which serves from a background thread on a free port."""
+    daemon_threads = True
+
+    def __init__(self, handshake: float = 0.005, latency: float = 0.001):
+        """Create a server.
+
+        Keyword Arguments:
+            handshake {float} -- Seconds each new connection takes to set up (default: {0.005})
+            latency {float} -- Seconds each request takes to answer (default: {0.001})
+        """
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.handshake = handshake
+        self.latency = latency
+        self.connections = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/2.0/'
+
+    def response(self, method: str, params: Dict[str, str]) -> Dict:
+        if method == 'track.scrobble':
+            return {'scrobbles': {'@attr': {'accepted': 1, 'ignored': 0}}}
+        if method == 'track.updateNowPlaying':
+            return {'nowplaying': {'track': {'#text': params.get('track', '')}}}
+        if method == 'user.getInfo':
+            return {'user': {'name': params.get('user', ''), 'playcount': '1234'}}
+
+        return {'error': 3, 'message': 'Invalid Method - No method with that name in this package'}
+
+    def __enter__(self) -> 'StubLastFm':
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,81 @@
+"""Stand-ins for rumps and the PyObjC frameworks, so musicbar.menubar can be imported without them
+
+Only enough for importing the menu bar, e.g. to profile its imports on a machine
+without macOS; nothing is ever displayed. Modules which are installed are left
+alone, so on macOS the real frameworks are profiled.
+"""
+import importlib.util
+import sys
+import types
+from typing import Any, Dict
+
+
+class _Object:
+    """Allocates and initializes like an Objective-C object, doing nothing else"""
+
+    @classmethod
+    def alloc(cls) -> '_Object':
+        return cls()
+
+    def init(self) -> '_Object':
+        return self
+
+    def __getattr__(self, name: str) -> Any:
+        # any other selector is accepted, and ignored
+        return lambda *args, **kwargs: None
+
+
+class _Font(_Object):
+    @classmethod
+    def menuFontOfSize_(cls, _size: float) -> '_Font':
+        return cls()
+
+
+class _App:
+    def __init__(self, name: str, title: str = None, icon: str = None, quit_button: Any = None):
+        self.name = name
+        self.title = title
+
+
+def _timer(_interval: float) -> Any:
+    return lambda func: func
+
+
+def _module(name: str, attributes: Dict[str, Any]) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    return module
+
+
+def _stubs() -> Dict[str, types.ModuleType]:
+    cocoa = {'NSAttributedString': _Object, 'NSMenu': _Object, 'NSMenuItem': _Object,
+             'NSFont': _Font, 'NSFontAttributeName': 'NSFont', 'NSObject': _Object,
+             'NSDistributedNotificationCenter': _Object, 'NSOperationQueue': _Object,
+             'NSLog': lambda *args: None}
+
+    return {
+        'rumps': _module('rumps', {'App': _App, 'MenuItem': _Object, 'timer': _timer,
+                                   'notification': lambda *args, **kwargs: None,
+                                   'quit_application': lambda *args: None}),
+        'AppKit': _module('AppKit', cocoa),
+        'Cocoa': _module('Cocoa', cocoa),
+        'Foundation': _module('Foundation', cocoa),
+        'PyObjCTools': _module('PyObjCTools', {'__path__': []}),
+        'PyObjCTools.Conversion': _module('PyObjCTools.Conversion', {
+            'propertyListFromPythonCollection': lambda collection, conversionHelper=None: collection})
+    }
+
+
+def _installed(name: str) -> bool:
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        # e.g. the parent package of a submodule is missing
+        return False
+
+
+def install() -> None:
+    """Put a stand-in in sys.modules for each of the UI modules which is not installed."""
+    for name, module in _stubs().items():
+        if name not in sys.modules and not _installed(name):
+            sys.modules[name] = module
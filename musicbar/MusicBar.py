@@ -1,24 +1,94 @@
-import os
-import plistlib
-import shelve
-from dataclasses import dataclass
-from enum import Enum, EnumMeta
-from typing import Any, Dict, List, Optional, Tuple
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+from dataclasses import dataclass, replace
+from enum import Enum
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
-from applescript import AppleScript, ScriptError, kMissingValue
+from .discovery import DiscoveryCache, InstalledApps, all_apps, split_installed
+from .enums import Icons, PlayerApp, PlayerStatus, ScrobbleApp, Track
+from .metrics import metrics
+from .position import PositionTracker
+from .resilience import DEADLINE_SLACK, POLL_TIMEOUT, SCRIPT_TIMEOUT, UI_DEADLINE, resilience
+from .resilience import TIMED_OUT as EVENT_TIMED_OUT
+from .scrobblers import ScrobblerResolver
+from .titles import format_title
+from .utils import (ScriptFailed, ScriptSkipped, apps_exist, apps_running, execute, extract_artwork, run,
+                    submit)
 
-from .enums import DATABASE, Icons, PlayerApp, PlayerStatus, ScrobbleApp, Track
-from .utils import apps_exist, apps_running, get_itunes_art, run
+# maximum age of a reused player snapshot, in seconds
+SNAPSHOT_TTL = 0.5
 
 
-@dataclass
+def track_queries(app: PlayerApp) -> Tuple[str, str, str]:
+    """Return the queries used to fetch the track name, artist and album of a player.
+
+    Arguments:
+        app {PlayerApp} -- The player to build the queries for
+
+    Returns:
+        Tuple[str, str, str] -- The track name, artist and album queries
+    """
+    if app == PlayerApp.Vox:
+        # Vox uses a different syntax for track and artist names
+        return 'track', 'artist', 'album'
+
+    return 'name of current track', 'artist of current track', 'album of current track'
+
+
+def parse_status(app_playing: Optional[str]) -> PlayerStatus:
+    """Convert the output of a players `player state` query into a PlayerStatus.
+
+    Arguments:
+        app_playing {Optional[str]} -- The player state, as a string
+
+    Returns:
+        PlayerStatus -- The corresponding status
+    """
+    if app_playing in ['paused', '0']:
+        return PlayerStatus.PAUSED
+    if app_playing in ['playing', '1']:
+        return PlayerStatus.PLAYING
+
+    return PlayerStatus.STOPPED
+
+
+def make_track(results: List[Any]) -> Track:
+    """Build a Track from the raw output of a track query.
+
+    Arguments:
+        results {List[Any]} -- The track name, artist, album, position and duration
+
+    Returns:
+        Track -- The corresponding track, without its position
+    """
+    results = [x if x is not None else '' for x in results]
+
+    return Track(title=results[0],
+                 artist=results[1],
+                 album=results[2],
+                 duration=int(results[4] or 0))
+
+
+def parse_position(results: List[Any]) -> int:
+    """Return the position, in seconds, from the raw output of a track query."""
+    return max(0, int(results[3] or 0))
+
+
+@dataclass(frozen=True)
 class Player:
     """A music player, including its status
 
-    Also includes whether it is scrobbling or not"""
+    Also includes whether it is scrobbling or not. Immutable, so a player which did
+    not change since the previous refresh is reused as is."""
+    __slots__ = ('app', 'status', 'scrobbling', 'track', 'polled')
+
     app: PlayerApp
     status: PlayerStatus
     scrobbling: bool
+    # set when the track was already fetched as part of a poll plan
+    track: Optional[Track]
+    polled: bool
 
     def get_track(self) -> Optional[Track]:
         """Return the currently playing track within the given Player.
@@ -26,39 +96,42 @@ class Player:
         Returns:
             Optional[Track] -- The currently playing track for the given Player
         """
-        try:
-            track_query = 'name of current track'
-            artist_query = 'artist of current track'
-            album_query = 'album of current track'
-
-            if self.app == PlayerApp.Vox:
-                # Vox uses a different syntax for track and artist names
-                track_query = 'track'
-                artist_query = 'artist'
-                album_query = 'album'
-
-            script = f'''
-                tell application id "{self.app.value}"
-                    set trackname to {track_query}
-                    set trackartist to {artist_query}
-                    set trackalbum to {album_query}
-                    set trackposition to player position
-                    set tracklength to duration of current track
-                    return {{trackname, trackartist, trackalbum, trackposition, tracklength}}
-                end tell
-            '''
+        if self.polled:
+            return self.track
+
+        return self.query_track()[0]
 
-            results = list(
-                map(lambda x: x if x != kMissingValue else '', AppleScript(script).run()))
+    def query_track(self) -> Tuple[Optional[Track], int]:
+        """Ask the player for its current track and position.
+
+        Returns:
+            Tuple[Optional[Track], int] -- The currently playing track, and its position in seconds
+        """
+        def source():
+            track_query, artist_query, album_query = track_queries(self.app)
+
+            return f'''
+                with timeout of {SCRIPT_TIMEOUT} seconds
+                    tell application id "{self.app.value}"
+                        set trackname to {track_query}
+                        set trackartist to {artist_query}
+                        set trackalbum to {album_query}
+                        set trackposition to player position
+                        set tracklength to duration of current track
+                        return {{trackname, trackartist, trackalbum, trackposition, tracklength}}
+                    end tell
+                end timeout
+            '''
 
-            return Track(title=results[0],
-                         artist=results[1],
-                         album=results[2],
-                         position=int(results[3]),
-                         duration=int(results[4]))
-        except ScriptError as error:
+        try:
+            results = execute(self.app.value, 'current track', source, skippable=True)
+        except ScriptSkipped:
+            return None, 0
+        except ScriptFailed as error:
             print('error: ', error)
-            return None
+            return None, 0
+
+        return make_track(results), parse_position(results)
 
     def get_title_data(self, music_icon: bool = False) -> Dict:
         """Return a dict of information useful for building a "now-playing" string.
@@ -101,13 +174,7 @@ class Player:
         """
         data = self.get_title_data(music_icon)
 
-        if data['title'] == '':
-            return f'{data["icons"]}', data['_track']
-
-        if data['artist'] == '':
-            return f'{data["icons"]}  {data["title"]}', data['_track']
-
-        return f'{data["icons"]}  {data["title"]} ー {data["artist"]}', data['_track']
+        return format_title(data['icons'], data['title'], data['artist']), data['_track']
 
     def open(self) -> None:
         """Open the given player."""
@@ -135,30 +202,298 @@ class Player:
         """Returns the path of the album art for the currently playing track.
         This is only supported by iTunes at this moment.
 
+        Artwork is cached on disk, so each album is only extracted from the player once.
+
         Returns:
-            Optional[str] -- The (temporary) path to the current album art
+            Optional[str] -- The (cached) path to the current album art
         """
-        res = None
-
         # only itunes supports grabbing art right now
-        if self.app == PlayerApp.iTunes:
-            res = get_itunes_art(self.app.value)
+        if self.app != PlayerApp.iTunes:
+            return None
+
+        # artwork is cached per album, every track without one would share the artwork of the first
+        track = self.get_track()
+        if not track or not track.album:
+            return None
+
+        # the artwork subsystem is only loaded once artwork is first shown
+        from .artcache import get_art_cache
+
+        album_artist = run(self.app.value, 'album artist of current track', skippable=True) or track.artist
+
+        return get_art_cache().fetch(album_artist, track.album,
+                                     lambda out_path: extract_artwork(self.app.value, out_path))
+
+
+@dataclass(frozen=True)
+class PlayerSnapshot:
+    """The foreground player, its track and scrobblers, captured at a single point in time
+
+    Shared by everything which reads the player state within one refresh, so the
+    players are queried once per refresh instead of once per consumer."""
+    __slots__ = ('player', 'track', 'position', 'scrobblers', 'captured_at')
+
+    player: Optional[Player]
+    track: Optional[Track]
+    # seconds into the track, kept apart from the track and player so both are reused while playing
+    position: int
+    scrobblers: Tuple[ScrobbleApp, ...]
+    # time.monotonic() at which the snapshot was taken
+    captured_at: float
+
+    @property
+    def status(self) -> PlayerStatus:
+        """The status of the captured player"""
+        return self.player.status if self.player else PlayerStatus.NOT_OPEN
+
+    @property
+    def age(self) -> float:
+        """Seconds since the snapshot was taken"""
+        return time.monotonic() - self.captured_at
+
+    def is_stale(self, max_age: float) -> bool:
+        """Return whether the snapshot is older than the given age, in seconds."""
+        return self.age > max_age
+
+
+@dataclass
+class PollResult:
+    """The state of every installed player and scrobbler, gathered in a single poll"""
+    running: Dict[Enum, bool]
+    states: Dict[PlayerApp, str]
+    tracks: Dict[PlayerApp, Optional[Track]]
+    # seconds into the track of every player with a track
+    positions: Dict[PlayerApp, int]
+
+
+class PollPlan:
+    """A single compiled script which polls every given player and scrobbler at once
+
+    Replaces the separate running, player state and track queries made per refresh
+    with one Apple Event round-trip. A poll which a backend runs elsewhere is only
+    waited on briefly, and picked up by a later run once it is answered."""
+
+    # player info is returned as {running, state, {name, artist, album, position, duration}}
+    # the track info is left empty when there is no current track, the state is
+    # TIMED_OUT when the player did not answer in time, and the position is -1
+    # unless it was asked for
+    PLAYER_TEMPLATE = '''
+        set playerInfo to {{false, "", {{}}}}
+        if application id "{app}" is running then
+            set item 1 of playerInfo to true
+            try
+                with timeout of {timeout} seconds
+                    tell application id "{app}"
+                        set item 2 of playerInfo to (player state as string)
+                        set trackInfo to {{{track_query}, {artist_query}, {album_query}, -1, duration of current track}}
+                        if item {index} of wantPositions then set item 4 of trackInfo to player position
+                    end tell
+                end timeout
+                set item 3 of playerInfo to trackInfo
+            on error number errNum
+                if errNum is -1712 then set item 2 of playerInfo to "{timed_out}"
+            end try
+        end if
+        set end of playerStates to playerInfo
+'''
+
+    TIMED_OUT = 'timed out'
+
+    def __init__(self, players: List[PlayerApp], scrobblers: List[ScrobbleApp],
+                 positions: Optional[PositionTracker] = None,
+                 on_late_answer: Callable[[], None] = lambda: None):
+        """Create a plan for the given apps.
+
+        Arguments:
+            players {List[PlayerApp]} -- The players to poll the state and track of
+            scrobblers {List[ScrobbleApp]} -- The scrobblers to poll the running state of
+
+        Keyword Arguments:
+            positions {Optional[PositionTracker]} -- Predicts positions, so they are only asked for when due (default: {None})
+            on_late_answer {Callable[[], None]} -- Called from any thread once a poll which run stopped waiting for is answered (default: {ignored})
+        """
+        self.players = list(players)
+        self.positions = positions
+        self.on_late_answer = on_late_answer
+        # every player may take up to its own timeout, one after the other
+        self.deadline = len(self.players) * POLL_TIMEOUT + DEADLINE_SLACK
+        # the poll in flight, the positions clock it was sent at, and whether a run stopped waiting for it
+        self._pending: Optional[Tuple[Future, float, bool]] = None
+        self._sent_at = 0.0
+        # players can double as scrobblers (e.g. Swinsian), their state is polled already
+        self.scrobblers = [app for app in scrobblers if app not in self.players]
+        # the raw track info and track of the previous poll, reused while the track info is unchanged
+        # apart from the position
+        self._tracks: Dict[PlayerApp, Tuple[List[Any], Track]] = {}
+
+    @property
+    def source(self) -> str:
+        """The AppleScript source of this poll plan"""
+        player_blocks = []
+        for index, app in enumerate(self.players, 1):
+            track_query, artist_query, album_query = track_queries(app)
+            player_blocks.append(self.PLAYER_TEMPLATE.format(
+                app=app.value,
+                index=index,
+                timeout=POLL_TIMEOUT,
+                timed_out=self.TIMED_OUT,
+                track_query=track_query,
+                artist_query=artist_query,
+                album_query=album_query))
+
+        return f'''
+    on run {{appList, wantPositions}}
+        set scrobblerStates to {{}}
+        repeat with a from 1 to length of appList
+            set appname to item a of appList
+            set end of scrobblerStates to (application id appname is running)
+        end repeat
+
+        set playerStates to {{}}
+        {"".join(player_blocks)}
+        return {{scrobblerStates, playerStates}}
+    end run
+'''
+
+    def run(self, wait: float = UI_DEADLINE) -> Optional[PollResult]:
+        """Poll every player and scrobbler in this plan.
+
+        Sends a poll unless one is in flight already, and waits for it briefly.
+
+        Keyword Arguments:
+            wait {float} -- Seconds to wait for a poll which the backend runs elsewhere (default: {UI_DEADLINE})
+
+        Raises:
+            ScriptFailed -- If the poll failed, or was not answered within the deadline of the plan
+
+        Returns:
+            Optional[PollResult] -- The running state of every app, as well as the state and track of every player, or None while the poll is not answered yet
+        """
+        if self._pending is None:
+            now = self.positions.clock() if self.positions is not None else 0.0
+            self._pending = (self._send(now), now, False)
+            self._sent_at = time.monotonic()
+
+        future, now, late = self._pending
+        try:
+            scrobbler_states, player_states = future.result(timeout=wait)
+        except FutureTimeout:
+            if time.monotonic() - self._sent_at > self.deadline:
+                # the next run sends a new poll, the worker restarts itself if it hangs
+                self._pending = None
+                raise ScriptFailed(f'no answer to the poll within {self.deadline}s', EVENT_TIMED_OUT) from None
+
+            if not late:
+                metrics.incr('poll.late')
+                self._pending = (future, now, True)
+                future.add_done_callback(lambda _: self.on_late_answer())
+            return None
+        except ScriptFailed:
+            self._pending = None
+            raise
+
+        self._pending = None
+        return self._parse(scrobbler_states, player_states, now)
+
+    def _send(self, now: float) -> Future:
+        # the compiled plan is cached for as long as the set of players stays the same
+        query = 'poll ' + ','.join(app.value for app in self.players)
+        want_positions = [self.positions is None or self.positions.needs_sync(app, now)
+                          for app in self.players]
+
+        return submit('', query, lambda: self.source, [app.value for app in self.scrobblers], want_positions)
+
+    def _parse(self, scrobbler_states: List[Any], player_states: List[Any], now: float) -> PollResult:
+        running: Dict[Enum, bool] = dict(zip(self.scrobblers, scrobbler_states))
+        states: Dict[PlayerApp, str] = {}
+        tracks: Dict[PlayerApp, Optional[Track]] = {}
+        positions: Dict[PlayerApp, int] = {}
 
-        return res
+        for app, (app_running, app_playing, track_info) in zip(self.players, player_states):
+            running[app] = bool(app_running)
+            states[app] = app_playing if app_playing is not None else ''
+            # each player in the plan counts towards its own circuit breaker
+            timed_out = app_playing == self.TIMED_OUT
+            resilience.record((app.value, 'poll'), EVENT_TIMED_OUT if timed_out else None, failed=timed_out)
+            if not track_info:
+                tracks[app] = None
+                if self.positions is not None:
+                    self.positions.forget(app)
+                continue
+
+            tracks[app] = track = self._track(app, track_info)
+            if self.positions is not None:
+                positions[app] = self._position(app, states[app], track, track_info[3], now)
+            else:
+                positions[app] = parse_position(track_info)
+
+        return PollResult(running, states, tracks, positions)
+
+    def _position(self, app: PlayerApp, state: str, track: Track, position: Any, now: float) -> int:
+        playing = parse_status(state) == PlayerStatus.PLAYING
+
+        if position is not None and position >= 0:
+            self.positions.sync(app, track.key, playing, position, track.duration, now)
+            return int(position)
+
+        return self.positions.estimate(app, track.key, playing, track.duration, now)
+
+    def _track(self, app: PlayerApp, track_info: List[Any]) -> Track:
+        previous = self._tracks.get(app)
+        if previous is not None and previous[0][:3] == track_info[:3] and previous[0][4] == track_info[4]:
+            return previous[1]
+
+        track = make_track(track_info)
+        self._tracks[app] = (track_info, track)
+
+        return track
 
 
 class MusicBar:
     """Interface to obtain information from music player apps and control them"""
 
-    def __init__(self):
-        self.players: List[PlayerApp] = self.get_installed_players()
-        self.scrobblers: List[ScrobbleApp] = self.get_installed_scrobblers()
+    def __init__(self, poll_plan: bool = True, discovery: Optional[DiscoveryCache] = None,
+                 positions: Optional[PositionTracker] = None,
+                 resolver: Optional[ScrobblerResolver] = None):
+        """Create the interface.
 
-    def _get_installed(self, apps: EnumMeta) -> List[Any]:
+        Keyword Arguments:
+            poll_plan {bool} -- Whether to poll every app with a single script call (default: {True})
+            discovery {Optional[DiscoveryCache]} -- Installed apps cached between launches, instead of asking Finder up front (default: {None})
+            positions {Optional[PositionTracker]} -- Predicts positions, so a poll plan only asks for them now and then (default: {None})
+            resolver {Optional[ScrobblerResolver]} -- Decides which running scrobblers are scrobbling (default: {None})
+        """
+        self.discovery = discovery
+        self.resolver = resolver or ScrobblerResolver()
+        self.positions = positions
+        installed = discovery.load() if discovery is not None else None
+        if installed is None and discovery is None:
+            installed = self.get_installed_apps()
+
+        # without a cached discovery, the installed apps are filled in by revalidate_installed
+        self.players: List[PlayerApp]
+        self.scrobblers: List[ScrobbleApp]
+        self.players, self.scrobblers = installed or ([], [])
+        # when enabled, each call to get_players makes a single script call
+        self.poll_plan: bool = poll_plan
+        self._plan: Optional[PollPlan] = None
+        # running state of every installed app, taken once per refresh
+        self._running: Optional[Dict[Enum, bool]] = None
+        self._snapshot: Optional[PlayerSnapshot] = None
+        # players from the most recent poll, reused while they stay the same
+        self._players: Dict[PlayerApp, Player] = {}
+        # positions from the most recent poll, which change without changing the players
+        self._positions: Dict[PlayerApp, int] = {}
+        # the most recent answered poll, shown again while a newer one is not answered yet
+        self._poll: Optional[PollResult] = None
+        # called from any thread once a poll is answered which a refresh stopped waiting for
+        self.on_late_poll: Callable[[], None] = lambda: None
+
+    def _get_installed(self, apps: Iterable[Enum]) -> List[Any]:
         installed = []
         appslist = list(apps)
 
-        exists = apps_exist.run([app.value for app in appslist])
+        exists = apps_exist([app.value for app in appslist])
         for idx, found in enumerate(exists):
             app = appslist[idx]
             if found:
@@ -168,12 +503,19 @@ class MusicBar:
 
     def _get_running(self, apps: List[Enum]) -> List[Tuple[Any, bool]]:
         running = []
-        batch_is_running = apps_running.run([app.value for app in apps])
+        batch_is_running = apps_running([app.value for app in apps])
         for idx, app in enumerate(apps):
             running.append((app, batch_is_running[idx]))
 
         return running
 
+    def _poll_running(self) -> Dict[Enum, bool]:
+        # players and scrobblers in a single call, shared by every player in this refresh
+        apps = [*self.players, *(app for app in self.scrobblers if app not in self.players)]
+        self._running = dict(self._get_running(apps))
+
+        return self._running
+
     def get_installed_players(self) -> List[PlayerApp]:
         """Return a list of currently installed music players.
 
@@ -190,95 +532,159 @@ class MusicBar:
         """
         return self._get_installed(ScrobbleApp)
 
+    def get_installed_apps(self) -> InstalledApps:
+        """Return the currently installed music players and scrobblers, with a single lookup.
+
+        Returns:
+            InstalledApps -- The currently installed music players and scrobblers
+        """
+        return split_installed(self._get_installed(all_apps()))
+
+    def revalidate_installed(self, on_change: Optional[Callable[[], None]] = None) -> None:
+        """Check the cached installed apps in the background, updating them if they changed.
+
+        Keyword Arguments:
+            on_change {Optional[Callable[[], None]]} -- Called from the background thread once the installed apps changed (default: {None})
+        """
+        if self.discovery is None:
+            return
+
+        def update(installed: InstalledApps) -> None:
+            if installed == (self.players, self.scrobblers):
+                return
+
+            self.players, self.scrobblers = installed
+            self.invalidate_snapshot()
+            if on_change is not None:
+                on_change()
+
+        self.discovery.revalidate_async(update)
+
+    def poll(self) -> Optional[PollResult]:
+        """Poll the state of every installed player and scrobbler with a single script.
+
+        A poll which is not answered right away is picked up by a later call, which
+        returns the previous answer until then.
+
+        Returns:
+            Optional[PollResult] -- The running state, player state and track of every installed app, or None if no poll was answered yet
+        """
+        # players which keep timing out are left out of the plan until their breaker lets a trial through
+        players = [app for app in self.players if resilience.allow((app.value, 'poll'))]
+
+        plan = self._plan
+        if plan is None or plan.players != players:
+            plan = self._plan = PollPlan(players, self.scrobblers, self.positions,
+                                         lambda: self.on_late_poll())
+
+        result = plan.run()
+        if result is not None:
+            self._poll = result
+
+        return self._poll
+
     def get_players(self) -> List[Player]:
         """Return a list of currently running music players.
 
-        Arguments:
-            apps {List[PlayerApp]} -- A list of music players to check
-
         Returns:
             List[Player] -- The currently running music players, given they are provided as input
         """
+        if self.poll_plan:
+            return self._get_polled_players()
+
+        try:
+            running = self._poll_running()
+        except ScriptFailed as error:
+            print('error: ', error)
+            self._running = None
+            return []
+
         players = []
+        for app in self.players:
+            if running[app]:
+                status = parse_status(run(app.value, 'player state as string', skippable=True))
+                scrobblers = self.get_player_scrobblers(app, running)
+                players.append(Player(app, status, bool(scrobblers), track=None, polled=False))
 
-        running = self._get_running(self.players)
-        for app, app_state in running:
-            if app_state:
-                app_playing = run(app.value, 'player state as string')
-                if app_playing in ['paused', '0']:
-                    status = PlayerStatus.PAUSED
-                elif app_playing in ['playing', '1']:
-                    status = PlayerStatus.PLAYING
-                else:
-                    status = PlayerStatus.STOPPED
+        return players
 
-                scrobblers = self.get_player_scrobblers(app)
-                players.append(Player(app, status, bool(scrobblers)))
+    def _get_polled_players(self) -> List[Player]:
+        try:
+            result = self.poll()
+        except ScriptFailed as error:
+            print('error: ', error)
+            self._running = None
+            self._poll = None
+            return []
+
+        if result is None:
+            # the first poll is not answered yet
+            self._running = None
+            return []
+
+        self._running = result.running
+        self._positions = result.positions
+        players = []
+        for app in self.players:
+            if result.running.get(app):
+                scrobbling = bool(self.get_player_scrobblers(app, result.running))
+                status = parse_status(result.states[app])
+                track = result.tracks[app]
+
+                player = self._players.get(app)
+                if player is None or player.status != status or player.scrobbling != scrobbling \
+                        or player.track is not track:
+                    player = self._players[app] = Player(app, status, scrobbling, track, polled=True)
+                players.append(player)
 
         return players
 
-    def get_running_scrobblers(self, apps):
-        scrobblers = []
-
-        running = self._get_running(apps)
-        for app, app_state in running:
-            add = False
-
-            if app_state:
-                if app == ScrobbleApp.MusicBar:
-                    with shelve.open(DATABASE) as shelf:
-                        # exclude MusicBar if scrobbling is not enabled
-                        add = shelf.get('scrobble', False)
-                elif app == PlayerApp.Swinsian:
-                    # check if swinsian has lastfm configured
-                    plist_path = os.path.expanduser(
-                        '~/Library/Preferences/com.swinsian.Swinsian.plist')
-                    if os.path.exists(plist_path):
-                        try:
-                            with open(plist_path, 'rb') as f:
-                                plist = plistlib.load(f)
-                                add = plist.get('LastFMConfigured', False)
-                        except (IOError, FileNotFoundError):
-                            pass
-                else:
-                    add = True
-
-                if add:
-                    scrobblers.append(app)
-
-        return scrobblers
+    def get_running_scrobblers(self, apps: List[Enum],
+                               running: Optional[Dict[Enum, bool]] = None) -> List[Enum]:
+        """Return the given apps which are running and scrobbling.
+
+        Arguments:
+            apps {List[Enum]} -- The scrobblers to check
+
+        Keyword Arguments:
+            running {Optional[Dict[Enum, bool]]} -- Running state of apps, from the current refresh by default (default: {None})
+
+        Returns:
+            List[Enum] -- The given apps which are scrobbling
+        """
+        active = self.resolver.active(self._running_apps(running))
+        return [app for app in apps if app in active]
 
     def get_scrobblers(self) -> List[ScrobbleApp]:
         """Return a list of currently running scrobblers.
 
-        Arguments:
-            apps {List[ScrobbleApp]} -- A list of scrobblers to check
-
         Returns:
-            List[Player] -- The currently running scrobblers, given they are provided as input
+            List[ScrobbleApp] -- The installed scrobblers which are running and scrobbling
         """
         return self.get_running_scrobblers(self.scrobblers)
 
-    def get_player_scrobblers(self, player: PlayerApp) -> List[Optional[ScrobbleApp]]:
+    def get_player_scrobblers(self, player: PlayerApp,
+                              running: Optional[Dict[Enum, bool]] = None) -> List[Enum]:
         """Return a list of running scrobblers for the given Player.
 
         Arguments:
-            player {PlayerApp} -- [description]
+            player {PlayerApp} -- The player to find scrobblers for
+
+        Keyword Arguments:
+            running {Optional[Dict[Enum, bool]]} -- Running state of apps, from the current refresh by default (default: {None})
 
         Returns:
-            List[Optional[ScrobbleApp]] -- [description]
+            List[Enum] -- The running scrobblers which can scrobble the player, in order of preference
         """
-        possible = {
-            PlayerApp.iTunes: [ScrobbleApp.MusicBar, ScrobbleApp.NepTunes, ScrobbleApp.LastFM, ScrobbleApp.Bowtie],
-            PlayerApp.Spotify: [ScrobbleApp.MusicBar, ScrobbleApp.NepTunes, ScrobbleApp.LastFM, ScrobbleApp.Bowtie],
-            PlayerApp.Vox: [ScrobbleApp.MusicBar, ScrobbleApp.LastFM],
-            PlayerApp.Swinsian: [ScrobbleApp.MusicBar, PlayerApp.Swinsian],
-            PlayerApp.Music: [ScrobbleApp.MusicBar]
-        }
+        return self.resolver.for_player(player, self._running_apps(running))
+
+    def _running_apps(self, running: Optional[Dict[Enum, bool]]) -> Dict[Enum, bool]:
+        if running is not None:
+            return running
+        if self._running is not None:
+            return self._running
 
-        compatible = possible.get(player, [])
-        running = self.get_running_scrobblers(compatible)
-        return list(filter(lambda app: app in running, compatible))
+        return self._poll_running()
 
     def _get_active_player(self) -> Optional[Player]:
         """Return the current foreground music player.
@@ -326,15 +732,42 @@ class MusicBar:
 
         return player.get_track()
 
+    def get_snapshot(self, max_age: float = SNAPSHOT_TTL) -> PlayerSnapshot:
+        """Return a snapshot of the current foreground music player.
 
-if __name__ == "__main__":
-    # run test of app
-    import cProfile
+        The previous snapshot is reused while it is younger than max_age.
+
+        Keyword Arguments:
+            max_age {float} -- Maximum age, in seconds, of a reused snapshot (default: {SNAPSHOT_TTL})
+
+        Returns:
+            PlayerSnapshot -- The foreground player, its track and its running scrobblers
+        """
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.is_stale(max_age):
+            snapshot = self._snapshot = self._take_snapshot()
+
+        return snapshot
+
+    def invalidate_snapshot(self) -> None:
+        """Discard the current snapshot, e.g. after controlling a player."""
+        self._snapshot = None
+
+    def _take_snapshot(self) -> PlayerSnapshot:
+        player = self._get_active_player()
+        if not player:
+            return PlayerSnapshot(None, None, 0, (), time.monotonic())
+
+        scrobblers: Tuple[ScrobbleApp, ...] = ()
+        if player.scrobbling:
+            # resolved from the running apps of this refresh already
+            scrobblers = tuple(self.get_player_scrobblers(player.app))
+
+        # the captured player carries its track, so consumers never query it again
+        if player.polled:
+            track, position = player.track, self._positions.get(player.app, 0)
+        else:
+            track, position = player.query_track()
+            player = replace(player, track=track, polled=True)
 
-    # pr = cProfile.Profile()
-    # pr.enable()
-    mb = MusicBar()
-    print(mb.get_installed_players())
-    print(mb.get_active_player())
-    # pr.disable()
-    # pr.print_stats(sort='cumtime')
+        return PlayerSnapshot(player, track, position, scrobblers, time.monotonic())
@@ -0,0 +1,246 @@
+import glob
+import hashlib
+import json
+import os
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from .enums import dirs
+
+ART_CACHE_DIR = os.path.join(dirs.user_cache_dir, 'artwork')
+ART_CACHE_BYTES = 50 * 1024 * 1024
+INDEX_FILE = 'index.json'
+# seconds an album without artwork is not asked for its artwork again
+MISSING_TTL = 24 * 60 * 60
+
+
+def art_key(album_artist: str, album: str) -> str:
+    """Return the cache key of the artwork of an album.
+
+    Names are normalized first, so differences in case, unicode form and
+    whitespace do not result in separate copies of the same artwork.
+
+    Arguments:
+        album_artist {str} -- The album artist, or the track artist if there is none
+        album {str} -- The album name
+
+    Returns:
+        str -- Hex digest identifying the album
+    """
+    def normalize(text: str) -> str:
+        return ' '.join(unicodedata.normalize('NFKC', text or '').casefold().split())
+
+    name = f'{normalize(album_artist)}\0{normalize(album)}'
+    return hashlib.sha1(name.encode('utf-8')).hexdigest()
+
+
+class AlbumArtCache:
+    """On-disk cache of album artwork with an in-memory index
+
+    Files are evicted least recently used first once the cache grows beyond its
+    size cap. Albums without artwork are remembered for a while as well, so they
+    are not asked for it again on every lookup. The index is kept in memory and
+    persisted to an index file."""
+
+    def __init__(self, directory: str = ART_CACHE_DIR, max_bytes: int = ART_CACHE_BYTES,
+                 missing_ttl: float = MISSING_TTL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.missing_ttl = missing_ttl
+        self.hits = 0
+        self.misses = 0
+        # key -> {'file': file name, 'bytes': size}, least recently used first, or
+        # {'file': None, 'bytes': 0, 'missing_at': time.time()} for an album without artwork
+        self._index: 'OrderedDict[str, Dict]' = OrderedDict()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+
+    @property
+    def disk_usage(self) -> int:
+        """Total size of the cached artwork, in bytes"""
+        return sum(entry['bytes'] for entry in self._index.values())
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of lookups which were answered from the cache"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict:
+        """Return the hit rate and disk usage of the cache."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate,
+            'entries': len(self._index),
+            'bytes': self.disk_usage
+        }
+
+    def lookup(self, album_artist: str, album: str) -> Optional[str]:
+        """Return the path of the cached artwork for an album.
+
+        Arguments:
+            album_artist {str} -- The album artist, or the track artist if there is none
+            album {str} -- The album name
+
+        Returns:
+            Optional[str] -- Path to the artwork, or None if it is not cached
+        """
+        key = art_key(album_artist, album)
+        entry = self._index.get(key)
+        if entry is not None and entry['file'] is not None:
+            path = os.path.join(self.directory, entry['file'])
+            if os.path.isfile(path):
+                self.hits += 1
+                # the recency decides what is evicted after the next launch as well
+                if next(reversed(self._index)) != key:
+                    self._index.move_to_end(key)
+                    self._save()
+                return path
+
+            # removed from under us
+            del self._index[key]
+
+        self.misses += 1
+        return None
+
+    def fetch(self, album_artist: str, album: str,
+              extract: Callable[[str], Optional[str]]) -> Optional[str]:
+        """Return the path of the artwork for an album, extracting it on a cache miss.
+
+        Arguments:
+            album_artist {str} -- The album artist, or the track artist if there is none
+            album {str} -- The album name
+            extract {Callable[[str], Optional[str]]} -- Writes the artwork to the given path, returning the
+                extension it added, '' if there is no artwork, or None if it could not tell
+
+        Returns:
+            Optional[str] -- Path to the artwork, or None if there is no artwork
+        """
+        key = art_key(album_artist, album)
+        if self._missing(key):
+            self.hits += 1
+            return None
+
+        path = self.lookup(album_artist, album)
+        if path:
+            return path
+
+        tmp_path = os.path.join(self.directory, f'.{key}.{os.getpid()}.tmp')
+        try:
+            ext = extract(tmp_path)
+            if ext == '':
+                self._index[key] = {'file': None, 'bytes': 0, 'missing_at': time.time()}
+                self._save()
+            if not ext or not os.path.isfile(tmp_path + ext):
+                return None
+
+            return self.store(key, tmp_path + ext, ext)
+        finally:
+            # anything an extraction which failed or was cut off left behind
+            for leftover in glob.glob(glob.escape(tmp_path) + '*'):
+                try:
+                    os.remove(leftover)
+                except OSError:
+                    pass
+
+    def store(self, key: str, src: str, ext: str) -> str:
+        """Move a file into the cache under the given key.
+
+        Arguments:
+            key {str} -- Cache key, from art_key
+            src {str} -- Path of the file to move into the cache
+            ext {str} -- Extension of the file, including the leading dot
+
+        Returns:
+            str -- Path of the cached file
+        """
+        if key in self._index:
+            self._delete(key)
+
+        file_name = key + ext
+        path = os.path.join(self.directory, file_name)
+        os.replace(src, path)
+
+        self._index[key] = {'file': file_name, 'bytes': os.path.getsize(path)}
+        self._evict()
+        self._save()
+
+        return path
+
+    def clear(self) -> None:
+        """Remove all cached artwork."""
+        for key in list(self._index):
+            self._delete(key)
+        self._save()
+
+    def _evict(self) -> None:
+        total = self.disk_usage
+        # the most recently stored entry is kept, even if it alone is over the cap
+        while total > self.max_bytes and len(self._index) > 1:
+            key = next(iter(self._index))
+            total -= self._index[key]['bytes']
+            self._delete(key)
+
+    def _missing(self, key: str) -> bool:
+        entry = self._index.get(key)
+        if entry is None or entry['file'] is not None:
+            return False
+        if time.time() - entry['missing_at'] < self.missing_ttl:
+            return True
+
+        # the album may have been given artwork since
+        del self._index[key]
+        return False
+
+    def _delete(self, key: str) -> None:
+        entry = self._index.pop(key)
+        if entry['file'] is None:
+            return
+
+        try:
+            os.remove(os.path.join(self.directory, entry['file']))
+        except FileNotFoundError:
+            pass
+
+    def _load(self) -> None:
+        try:
+            with open(os.path.join(self.directory, INDEX_FILE)) as f:
+                entries = json.load(f)
+        except (IOError, ValueError):
+            return
+
+        for key, entry in entries:
+            if entry['file'] is None:
+                if time.time() - entry['missing_at'] < self.missing_ttl:
+                    self._index[key] = entry
+            elif os.path.isfile(os.path.join(self.directory, entry['file'])):
+                self._index[key] = entry
+
+    def _save(self) -> None:
+        path = os.path.join(self.directory, INDEX_FILE)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(list(self._index.items()), f)
+        os.replace(tmp_path, path)
+
+
+_art_cache: Optional[AlbumArtCache] = None
+
+
+def get_art_cache() -> AlbumArtCache:
+    """Return the process-wide album art cache, creating it on first use."""
+    global _art_cache
+    if _art_cache is None:
+        _art_cache = AlbumArtCache()
+
+    return _art_cache
+
+
+def set_art_cache(art_cache: Optional[AlbumArtCache]) -> None:
+    """Keep album art in the given cache, or in the default one again if it is None."""
+    global _art_cache
+    _art_cache = art_cache
@@ -0,0 +1,174 @@
+import json
+import os
+import subprocess
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+from .enums import PlayerApp, ScrobbleApp, dirs
+
+DISCOVERY_FILE = os.path.join(dirs.user_data_dir, 'discovery.json')
+
+# installing or removing an app changes the modification time of its folder
+APPLICATION_DIRS = ['/Applications', '/System/Applications', os.path.expanduser('~/Applications')]
+
+# how long a discovery with an unchanged stamp is trusted for, in seconds
+DISCOVERY_MAX_AGE = 7 * 24 * 60 * 60
+
+# same as utils.APPS_EXIST, but runnable with osascript, which passes arguments as strings
+APPS_EXIST_ARGV = '''
+    on run argv
+        set found to {}
+        repeat with appname in argv
+            try
+                tell application "Finder" to get application file id (appname as text)
+                set end of found to "1"
+            on error
+                set end of found to "0"
+            end try
+        end repeat
+
+        set AppleScript's text item delimiters to ","
+        return found as text
+    end run
+'''
+
+InstalledApps = Tuple[List[PlayerApp], List[ScrobbleApp]]
+
+
+def all_apps() -> List:
+    """Return every supported player and scrobbler."""
+    return [*PlayerApp, *ScrobbleApp]
+
+
+def validity_stamp() -> List:
+    """Return a stamp which changes whenever the set of installed apps may have changed."""
+    stamp: List = [app.value for app in all_apps()]
+    for path in APPLICATION_DIRS:
+        try:
+            stamp.append(os.stat(path).st_mtime)
+        except FileNotFoundError:
+            stamp.append(None)
+
+    return stamp
+
+
+def split_installed(apps: List) -> InstalledApps:
+    """Split a list of installed apps into the installed players and scrobblers."""
+    return ([app for app in apps if isinstance(app, PlayerApp)],
+            [app for app in apps if isinstance(app, ScrobbleApp)])
+
+
+def find_installed() -> List:
+    """Ask Finder which players and scrobblers are installed, with a single lookup.
+
+    Runs in a separate osascript process, so it is safe to call off the main thread.
+
+    Returns:
+        List -- The installed PlayerApp and ScrobbleApp members
+    """
+    apps = all_apps()
+    output = subprocess.run(['osascript', '-e', APPS_EXIST_ARGV, *[app.value for app in apps]],
+                            check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+    found = output.strip().split(',')
+    return [app for app, exists in zip(apps, found) if exists == '1']
+
+
+class DiscoveryCache:
+    """Remembers which players and scrobblers are installed between launches
+
+    The cached apps are used straight away at launch, and revalidated in the
+    background once the validity stamp changes or the discovery gets too old."""
+
+    def __init__(self, path: str = DISCOVERY_FILE, max_age: float = DISCOVERY_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+
+    def load(self) -> Optional[InstalledApps]:
+        """Return the cached installed players and scrobblers, or None if nothing is cached."""
+        data = self._read()
+        if data is None:
+            return None
+
+        apps = []
+        for value in data['installed']:
+            for enum in (PlayerApp, ScrobbleApp):
+                try:
+                    apps.append(enum(value))
+                except ValueError:
+                    continue
+
+        return split_installed(apps)
+
+    def is_valid(self) -> bool:
+        """Return whether the cached discovery can be trusted without asking Finder again."""
+        data = self._read()
+        if data is None:
+            return False
+
+        return data['stamp'] == validity_stamp() and \
+            time.time() - data['resolved_at'] < self.max_age
+
+    def save(self, apps: List) -> None:
+        """Cache the given installed apps."""
+        data = {
+            'stamp': validity_stamp(),
+            'resolved_at': time.time(),
+            'installed': [app.value for app in apps]
+        }
+
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def revalidate(self) -> Optional[InstalledApps]:
+        """Look the installed apps up again, unless the cached discovery is still valid.
+
+        Returns:
+            Optional[InstalledApps] -- The installed players and scrobblers, or None if the cache was valid
+        """
+        if self.is_valid():
+            return None
+
+        apps = find_installed()
+        self.save(apps)
+
+        return split_installed(apps)
+
+    def revalidate_async(self, on_change: Callable[[InstalledApps], None],
+                         delay: float = 2.0) -> threading.Timer:
+        """Revalidate in a background thread, after the given delay.
+
+        Arguments:
+            on_change {Callable[[InstalledApps], None]} -- Called with the installed apps, if they were looked up again
+
+        Keyword Arguments:
+            delay {float} -- Seconds to wait before revalidating, so it does not hold up launching (default: {2.0})
+
+        Returns:
+            threading.Timer -- The started background thread
+        """
+        def revalidate():
+            try:
+                installed = self.revalidate()
+            except (OSError, subprocess.CalledProcessError) as error:
+                print('error: unable to discover installed apps: ', error)
+                return
+
+            if installed is not None:
+                on_change(installed)
+
+        timer = threading.Timer(delay, revalidate)
+        timer.daemon = True
+        timer.start()
+
+        return timer
+
+    def _read(self) -> Optional[dict]:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
@@ -1,6 +1,7 @@
 import os
 from dataclasses import dataclass
 from enum import Enum, auto
+from typing import Optional, Tuple
 
 from appdirs import AppDirs
 
@@ -28,23 +29,36 @@ class Icons:
     play = '▶️'
 
 
-@dataclass
+@dataclass(frozen=True)
 class Track:
-    """A specific music track"""
+    """A specific music track
+
+    Immutable and slotted, as one is created on every refresh. The artist, title
+    and album identifying the track are combined into a key up front. The playback
+    position is not part of a track, so the same track is reused while it plays."""
+    __slots__ = ('title', 'artist', 'album', 'duration', '_key', '_hash')
+
     title: str
     artist: str
     album: str
-    position: int
     duration: int
 
-    def equals(self, track: 'Track'):
-        if track:
-            if track.artist == self.artist:
-                if track.title == self.title:
-                    if track.album == self.album:
-                        return True
+    def __post_init__(self):
+        key = (self.artist, self.title, self.album)
+        object.__setattr__(self, '_key', key)
+        object.__setattr__(self, '_hash', hash((key, self.duration)))
+
+    def __hash__(self):
+        return self._hash
+
+    @property
+    def key(self) -> Tuple[str, str, str]:
+        """The artist, title and album of the track"""
+        return self._key
 
-        return False
+    def equals(self, track: Optional['Track']) -> bool:
+        """Return whether the given track is the same track, by its artist, title and album."""
+        return track is not None and track._key == self._key
 
     def __str__(self):
         return f'{self.artist} - {self.title}'
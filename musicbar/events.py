@@ -0,0 +1,160 @@
+from dataclasses import dataclass
+from enum import Enum, auto
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .enums import PlayerApp, PlayerStatus
+from .MusicBar import parse_status
+
+
+class PlayerEventType(Enum):
+    """Kind of change a player has notified us about"""
+    TRACK_CHANGED = auto()
+    STATE_CHANGED = auto()
+
+
+@dataclass(frozen=True)
+class PlayerEvent:
+    """A change in playback reported by a player"""
+    type: PlayerEventType
+    app: PlayerApp
+    status: PlayerStatus
+
+
+PlayerListener = Callable[[PlayerEvent], None]
+
+
+class PlayerEventSource:
+    """Base class for sources of player events
+
+    Players which are not supported by a source have to be polled instead."""
+
+    def __init__(self):
+        self._listeners: List[PlayerListener] = []
+        # last known (track identity, status) for each player
+        self._last: Dict[PlayerApp, Tuple[Any, PlayerStatus]] = {}
+
+    def subscribe(self, listener: PlayerListener) -> None:
+        """Call the given listener for every event emitted by this source."""
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener: PlayerListener) -> None:
+        """Stop calling the given listener."""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def supports(self, app: PlayerApp) -> bool:
+        """Return whether the given player emits events through this source.
+
+        Arguments:
+            app {PlayerApp} -- The player to check
+
+        Returns:
+            bool -- True if the player does not need to be polled for changes
+        """
+        return False
+
+    def start(self) -> None:
+        """Start listening for events."""
+
+    def stop(self) -> None:
+        """Stop listening for events."""
+
+    def notify(self, app: PlayerApp, identity: Any, status: PlayerStatus) -> Optional[PlayerEvent]:
+        """Emit an event for a player reporting the given track identity and status.
+
+        Players commonly broadcast the same notification for any change, so the event
+        type is worked out by comparing against the last notification for the player.
+
+        Arguments:
+            app {PlayerApp} -- The player which reported a change
+            identity {Any} -- Identifies the reported track, e.g. its persistent ID
+            status {PlayerStatus} -- The reported playback status
+
+        Returns:
+            Optional[PlayerEvent] -- The emitted event, or None if nothing changed
+        """
+        previous = self._last.get(app)
+        self._last[app] = (identity, status)
+
+        if previous is None or previous[0] != identity:
+            event = PlayerEvent(PlayerEventType.TRACK_CHANGED, app, status)
+        elif previous[1] != status:
+            event = PlayerEvent(PlayerEventType.STATE_CHANGED, app, status)
+        else:
+            return None
+
+        for listener in list(self._listeners):
+            listener(event)
+
+        return event
+
+
+class FakeEventSource(PlayerEventSource):
+    """In-process event source, used to drive the event path without any players"""
+
+    def __init__(self, apps: Iterable[PlayerApp] = ()):
+        super().__init__()
+        self.apps = set(apps)
+
+    def supports(self, app: PlayerApp) -> bool:
+        return app in self.apps
+
+    def track_changed(self, app: PlayerApp, identity: Any,
+                      status: PlayerStatus = PlayerStatus.PLAYING) -> Optional[PlayerEvent]:
+        """Pretend the given player started playing a different track."""
+        return self.notify(app, identity, status)
+
+    def state_changed(self, app: PlayerApp, status: PlayerStatus) -> Optional[PlayerEvent]:
+        """Pretend the given player changed its playback status."""
+        identity = self._last.get(app, (None, None))[0]
+        return self.notify(app, identity, status)
+
+
+class DistributedNotificationSource(PlayerEventSource):
+    """Listens for the playback notifications players broadcast through the
+    distributed notification center"""
+
+    # notification name -> (player, status implied by the name, if any)
+    NOTIFICATIONS: Dict[str, Tuple[PlayerApp, Optional[PlayerStatus]]] = {
+        'com.apple.iTunes.playerInfo': (PlayerApp.iTunes, None),
+        'com.apple.Music.playerInfo': (PlayerApp.Music, None),
+        'com.spotify.client.PlaybackStateChanged': (PlayerApp.Spotify, None),
+        'com.swinsian.Swinsian-Track-Playing': (PlayerApp.Swinsian, PlayerStatus.PLAYING),
+        'com.swinsian.Swinsian-Track-Paused': (PlayerApp.Swinsian, PlayerStatus.PAUSED),
+        'com.swinsian.Swinsian-Track-Stopped': (PlayerApp.Swinsian, PlayerStatus.STOPPED),
+    }
+
+    def __init__(self):
+        super().__init__()
+        self._observers: List[Any] = []
+
+    def supports(self, app: PlayerApp) -> bool:
+        return any(player == app for player, _ in self.NOTIFICATIONS.values())
+
+    def start(self) -> None:
+        from Foundation import NSDistributedNotificationCenter, NSOperationQueue
+
+        center = NSDistributedNotificationCenter.defaultCenter()
+        for name in self.NOTIFICATIONS:
+            # delivered on the main queue, alongside the refresh timer
+            self._observers.append(center.addObserverForName_object_queue_usingBlock_(
+                name, None, NSOperationQueue.mainQueue(), self._notified))
+
+    def stop(self) -> None:
+        from Foundation import NSDistributedNotificationCenter
+
+        center = NSDistributedNotificationCenter.defaultCenter()
+        for observer in self._observers:
+            center.removeObserver_(observer)
+        self._observers = []
+
+    def _notified(self, notification: Any) -> None:
+        app, status = self.NOTIFICATIONS[notification.name()]
+        info = notification.userInfo() or {}
+
+        if status is None:
+            status = parse_status(str(info.get('Player State', '')).lower())
+
+        identity = info.get('Persistent ID') or info.get('Track ID') or \
+            (info.get('Name') or info.get('title'), info.get('Artist') or info.get('artist'))
+        self.notify(app, identity, status)
@@ -0,0 +1,131 @@
+import os
+import sqlite3
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, List, Optional
+
+from .enums import Track, dirs
+
+HISTORY_DB = os.path.join(dirs.user_data_dir, 'history.sqlite3')
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS plays (
+        id INTEGER PRIMARY KEY,
+        timestamp INTEGER NOT NULL,
+        artist TEXT NOT NULL,
+        title TEXT NOT NULL,
+        album TEXT NOT NULL,
+        duration INTEGER NOT NULL,
+        played INTEGER NOT NULL,
+        scrobbled INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS plays_timestamp ON plays (timestamp);
+    CREATE INDEX IF NOT EXISTS plays_artist ON plays (artist, timestamp);
+'''
+
+COLUMNS = 'timestamp, artist, title, album, duration, played, scrobbled'
+
+
+@dataclass(frozen=True)
+class Play:
+    """A track which was played, and whether it was scrobbled"""
+    # unix time at which the track started playing
+    timestamp: int
+    artist: str
+    title: str
+    album: str
+    duration: int
+    # seconds of the track which were played
+    played: int
+    scrobbled: bool
+
+    def __str__(self):
+        return f'{self.artist} - {self.title}'
+
+
+class PlayHistory:
+    """Persistent log of played tracks, kept in SQLite
+
+    The most recent scrobbles are also kept in a bounded ring in memory, so showing
+    them in the menu never touches the database."""
+
+    def __init__(self, path: str = HISTORY_DB, recent_size: int = 5):
+        """Open the log, creating it if needed.
+
+        Keyword Arguments:
+            path {str} -- The database file (default: {HISTORY_DB})
+            recent_size {int} -- Number of recent scrobbles kept in memory (default: {5})
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # readers never block the writer, and a crash loses at most the last few plays
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+
+        self.recent: Deque[Play] = deque(maxlen=recent_size)
+        rows = self._db.execute(f'SELECT {COLUMNS} FROM plays WHERE scrobbled '
+                                'ORDER BY timestamp DESC LIMIT ?', (recent_size,))
+        self.recent.extend(reversed([self._play(row) for row in rows]))
+
+    def record(self, track: Track, timestamp: int, played: int, scrobbled: bool) -> Play:
+        """Log a play of the given track.
+
+        Arguments:
+            track {Track} -- The track
+            timestamp {int} -- Unix time at which the track started playing
+            played {int} -- Seconds the track was listened to
+            scrobbled {bool} -- Whether the play was scrobbled
+
+        Returns:
+            Play -- The logged play
+        """
+        play = Play(timestamp, track.artist, track.title, track.album, track.duration,
+                    played, scrobbled)
+        with self._lock, self._db:
+            self._db.execute(f'INSERT INTO plays ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (play.timestamp, play.artist, play.title, play.album,
+                              play.duration, play.played, int(play.scrobbled)))
+
+        if scrobbled:
+            self.recent.append(play)
+
+        return play
+
+    def recent_scrobbles(self) -> List[Play]:
+        """Return the most recent scrobbles, newest first."""
+        return list(reversed(self.recent))
+
+    def between(self, start: int, end: int, limit: Optional[int] = None) -> List[Play]:
+        """Return the plays which started within the given unix times, oldest first."""
+        return self._query('WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp',
+                           (start, end), limit)
+
+    def by_artist(self, artist: str, limit: Optional[int] = None) -> List[Play]:
+        """Return the plays of the given artist, newest first."""
+        return self._query('WHERE artist = ? ORDER BY timestamp DESC', (artist,), limit)
+
+    def count(self) -> int:
+        """Return the number of logged plays."""
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM plays').fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _query(self, clause: str, params: tuple, limit: Optional[int]) -> List[Play]:
+        if limit is not None:
+            clause += ' LIMIT ?'
+            params += (limit,)
+
+        with self._lock:
+            rows = self._db.execute(f'SELECT {COLUMNS} FROM plays {clause}', params).fetchall()
+
+        return [self._play(row) for row in rows]
+
+    @staticmethod
+    def _play(row: tuple) -> Play:
+        return Play(*row[:6], scrobbled=bool(row[6]))
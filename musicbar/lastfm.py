@@ -1,171 +1,209 @@
-import http.server as BaseHTTPServer
-import logging
-import shelve
+import hashlib
+import json
 import time
-import urllib
-import webbrowser
-from typing import List
-
-import pylast
-
-from .enums import DATABASE, LASTFM_API_KEY, LASTFM_API_SECRET, Track
-
-# data = shelve.open(DATABASE)
-
-PORT = 5555
-
-# The following code is taken in part from the below repo
-# https://github.com/kstrauser/PythonOAuthCallback
-
-TEMPLATE_SUCCESS = """
-<html>
-    <head>
-        <title>Successfully authenticated</title>
-    </head>
-    <body>
-        <p>Thanks for logging in with Last.fm! You may close this window now.</p>
-        <script>
-            window.open('','_parent','');
-            window.close();
-        </script>
-    </body>
-</html>
-"""
-
-TEMPLATE_FAIL = """
-<html>
-    <head>
-        <title>Unable to authenticate</title>
-    </head>
-    <body>
-        <p>Something bad happened!</p>
-    </body>
-</html>
-"""
-
-TEMPLATE_REDIRECT = """
-<html>
-    <head>
-        <title>Redirecting</title>
-        <script>
-            window.location = window.location.toString().replace('#', '?');
-        </script>
-    </head>
-</html>
-"""
-
-
-class LastFmAuthHandler(BaseHTTPServer.BaseHTTPRequestHandler):
-    @classmethod
-    def fetch_access_token(cls, **kwargs):
-        """
-        Open the user's web browser to the auth URL then run a web server to
-        accept and process its callback
-        """
-        webbrowser.open(cls.auth_url(**kwargs))
+import urllib.parse
+from typing import Dict, List, Optional
 
-        httpd = BaseHTTPServer.HTTPServer(("", PORT), cls)
-        httpd.result = None
+from .enums import LASTFM_API_KEY, LASTFM_API_SECRET, Track
+from .nowplaying import NowPlayingDispatcher
+from .scrobblequeue import ScrobbleEntry, ScrobbleJournal, ScrobbleWorker
+from .settings import get_settings
+from .transport import HttpResponse, HttpTransport, get_transport
 
-        while httpd.result is None:
-            httpd.handle_request()
+API_URL = 'https://ws.audioscrobbler.com/2.0/'
 
-        httpd.server_close()
+# Last.fm error codes which are worth retrying later
+# (service offline, temporarily unavailable, invalid session key, rate limit exceeded)
+RETRYABLE_ERRORS = {9, 11, 16, 29}
 
-        return httpd.result
 
-    @staticmethod
-    def auth_url(**kwargs):
-        """
-        Return the system-specific authentication endpoint URL
-        """
-        return f'http://www.last.fm/api/auth?api_key={LASTFM_API_KEY}&cb=http://127.0.0.1:5555'
+class LastFmError(Exception):
+    """An error returned by the Last.fm API"""
 
-    def do_GET(self):  # pylint: disable=C0103
-        """
-        Override this to implement system-specific callback logic
+    def __init__(self, code: int, message: str):
+        super().__init__(f'{message} ({code})')
+        self.code = code
+
+    @property
+    def retryable(self) -> bool:
+        return self.code in RETRYABLE_ERRORS
+
+
+class LastFmApi:
+    """Minimal client for the signed write calls, and a few reads, of the Last.fm API"""
+
+    def __init__(self, session_key: str, api_url: str = API_URL,
+                 transport: Optional[HttpTransport] = None):
+        """Create a client for the given session.
+
+        Arguments:
+            session_key {str} -- Session key of the logged in user
+
+        Keyword Arguments:
+            api_url {str} -- The API endpoint (default: {API_URL})
+            transport {Optional[HttpTransport]} -- Sends the calls, the shared keep-alive transport by default (default: {None})
         """
-        if '?' in self.path:
-            querystring = urllib.parse.urlparse(self.path).query
-            querydict = urllib.parse.parse_qs(querystring)
-            try:
-                token = querydict['token'][0]
-            except KeyError:
-                template = TEMPLATE_FAIL
-            else:
-                template = TEMPLATE_SUCCESS
-                self._finish_with_result({'token': token})
-        else:
-            template = TEMPLATE_REDIRECT
-
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html')
-        self.end_headers()
-        self.wfile.write(template.encode('utf-8'))
-        # self.wfile.close()
-
-    def _finish_with_result(self, value):
+        self.session_key = session_key
+        self.api_url = api_url
+        self.transport = transport or get_transport()
+
+    def sign(self, params: Dict[str, str]) -> str:
+        """Return the api_sig of the given call parameters."""
+        payload = ''.join(f'{key}{params[key]}' for key in sorted(params))
+        return hashlib.md5((payload + LASTFM_API_SECRET).encode('utf-8')).hexdigest()
+
+    def call(self, method: str, params: Dict[str, str]) -> Dict:
+        """Make a signed POST call to the API.
+
+        Arguments:
+            method {str} -- The API method, e.g. track.scrobble
+            params {Dict[str, str]} -- Parameters of the method
+
+        Raises:
+            LastFmError -- If the API returned an error
+
+        Returns:
+            Dict -- The decoded response
         """
-        Return the value to the server and signal it to stop answering queries
+        params = {**params, 'method': method, 'api_key': LASTFM_API_KEY, 'sk': self.session_key}
+        params['api_sig'] = self.sign(params)
+        params['format'] = 'json'
+
+        response = self.transport.request(
+            'POST', self.api_url, urllib.parse.urlencode(params).encode('utf-8'),
+            {'Content-Type': 'application/x-www-form-urlencoded'})
+
+        return self._decode(response)
+
+    def read(self, method: str, params: Dict[str, str]) -> Dict:
+        """Make an unsigned GET call to the API, which the transport may answer from its cache.
+
+        Arguments:
+            method {str} -- The API method, e.g. user.getInfo
+            params {Dict[str, str]} -- Parameters of the method
+
+        Raises:
+            LastFmError -- If the API returned an error
+
+        Returns:
+            Dict -- The decoded response
         """
-        self.server.result = value
+        params = {**params, 'method': method, 'api_key': LASTFM_API_KEY, 'format': 'json'}
+        response = self.transport.request('GET', f'{self.api_url}?{urllib.parse.urlencode(params)}')
+
+        return self._decode(response)
+
+    def user_info(self, username: str) -> Dict:
+        """Return the profile of the given user, e.g. their play count."""
+        return self.read('user.getInfo', {'user': username})['user']
+
+    @staticmethod
+    def _decode(response: HttpResponse) -> Dict:
+        # API errors may also come with an error status
+        if response.status != 200 and not response.body.startswith(b'{'):
+            raise LastFmError(16, f'HTTP {response.status}')
+
+        result = json.loads(response.body.decode('utf-8'))
+
+        if 'error' in result:
+            raise LastFmError(result['error'], result.get('message', ''))
+
+        return result
+
+    def scrobble_many(self, entries: List[ScrobbleEntry]) -> Dict:
+        """Scrobble a batch of up to 50 tracks in a single call."""
+        params = {}
+        for idx, entry in enumerate(entries):
+            params[f'artist[{idx}]'] = entry.artist
+            params[f'track[{idx}]'] = entry.title
+            params[f'timestamp[{idx}]'] = str(entry.timestamp)
+            if entry.album:
+                params[f'album[{idx}]'] = entry.album
+            if entry.duration:
+                params[f'duration[{idx}]'] = str(entry.duration)
+
+        return self.call('track.scrobble', params)
+
+    def update_now_playing(self, track: Track) -> Dict:
+        """Tell Last.fm the given track has started playing."""
+        params = {'artist': track.artist, 'track': track.title}
+        if track.album:
+            params['album'] = track.album
+        if track.duration:
+            params['duration'] = str(track.duration)
+
+        return self.call('track.updateNowPlaying', params)
 
 
 class LastFmHandler:
+    """Scrobbles to Last.fm on behalf of the logged in user
+
+    The browser login flow and pylast are only imported when logging in, so they
+    do not slow down launching."""
+
     def __init__(self):
         self.token: str = ''
-        self.network: pylast.LastFMNetwork = None
+        self.settings = get_settings()
+        self.session_key: str = self.settings.lastfm_session_key or ''
+        self._username: str = self.settings.lastfm_username or ''
 
-        with shelve.open(DATABASE) as shelf:
-            if 'network' in shelf:
-                self.network = shelf['network']
+        # scrobbles are queued to disk and submitted in the background
+        self.journal = ScrobbleJournal()
+        self.worker = ScrobbleWorker(self.journal, self._submit_scrobbles)
+        self.worker.start()
+        self.now_playing = NowPlayingDispatcher(self._send_now_playing)
+        self.now_playing.start()
 
-    def _init_network(self):
-        self.network = pylast.LastFMNetwork(
-            api_key=LASTFM_API_KEY, api_secret=LASTFM_API_SECRET,
-            token=self.token)
+    def _api(self) -> LastFmApi:
+        if not self.session_key:
+            raise LastFmError(9, 'Not logged in')
 
-    def _token_mng(self, shelf):
-        if 'network' not in shelf:
-            self.token = LastFmAuthHandler.fetch_access_token()['token']
-            self._init_network()
-            shelf['network'] = self.network
-        else:
-            self.network = shelf['network']
+        return LastFmApi(self.session_key)
+
+    def _submit_scrobbles(self, entries: List[ScrobbleEntry]) -> None:
+        self._api().scrobble_many(entries)
+
+    def _send_now_playing(self, track: Track) -> None:
+        self._api().update_now_playing(track)
 
     def reset(self):
-        with shelve.open(DATABASE) as shelf:
-            del shelf['network']
-            shelf['scrobble'] = False
+        self.settings.set_lastfm_session(None, None)
+        self.settings.scrobble = False
 
-        self.__init__()
-        self._init_network()
+        self.token = ''
+        self.session_key = ''
+        self._username = ''
 
     def make_session(self):
-        with shelve.open(DATABASE) as shelf:
-            self._token_mng(shelf)
+        if not self.settings.lastfm_session_key:
+            import pylast
+
+            from .lastfm_auth import LastFmAuthHandler
+
+            self.token = LastFmAuthHandler.fetch_access_token()['token']
+            network = pylast.LastFMNetwork(
+                api_key=LASTFM_API_KEY, api_secret=LASTFM_API_SECRET, token=self.token)
+            self.settings.set_lastfm_session(network.session_key, network.username)
+
+        self.session_key = self.settings.lastfm_session_key or ''
+        self._username = self.settings.lastfm_username or ''
+
+        # scrobbles queued while logged out can now be submitted
+        self.worker.retry_now()
 
     @property
-    def username(self):
-        if self.network is not None:
-            return self.network.username
+    def username(self) -> Optional[str]:
+        if self.session_key:
+            return self._username
 
         return None
 
     def update_now_playing(self, track: Track):
-        if track and self.network:
-            self.network.update_now_playing(
-                artist=track.artist,
-                title=track.title,
-                album=track.album
-            )
-
-    def scrobble(self, track: Track):
-        if track and self.network:
-            start = int(time.time()) - track.position
-            self.network.scrobble(
-                artist=track.artist,
-                title=track.title,
-                album=track.album,
-                timestamp=start
-            )
+        if track and self.session_key:
+            self.now_playing.submit(track)
+
+    def scrobble(self, track: Track, position: int):
+        if track and self.session_key:
+            start = int(time.time()) - position
+            self.journal.append(track, start)
+            self.worker.notify()
@@ -1,18 +1,30 @@
-import os
-import shelve
-from dataclasses import dataclass
-from typing import Any, Callable, List
+import atexit
+import time
+from typing import Any, Dict, List, Sequence
 
 import rumps
-from AppKit import NSAttributedString
+from AppKit import NSAttributedString, NSMenu, NSMenuItem
 from Cocoa import NSFont, NSFontAttributeName
-from Foundation import NSLog
+from Foundation import NSLog, NSObject
 from PyObjCTools.Conversion import propertyListFromPythonCollection
 
-from .enums import DATABASE, Icons, PlayerStatus, Track
+from .discovery import DiscoveryCache
+from .enums import Icons, Track
+from .events import DistributedNotificationSource
+from .history import PlayHistory
 from .lastfm import LastFmHandler
+from .menumodel import MenuChange, MenuEntry, diff_menu
+from .menus import MenuBuilder
+from .metrics import metrics
 from .MusicBar import MusicBar
-from .utils import run
+from .position import PositionTracker
+from .refresh import RefreshPipeline
+from .scheduler import RefreshScheduler
+from .settings import get_settings
+from .stats import ListeningStats
+from .titles import AppKitMeasurer, TitleFitter
+from .utils import set_backend
+from .worker import WorkerBackend
 
 
 def make_attributed_string(text, font=NSFont.menuFontOfSize_(0.0)):
@@ -22,244 +34,180 @@ def make_attributed_string(text, font=NSFont.menuFontOfSize_(0.0)):
     return NSAttributedString.alloc().initWithString_attributes_(text, attributes)
 
 
-def make_font(text, font=NSFont.menuFontOfSize_(0.0)):
-    attr_string = make_attributed_string(text, font)
-    menuitem = rumps.MenuItem("")
-    menuitem._menuitem.setAttributedTitle_(attr_string)
-    return menuitem
+class MenuRenderer:
+    """Displays builds of the menu model in an NSMenu, only touching the items which changed"""
 
+    # fields of an entry which can be changed on an existing item
+    UPDATABLE = ('title', 'callback', 'state', 'font_size', 'children')
 
-def calc_string_length(title):
-    attr_string = make_attributed_string(title)
-    return attr_string.size().width
+    def __init__(self, nsmenu: Any):
+        self.nsmenu = nsmenu
+        self.entries: List[MenuEntry] = []
+        self.items: Dict[str, Any] = {}
+        self.submenus: Dict[str, 'MenuRenderer'] = {}
 
+    def render(self, entries: Sequence[MenuEntry]) -> None:
+        """Update the menu to display the given entries."""
+        current = {entry.key: entry for entry in self.entries}
 
-def dummy_callback(_):
-    return None
+        for change in diff_menu(self.entries, entries):
+            if change.action == MenuChange.REMOVE:
+                self._remove(change.key)
+            elif change.action == MenuChange.INSERT:
+                self._insert(change.entry, change.index)
+            elif self._can_update(current[change.key], change.entry):
+                self._update(current[change.key], change.entry)
+            else:
+                self._remove(change.key)
+                self._insert(change.entry, change.index)
+
+        self.entries = list(entries)
+
+    def _native(self, key: str) -> Any:
+        item = self.items[key]
+        return item if isinstance(item, NSMenuItem) else item._menuitem
+
+    def _insert(self, entry: MenuEntry, index: int) -> None:
+        if entry.separator:
+            self.items[entry.key] = NSMenuItem.separatorItem()
+        else:
+            item = rumps.MenuItem(entry.title, callback=entry.callback, key=entry.shortcut,
+                                  icon=entry.icon, dimensions=entry.dimensions)
+            self.items[entry.key] = item
+            self._update(MenuEntry(entry.key, entry.title, entry.callback), entry)
+
+        self.nsmenu.insertItem_atIndex_(self._native(entry.key), index)
+
+    def _remove(self, key: str) -> None:
+        self.nsmenu.removeItem_(self._native(key))
+        del self.items[key]
+        self.submenus.pop(key, None)
+
+    def _can_update(self, old: MenuEntry, new: MenuEntry) -> bool:
+        if old.separator or new.separator:
+            return False
 
+        return all(getattr(old, name) == getattr(new, name)
+                   for name in MenuEntry.__dataclass_fields__ if name not in self.UPDATABLE)
 
-@dataclass
-class PreviousState:
-    title: str = None
-    title_width: float = 0.0
-    track: Track = None
-    status: PlayerStatus = PlayerStatus.NOT_OPEN
+    def _update(self, old: MenuEntry, new: MenuEntry) -> None:
+        item = self.items[new.key]
 
+        if old.title != new.title:
+            item.title = new.title
+        if old.callback != new.callback:
+            item.set_callback(new.callback)
+        if new.font_size is not None and (old.title, old.font_size) != (new.title, new.font_size):
+            item._menuitem.setAttributedTitle_(
+                make_attributed_string(new.title, NSFont.menuFontOfSize_(new.font_size)))
+        if old.state != new.state:
+            item.state = new.state
 
-class MenuBar(rumps.App):
+        if old.children != new.children:
+            if new.key not in self.submenus:
+                submenu = NSMenu.alloc().init()
+                item._menuitem.setSubmenu_(submenu)
+                self.submenus[new.key] = MenuRenderer(submenu)
+            self.submenus[new.key].render(new.children)
+
+
+class MenuDelegate(NSObject):
+    """Calls on_open right before the menu it is the delegate of is displayed"""
+
+    def menuWillOpen_(self, _menu):
+        self.on_open()
+
+
+class MenuBar(MenuBuilder, rumps.App):
     def __init__(self):
         super(MenuBar, self).__init__(
             'MusicBar', Icons.music, quit_button=None)
 
-        self.mb = MusicBar()
-        self.previous = PreviousState()
-        self.interval = 10
+        # a player which does not answer then only blocks the worker, not the menu bar
+        if get_settings().script_worker:
+            self.worker = WorkerBackend()
+            set_backend(self.worker)
+            atexit.register(self.worker.close)
+
+        # installed apps are remembered between launches, so startup does not wait on Finder
+        # positions are predicted between polls, so players are rarely asked for them
+        self.mb = MusicBar(discovery=DiscoveryCache(), positions=PositionTracker())
         self.lastfm = LastFmHandler()
-        self.history: List[str] = []
+        self.history = PlayHistory()
+        self.stats = ListeningStats()
+        self.stats.prune()
+        self.scheduler = RefreshScheduler()
+        self.titles = TitleFitter(AppKitMeasurer())
+
+        self.pipeline = RefreshPipeline(self.mb, self.titles, self.scheduler,
+                                        update_now_playing=self.lastfm.update_now_playing,
+                                        scrobble=self.scrobble_track,
+                                        scrobbling=lambda: self.scrobble,
+                                        track_finished=self.track_finished)
+
+        # players which notify us of changes are refreshed right away, and polled less often
+        self.events = DistributedNotificationSource()
+        self.pipeline.listen(self.events, self.show_title)
+        self.events.start()
+
+        self.settings = get_settings()
+        self.scrobble: bool = self.settings.scrobble
+        self.settings.on_change('scrobble', self._scrobble_changed)
+
+        # the menu is only built when it is opened, except for this first build
+        self.setup_menu()
+
+        self.renderer = MenuRenderer(self._menu._menu)
+        self.menu_delegate = MenuDelegate.alloc().init()
+        self.menu_delegate.on_open = self.refresh_menu
+        self._menu._menu.setDelegate_(self.menu_delegate)
+        self.refresh_menu()
 
-        self.scrobble: bool = False
-        with shelve.open(DATABASE) as shelf:
-            if 'scrobble' in shelf:
-                self.scrobble = shelf['scrobble']
-            else:
-                shelf['scrobble'] = False
+        # the next tick picks up newly installed players, the menu is rebuilt when opened
+        self.mb.revalidate_installed(self.scheduler.wake)
 
     def force_refresh(self, _):
         self.title = f"{Icons.music} …"
-        # self.previous = PreviousState()
-        self.refresh_menu()
+        self.art_section.invalidate()
         self.refresh(force=True)
 
-    def set_scrobbling(self, scrobble: bool):
-        self.scrobble = scrobble
-        with shelve.open(DATABASE) as shelf:
-            shelf['scrobble'] = self.scrobble
+    def _scrobble_changed(self, scrobble: bool):
+        # also called for changes made outside of the menu, e.g. by logging out
+        self.scrobble = bool(scrobble)
 
-    # @rumps.timer(10)
     def refresh_menu(self, _=None) -> None:
-        self.menu.clear()
-        self.menu = self.build_menu()
+        self.renderer.render(self.build_menu())
 
-    @rumps.timer(1)
-    def refresh(self, _=None, force: bool = False) -> None:
-        player = self.mb.get_active_player()
-        if not player:
-            self.title = Icons.music
-            self.refresh_menu()
-            return
-
-        title, track = player.get_title()
+    def show_title(self, title: str) -> None:
+        self.title = title
 
-        if title == self.previous.title and not force:
-            size = self.previous.title_width
-        else:
-            size = calc_string_length(title)
-            self.refresh_menu()
-
-        # resize the title to fit
-        desired_width = 350
-        if size > desired_width:
-            data = player.get_title_data()
-            trim = 0
-            while size > desired_width:
-                trim += 1
-                if data["artist"]:
-                    if len(data["title"]) > len(data["artist"]):
-                        title = f'{data["icons"]}  {data["title"][:-trim]}… ー {data["artist"]}'
-                    else:
-                        title = f'{data["icons"]}  {data["title"]} ー {data["artist"][:-trim]}…'
-                else:
-                    title = f'{data["icons"]}  {data["title"][:-trim]}…'
-                size = calc_string_length(title)
-
-        self.interval -= 1
-        if self.interval <= 0:
-            self.refresh_menu()
-            self.interval = 10
+    # fires every second, but only refreshes once the scheduler says a refresh is due
+    @rumps.timer(1)
+    def tick(self, _=None) -> None:
+        metrics.incr('ticks')
+        if self.scheduler.due():
+            self.refresh()
 
-        self.title = title
+    def refresh(self, _=None, force: bool = False) -> None:
+        self.show_title(self.pipeline.refresh(force))
 
-        prev = self.previous.track
-        if self.scrobble:
-            if prev:
-                # position check accounts for repeating same track
-                if not prev.equals(track) or track.position < 1:
-                    # new track, updating now playing
-                    if track and player.status == PlayerStatus.PLAYING:
-                        self.lastfm.update_now_playing(track)
-
-                    # The track must be longer than 30 seconds.
-                    # And the track has been played for at least half its duration,
-                    # or for 4 minutes (whichever occurs earlier.)
-                    # (from last.fm API documentation)
-                    if prev.duration >= 30 and prev.position >= min(prev.duration/2, 240):
-                        self.lastfm.scrobble(prev)
-                        self.history.append(prev)
-                        self.refresh_menu()
-            else:
-                if track and player.status == PlayerStatus.PLAYING:
-                    self.lastfm.update_now_playing(track)
+    def scrobble_track(self, track: Track, position: int) -> None:
+        self.lastfm.scrobble(track, position)
 
-        self.previous = PreviousState(
-            title=title, title_width=size, track=track, status=player.status)
+    def track_finished(self, track: Track, listened: int, scrobbled: bool) -> None:
+        play = self.history.record(track, int(time.time()) - listened, listened, scrobbled)
+        self.stats.add(play)
 
-    def build_lastfm_menu(self) -> List[Any]:
-        def login_lastfm(_):
-            self.title = f"{Icons.music} Logging into Last.fm, check your browser..."
-            self.lastfm.make_session()
-            self.set_scrobbling(True)
-            self.refresh_menu()
+    def login_lastfm(self, _):
+        self.title = f"{Icons.music} Logging into Last.fm, check your browser..."
+        self.lastfm.make_session()
+        self.set_scrobbling(True)
 
-        def logout_lastfm(_):
-            self.lastfm.reset()
-            self.refresh_menu()
+    def dump_metrics(self, _):
+        rumps.notification('MusicBar', 'Metrics written to', metrics.dump())
 
-        def toggle_scrobbling(_):
-            self.set_scrobbling(not self.scrobble)
-            self.refresh()
-            self.refresh_menu()
-
-        if not self.lastfm.username:
-            self.set_scrobbling(False)
-            return [
-                'Not logged in.',
-                None,
-                rumps.MenuItem('Log in with Last.fm...', callback=login_lastfm)
-            ]
-
-        history = ['No tracks scrobbled yet...']
-        if self.history:
-            history = ['Last 5 Scrobbles']
-            for itm in reversed(self.history[-5:]):
-                history.append(
-                    make_font(f'• {itm}', NSFont.menuFontOfSize_(12.0)))
-
-        scrobble_enabled = rumps.MenuItem(
-            'Enable scrobbling', callback=toggle_scrobbling)
-        scrobble_enabled.state = self.scrobble
-
-        return [
-            f'Logged in as {self.lastfm.username}',
-            scrobble_enabled,
-            None,
-            *history,
-            None,
-            rumps.MenuItem('Log out...', callback=logout_lastfm)
-        ]
-
-    def build_menu(self) -> List[Any]:
-        def make_open(p):
-            return lambda _: run(p.value, 'activate')
-
-        always_visible = [
-            ('Open Player',
-             [rumps.MenuItem(f'{p.name}', callback=make_open(p))
-              for p in self.mb.players]),
-            None,
-            ('Last.fm Scrobbling', self.build_lastfm_menu()),
-            None,
-            rumps.MenuItem('Force Refresh',
-                           callback=self.force_refresh, key='r'),
-            rumps.MenuItem('Quit', callback=rumps.quit_application, key='q')
-        ]
-
-        player = self.mb.get_active_player()
-        if not player:
-            return ['No player open currently.', None, *always_visible]
-
-        track = player.get_track()
-        if not track:
-            return ['Nothing playing currently.', None, *always_visible]
-
-        def make_menu_button(method):
-            def cb(func) -> Callable[[Any], None]:
-                def inner(_: Any) -> None:
-                    func()
-                    self.refresh()
-                return inner
-
-            attr = method.lower()
-            return rumps.MenuItem(f'{getattr(Icons, attr)} {method}',
-                                  callback=cb(getattr(player, attr)))
-
-        buttons_paused = [make_menu_button('Play')]
-        buttons_playing = [make_menu_button('Pause'),
-                           make_menu_button('Next'),
-                           make_menu_button('Previous')]
-
-        buttons = buttons_paused if player.status == PlayerStatus.PAUSED else buttons_playing
-
-        art_menu = []
-        art_path = player.get_album_cover()
-        if art_path and os.path.isfile(art_path):
-            art_menu = [rumps.MenuItem(
-                "", callback=dummy_callback, icon=art_path, dimensions=[192, 192]), None]
-
-        if not player.scrobbling:
-            scrobble_message = f'{Icons.error} No scrobbler running'
-        else:
-            scrobblers = map(lambda scrob: scrob.name,
-                             self.mb.get_player_scrobblers(player.app))
-            scrobble_message = f'Scrobbling using {", ".join(scrobblers)}'
-
-        song_metadata = [rumps.MenuItem(track.title, callback=dummy_callback)]
-        if track.artist:
-            song_metadata.append(track.artist)
-        if track.album:
-            song_metadata.append(
-                make_font(track.album, NSFont.menuFontOfSize_(12.0)))
-
-        return [
-            *buttons,
-            None,
-            *art_menu,
-            *song_metadata,
-            None,
-            f'Now playing on {player.app.name}',
-            make_font(scrobble_message, NSFont.menuFontOfSize_(10.0)),
-            None,
-            *always_visible
-        ]
+    def quit_app(self, _):
+        rumps.quit_application()
 
 
 def main():
@@ -0,0 +1,112 @@
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable, List, Optional, Sequence, Tuple
+
+_UNBUILT = object()
+
+
+@dataclass(frozen=True)
+class MenuEntry:
+    """A single item of the menu, as it should be displayed
+
+    Entries are compared to find the items which changed between two builds of the
+    menu, so callbacks should be the same object from one build to the next."""
+    key: str
+    title: str = ''
+    callback: Optional[Callable[[Any], None]] = None
+    state: int = 0
+    shortcut: Optional[str] = None
+    font_size: Optional[float] = None
+    icon: Optional[str] = None
+    dimensions: Optional[Tuple[int, int]] = None
+    children: Tuple['MenuEntry', ...] = ()
+    separator: bool = False
+
+
+def separator(key: str) -> MenuEntry:
+    """Return a separator entry with the given key."""
+    return MenuEntry(key, separator=True)
+
+
+@dataclass(frozen=True)
+class MenuChange:
+    """A single change needed to turn one build of the menu into another"""
+    INSERT = 'insert'
+    UPDATE = 'update'
+    REMOVE = 'remove'
+
+    action: str
+    key: str
+    index: int = -1
+    entry: Optional[MenuEntry] = None
+
+
+def diff_menu(old: Sequence[MenuEntry], new: Sequence[MenuEntry]) -> List[MenuChange]:
+    """Return the changes which turn the old entries into the new entries.
+
+    Changes are meant to be applied in order. Entries are matched by key, unchanged
+    entries produce no change at all.
+
+    Arguments:
+        old {Sequence[MenuEntry]} -- The entries currently displayed
+        new {Sequence[MenuEntry]} -- The entries which should be displayed
+
+    Returns:
+        List[MenuChange] -- Removals, updates and insertions, in the order to apply them
+    """
+    new_keys = {entry.key for entry in new}
+    changes = [MenuChange(MenuChange.REMOVE, entry.key)
+               for entry in old if entry.key not in new_keys]
+
+    # entries which stay, in their current order
+    kept = [entry for entry in old if entry.key in new_keys]
+    kept_keys = {entry.key for entry in kept}
+
+    position = 0
+    for index, entry in enumerate(new):
+        if position < len(kept) and kept[position].key == entry.key:
+            if kept[position] != entry:
+                changes.append(MenuChange(MenuChange.UPDATE, entry.key, index, entry))
+            position += 1
+            continue
+
+        if entry.key in kept_keys:
+            # the entry moved, so take it out of where it was
+            changes.append(MenuChange(MenuChange.REMOVE, entry.key))
+            kept = [other for other in kept if other.key != entry.key]
+
+        changes.append(MenuChange(MenuChange.INSERT, entry.key, index, entry))
+
+    return changes
+
+
+class LazySection:
+    """Part of the menu which is expensive to build
+
+    The section is only rebuilt when it is displayed and the token describing its
+    inputs has changed since the last build."""
+
+    def __init__(self, build: Callable[[], Sequence[MenuEntry]]):
+        self._build = build
+        self._token: Hashable = _UNBUILT
+        self._entries: Tuple[MenuEntry, ...] = ()
+        self.builds = 0
+
+    def entries(self, token: Hashable) -> Tuple[MenuEntry, ...]:
+        """Return the entries of this section, rebuilding them if the token changed.
+
+        Arguments:
+            token {Hashable} -- Describes everything the section is built from
+
+        Returns:
+            Tuple[MenuEntry, ...] -- The entries of this section
+        """
+        if token != self._token:
+            self._entries = tuple(self._build())
+            self._token = token
+            self.builds += 1
+
+        return self._entries
+
+    def invalidate(self) -> None:
+        """Rebuild the section the next time it is displayed."""
+        self._token = _UNBUILT
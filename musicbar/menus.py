@@ -0,0 +1,263 @@
+import math
+import os
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List
+
+from .enums import Icons, PlayerApp, PlayerStatus
+from .history import PlayHistory
+from .menumodel import LazySection, MenuEntry, separator
+from .metrics import metrics
+from .MusicBar import MusicBar
+from .resilience import BreakerState, resilience
+from .settings import Settings
+from .stats import ListeningStats, Period, StatKind, period_key
+from .utils import run
+
+
+def dummy_callback(_):
+    return None
+
+
+class MenuBuilder(ABC):
+    """Builds the menu of MusicBar as a list of entries, without any UI code
+
+    Shared by MenuBar, which displays the entries, and by the benchmarks. Subclasses
+    set the state the menu is built from, call setup_menu, and implement the
+    abstract callbacks, which need the UI."""
+
+    mb: MusicBar
+    lastfm: Any
+    history: PlayHistory
+    stats: ListeningStats
+    settings: Settings
+    # whether MusicBar itself scrobbles, mirrored from the settings
+    scrobble: bool
+
+    def setup_menu(self) -> None:
+        """Create the sections of the menu, which are only built when it is opened."""
+        self.open_player_section = LazySection(self.build_open_player_menu)
+        self.history_section = LazySection(self.build_history_menu)
+        self.stats_section = LazySection(self.build_stats_menu)
+        self.art_section = LazySection(self.build_art_menu)
+        self.callbacks: Dict[Any, Callable[[Any], None]] = {}
+
+    @abstractmethod
+    def refresh(self, _=None, force: bool = False) -> None:
+        """Refresh the menu bar, e.g. after a setting or the player changed."""
+
+    @abstractmethod
+    def force_refresh(self, _) -> None:
+        """Refresh the menu bar from scratch, without reusing any snapshot or artwork."""
+
+    @abstractmethod
+    def login_lastfm(self, _) -> None:
+        """Log into Last.fm, and start scrobbling once logged in."""
+
+    @abstractmethod
+    def dump_metrics(self, _) -> None:
+        """Write the metrics to disk, telling the user where."""
+
+    @abstractmethod
+    def quit_app(self, _) -> None:
+        """Quit MusicBar."""
+
+    def set_scrobbling(self, scrobble: bool):
+        self.scrobble = scrobble
+        self.settings.scrobble = scrobble
+
+    def toggle_scrobbling(self, _):
+        self.set_scrobbling(not self.scrobble)
+        self.refresh()
+
+    def logout_lastfm(self, _):
+        self.lastfm.reset()
+
+    def rebuild_stats(self, _):
+        self.stats.rebuild()
+
+    def open_player(self, app: PlayerApp) -> Callable[[Any], None]:
+        """Return a menu callback which opens the given player."""
+        if app not in self.callbacks:
+            self.callbacks[app] = lambda _: run(app.value, 'activate')
+
+        return self.callbacks[app]
+
+    def control_player(self, method: str) -> Callable[[Any], None]:
+        """Return a menu callback which calls the given method of the current player."""
+        if method not in self.callbacks:
+            def control(_: Any) -> None:
+                player = self.mb.get_snapshot(max_age=float('inf')).player
+                if player:
+                    getattr(player, method)()
+                self.mb.invalidate_snapshot()
+                self.refresh()
+
+            self.callbacks[method] = control
+
+        return self.callbacks[method]
+
+    def build_open_player_menu(self) -> List[MenuEntry]:
+        return [MenuEntry(f'open-{p.name}', f'{p.name}', self.open_player(p))
+                for p in self.mb.players]
+
+    def build_history_menu(self) -> List[MenuEntry]:
+        scrobbles = self.history.recent_scrobbles()
+        if not scrobbles:
+            return [MenuEntry('history', 'No tracks scrobbled yet...')]
+
+        history = [MenuEntry('history', f'Last {len(scrobbles)} Scrobbles')]
+        for idx, itm in enumerate(scrobbles):
+            history.append(MenuEntry(f'history-{idx}', f'• {itm}', font_size=12.0))
+
+        return history
+
+    def build_art_menu(self) -> List[MenuEntry]:
+        player = self.mb.get_snapshot(max_age=float('inf')).player
+        art_path = player.get_album_cover() if player else None
+        if art_path and os.path.isfile(art_path):
+            return [MenuEntry('art', '', dummy_callback, icon=art_path, dimensions=(192, 192)),
+                    separator('art-sep')]
+
+        return []
+
+    def build_stats_menu(self) -> List[MenuEntry]:
+        def listened(seconds: int) -> str:
+            return f'{seconds // 3600}h {seconds // 60 % 60}m'
+
+        periods = {Period.DAY: 'Today', Period.WEEK: 'This Week', Period.ALL: 'All Time'}
+        kinds = {StatKind.ARTIST: 'Top Artists', StatKind.ALBUM: 'Top Albums',
+                 StatKind.TRACK: 'Top Tracks'}
+
+        menu = []
+        for period, period_title in periods.items():
+            plays, seconds = self.stats.total(period)
+            entries = [MenuEntry(f'{period.value}-total', f'{plays} plays, {listened(seconds)}')]
+            for kind, kind_title in kinds.items():
+                entries.append(separator(f'{period.value}-{kind.value}-sep'))
+                entries.append(MenuEntry(f'{period.value}-{kind.value}', kind_title))
+                for idx, entry in enumerate(self.stats.top(kind, period)):
+                    entries.append(MenuEntry(
+                        f'{period.value}-{kind.value}-{idx}',
+                        f'• {entry.name} ({entry.plays} plays, {listened(entry.seconds)})',
+                        font_size=12.0))
+
+            menu.append(MenuEntry(f'stats-{period.value}', period_title, children=tuple(entries)))
+
+        return [*menu, separator('stats-sep'),
+                MenuEntry('stats-rebuild', 'Rebuild from History', self.rebuild_stats)]
+
+    def build_lastfm_menu(self) -> List[MenuEntry]:
+        if not self.lastfm.username:
+            self.set_scrobbling(False)
+            return [
+                MenuEntry('status', 'Not logged in.'),
+                separator('status-sep'),
+                MenuEntry('login', 'Log in with Last.fm...', self.login_lastfm)
+            ]
+
+        return [
+            MenuEntry('status', f'Logged in as {self.lastfm.username}'),
+            MenuEntry('scrobble', 'Enable scrobbling', self.toggle_scrobbling,
+                      state=int(self.scrobble)),
+            separator('status-sep'),
+            *self.history_section.entries(tuple(self.history.recent)),
+            separator('history-sep'),
+            MenuEntry('logout', 'Log out...', self.logout_lastfm)
+        ]
+
+    def build_debug_menu(self) -> List[MenuEntry]:
+        snapshot = metrics.snapshot()
+        entries = [MenuEntry('debug-ticks', f'{snapshot["counters"].get("ticks", 0)} ticks, '
+                             f'up {snapshot["uptime"] / 60:.0f} minutes')]
+
+        for name, summary in sorted(snapshot['histograms'].items()):
+            errors = snapshot['counters'].get(f'{name}.errors', 0)
+            entries.append(MenuEntry(
+                f'debug-{name}',
+                f'{name}: {summary["count"]} calls, {errors} errors, p50 {summary["p50_ms"]:.1f}ms, '
+                f'p99 {summary["p99_ms"]:.1f}ms', font_size=10.0))
+
+        return [*entries, separator('debug-sep'),
+                MenuEntry('debug-dump', 'Dump metrics to JSON', self.dump_metrics)]
+
+    def build_breaker_menu(self) -> List[MenuEntry]:
+        names = {app.value: app.name for app in PlayerApp}
+        entries = []
+        for app, breaker in sorted(resilience.unhealthy().items()):
+            retry = 'retrying now' if breaker.state == BreakerState.HALF_OPEN \
+                else f'retrying in {math.ceil(breaker.retry_in)}s'
+            entries.append(MenuEntry(f'breaker-{app}',
+                                     f'{Icons.error} {names.get(app, app)} is not responding, {retry}',
+                                     font_size=10.0))
+
+        return [*entries, separator('breaker-sep')] if entries else []
+
+    def build_menu(self) -> List[MenuEntry]:
+        always_visible = [
+            # players which stopped answering, until they answer again
+            *self.build_breaker_menu(),
+            MenuEntry('open', 'Open Player',
+                      children=self.open_player_section.entries(tuple(self.mb.players))),
+            separator('open-sep'),
+            MenuEntry('lastfm', 'Last.fm Scrobbling', children=tuple(self.build_lastfm_menu())),
+            # rebuilt after every play, and when the day changes
+            MenuEntry('stats', 'Listening Stats', children=self.stats_section.entries(
+                (self.stats.version, period_key(Period.DAY)))),
+            separator('lastfm-sep'),
+            MenuEntry('refresh', 'Force Refresh', self.force_refresh, shortcut='r'),
+            MenuEntry('quit', 'Quit', self.quit_app, shortcut='q')
+        ]
+
+        # hidden unless debug_menu is set in the settings file
+        if self.settings.debug_menu:
+            always_visible[-1:-1] = [MenuEntry('debug', 'Debug',
+                                               children=tuple(self.build_debug_menu()))]
+
+        # shares the snapshot taken by the most recent refresh
+        snapshot = self.mb.get_snapshot()
+        player = snapshot.player
+        if not player:
+            return [MenuEntry('placeholder', 'No player open currently.'),
+                    separator('placeholder-sep'), *always_visible]
+
+        track = snapshot.track
+        if not track:
+            return [MenuEntry('placeholder', 'Nothing playing currently.'),
+                    separator('placeholder-sep'), *always_visible]
+
+        def make_menu_button(method):
+            attr = method.lower()
+            return MenuEntry(attr, f'{getattr(Icons, attr)} {method}', self.control_player(attr))
+
+        buttons_paused = [make_menu_button('Play')]
+        buttons_playing = [make_menu_button('Pause'),
+                           make_menu_button('Next'),
+                           make_menu_button('Previous')]
+
+        buttons = buttons_paused if player.status == PlayerStatus.PAUSED else buttons_playing
+
+        art_menu = self.art_section.entries((player.app, track.artist, track.album))
+
+        if not player.scrobbling:
+            scrobble_message = f'{Icons.error} No scrobbler running'
+        else:
+            scrobblers = map(lambda scrob: scrob.name, snapshot.scrobblers)
+            scrobble_message = f'Scrobbling using {", ".join(scrobblers)}'
+
+        song_metadata = [MenuEntry('track-title', track.title, dummy_callback)]
+        if track.artist:
+            song_metadata.append(MenuEntry('track-artist', track.artist))
+        if track.album:
+            song_metadata.append(MenuEntry('track-album', track.album, font_size=12.0))
+
+        return [
+            *buttons,
+            separator('buttons-sep'),
+            *art_menu,
+            *song_metadata,
+            separator('track-sep'),
+            MenuEntry('now-playing', f'Now playing on {player.app.name}'),
+            MenuEntry('scrobblers', scrobble_message, font_size=10.0),
+            separator('player-sep'),
+            *always_visible
+        ]
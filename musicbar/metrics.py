@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from .enums import dirs
+
+METRICS_FILE = os.path.join(dirs.user_data_dir, 'metrics.json')
+
+
+class Histogram:
+    """Latency distribution of a single kind of operation
+
+    Keeps a fixed number of the most recent samples for percentiles, as well as
+    running totals over every sample, so recording costs the same however long
+    MusicBar has been running."""
+
+    def __init__(self, size: int = 512):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.samples.append(seconds)
+
+    def percentile(self, fraction: float) -> float:
+        """Return the given percentile of the recent samples, e.g. 0.99 for p99, in seconds."""
+        if not self.samples:
+            return 0.0
+
+        samples = sorted(self.samples)
+        return samples[int(fraction * (len(samples) - 1))]
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'p50_ms': self.percentile(0.5) * 1000,
+            'p99_ms': self.percentile(0.99) * 1000,
+            'max_ms': self.max * 1000
+        }
+
+
+class Metrics:
+    """Counters and latency histograms, cheap enough to record all the time"""
+
+    def __init__(self, histogram_size: int = 512):
+        self.histogram_size = histogram_size
+        self.started = time.time()
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        """Add to a counter."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Record the duration of an operation."""
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(self.histogram_size)
+            histogram.observe(seconds)
+
+    def histogram(self, name: str) -> Optional[Histogram]:
+        return self.histograms.get(name)
+
+    def reset(self) -> None:
+        """Forget everything recorded so far."""
+        with self._lock:
+            self.started = time.time()
+            self.counters.clear()
+            self.histograms.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return every counter, and a summary of every histogram."""
+        with self._lock:
+            return {
+                'uptime': time.time() - self.started,
+                'counters': dict(self.counters),
+                'histograms': {name: histogram.summary()
+                               for name, histogram in self.histograms.items()}
+            }
+
+    def dump(self, path: str = METRICS_FILE) -> str:
+        """Write a snapshot to the given file as JSON.
+
+        Keyword Arguments:
+            path {str} -- The file to write to (default: {METRICS_FILE})
+
+        Returns:
+            str -- The path written to
+        """
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2, sort_keys=True)
+
+        return path
+
+
+metrics = Metrics()
@@ -0,0 +1,80 @@
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from .enums import Track
+
+
+class NowPlayingDispatcher(threading.Thread):
+    """Background thread which sends now-playing updates
+
+    Only the most recent update matters, so an update which has not been sent yet is
+    dropped when a newer one arrives. Updates are sent at most once per min_interval."""
+
+    def __init__(self, send: Callable[[Track], None], min_interval: float = 2.0):
+        """Create a dispatcher sending updates through the given function.
+
+        Arguments:
+            send {Callable[[Track], None]} -- Sends a now-playing update, raising an exception on failure
+
+        Keyword Arguments:
+            min_interval {float} -- Minimum seconds between two updates being sent (default: {2.0})
+        """
+        super().__init__(name='NowPlayingDispatcher', daemon=True)
+        self.send = send
+        self.min_interval = min_interval
+
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+        self._pending: Optional[Track] = None
+        self._last_sent = float('-inf')
+        self._condition = threading.Condition()
+        self._stopped = False
+
+    def submit(self, track: Track) -> None:
+        """Queue a now-playing update, replacing any update which is yet to be sent."""
+        with self._condition:
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = track
+            self._condition.notify()
+
+    def stop(self) -> None:
+        """Stop the dispatcher, dropping any update which is yet to be sent."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of sent, dropped and failed updates."""
+        return {
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'failed': self.failed
+        }
+
+    def run(self) -> None:
+        while True:
+            with self._condition:
+                while self._pending is None and not self._stopped:
+                    self._condition.wait()
+
+                # updates arriving while rate limited replace the pending one
+                send_at = self._last_sent + self.min_interval
+                while not self._stopped and time.monotonic() < send_at:
+                    self._condition.wait(send_at - time.monotonic())
+
+                if self._stopped:
+                    return
+
+                track, self._pending = self._pending, None
+
+            try:
+                self.send(track)
+                self.sent += 1
+            except Exception as error:  # pylint: disable=W0703
+                self.failed += 1
+                print('error: updating now playing failed: ', error)
+
+            self._last_sent = time.monotonic()
@@ -0,0 +1,133 @@
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable, Dict, Optional, Tuple
+
+from .metrics import metrics
+
+TrackKey = Tuple[str, str, str]
+
+
+@dataclass
+class Anchor:
+    """The last known position of a track, and when it was known"""
+    key: TrackKey
+    playing: bool
+    # seconds into the track
+    position: float
+    duration: int
+    # time.monotonic() at which the track was at the position
+    at: float
+    # set when the position was estimated rather than queried, e.g. right after a track change
+    stale: bool = False
+
+    def predict(self, now: float) -> float:
+        """Return the position the track is expected to be at, at the given time.monotonic()."""
+        position = self.position + (now - self.at if self.playing else 0.0)
+        if self.duration > 0:
+            position = min(position, self.duration)
+
+        return position
+
+
+class PositionTracker:
+    """Predicts the playback position of each player between queries
+
+    The position is anchored on the last queried position and a monotonic clock,
+    and moves along with the clock while playing. Players are only asked for their
+    position again after a state or track change, near the end of a track, or once
+    the anchor is older than the resync interval. A resync which disagrees with the
+    prediction means the track was seeked."""
+
+    def __init__(self, resync_interval: float = 10.0, seek_tolerance: float = 2.0,
+                 end_window: float = 5.0, clock: Callable[[], float] = time.monotonic):
+        """Create a tracker without any anchors.
+
+        Keyword Arguments:
+            resync_interval {float} -- Seconds after which an anchor is queried again, at the latest (default: {10.0})
+            seek_tolerance {float} -- Seconds a resync may differ from the prediction without being a seek (default: {2.0})
+            end_window {float} -- Seconds before the end of a track in which every refresh resyncs, to see repeats (default: {5.0})
+            clock {Callable[[], float]} -- Monotonic clock, replaceable for tests (default: {time.monotonic})
+        """
+        self.resync_interval = resync_interval
+        self.seek_tolerance = seek_tolerance
+        self.end_window = end_window
+        self.clock = clock
+        self.seeks = 0
+        self.anchors: Dict[Enum, Anchor] = {}
+
+    def needs_sync(self, app: Enum, now: Optional[float] = None) -> bool:
+        """Return whether the position of the given player should be queried on the next refresh."""
+        anchor = self.anchors.get(app)
+        if anchor is None or anchor.stale:
+            return True
+
+        now = self.clock() if now is None else now
+        if now - anchor.at >= self.resync_interval:
+            return True
+
+        return anchor.playing and anchor.duration > 0 \
+            and anchor.predict(now) >= anchor.duration - self.end_window
+
+    def sync(self, app: Enum, key: TrackKey, playing: bool, position: float, duration: int,
+             now: Optional[float] = None) -> bool:
+        """Anchor the given player on a queried position.
+
+        Arguments:
+            app {Enum} -- The player which was queried
+            key {TrackKey} -- The artist, title and album of its current track
+            playing {bool} -- Whether it is playing
+            position {float} -- The queried position, in seconds
+            duration {int} -- The duration of its current track, in seconds
+
+        Keyword Arguments:
+            now {Optional[float]} -- time.monotonic() at which the position was queried (default: {None})
+
+        Returns:
+            bool -- Whether the position disagrees with the prediction, because the track was seeked
+        """
+        now = self.clock() if now is None else now
+        previous = self.anchors.get(app)
+        seeked = previous is not None and previous.key == key \
+            and abs(previous.predict(now) - position) > self.seek_tolerance
+        if seeked:
+            self.seeks += 1
+            metrics.incr('position.seeks')
+
+        self.anchors[app] = Anchor(key, playing, position, duration, now)
+        metrics.incr('position.syncs')
+
+        return seeked
+
+    def estimate(self, app: Enum, key: TrackKey, playing: bool, duration: int,
+                 now: Optional[float] = None) -> int:
+        """Return the predicted position of the given player, whose position was not queried.
+
+        A changed track or state is anchored on the best guess, and resynced on the next refresh.
+
+        Arguments:
+            app {Enum} -- The player
+            key {TrackKey} -- The artist, title and album of its current track
+            playing {bool} -- Whether it is playing
+            duration {int} -- The duration of its current track, in seconds
+
+        Keyword Arguments:
+            now {Optional[float]} -- Current time.monotonic() (default: {None})
+
+        Returns:
+            int -- The predicted position, in seconds
+        """
+        now = self.clock() if now is None else now
+        anchor = self.anchors.get(app)
+        if anchor is None or anchor.key != key:
+            # a new track starts at the beginning, most of the time
+            anchor = self.anchors[app] = Anchor(key, playing, 0.0, duration, now, stale=True)
+        elif anchor.playing != playing:
+            anchor = self.anchors[app] = Anchor(key, playing, anchor.predict(now), duration, now, stale=True)
+
+        metrics.incr('position.estimates')
+        return int(anchor.predict(now))
+
+    def forget(self, app: Enum) -> None:
+        """Drop the anchor of the given player, e.g. once it stopped running."""
+        self.anchors.pop(app, None)
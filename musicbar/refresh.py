@@ -0,0 +1,152 @@
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from .enums import Icons, PlayerApp, PlayerStatus, Track
+from .events import PlayerEvent, PlayerEventSource
+from .metrics import metrics
+from .MusicBar import SNAPSHOT_TTL, MusicBar, Player
+from .scheduler import RefreshScheduler
+from .scrobbling import ScrobbleEngine
+from .titles import TitleFitter
+
+
+@dataclass
+class PreviousState:
+    title: str = None
+    title_width: float = 0.0
+    track: Track = None
+    status: PlayerStatus = PlayerStatus.NOT_OPEN
+
+
+class RefreshPipeline:
+    """Everything a refresh of the menu bar does, besides drawing the result
+
+    Kept free of any UI code, so it can be driven by the benchmarks as well."""
+
+    def __init__(self, mb: MusicBar, titles: TitleFitter, scheduler: RefreshScheduler,
+                 update_now_playing: Callable[[Track], None],
+                 scrobble: Callable[[Track, int], None],
+                 scrobbling: Callable[[], bool],
+                 pushed: Callable[[PlayerApp], bool] = lambda app: False,
+                 track_finished: Callable[[Track, int, bool], None] = lambda track, listened, scrobbled: None):
+        """Create a pipeline refreshing the given MusicBar.
+
+        Arguments:
+            mb {MusicBar} -- Interface to the players
+            titles {TitleFitter} -- Fits the now-playing string into the menu bar
+            scheduler {RefreshScheduler} -- Told when the next refresh is due after every refresh
+            update_now_playing {Callable[[Track], None]} -- Called when a new track starts playing
+            scrobble {Callable[[Track, int], None]} -- Called with each track which should be scrobbled, and the position it was last seen at
+            scrobbling {Callable[[], bool]} -- Whether scrobbling is enabled
+
+        Keyword Arguments:
+            pushed {Callable[[PlayerApp], bool]} -- Whether a player notifies us of changes (default: {never})
+            track_finished {Callable[[Track, int, bool], None]} -- Called with each track which stopped playing, the seconds it was listened to, and whether it was scrobbled (default: {ignored})
+        """
+        self.mb = mb
+        self.titles = titles
+        self.scheduler = scheduler
+        self.update_now_playing = update_now_playing
+        self.scrobble = scrobble
+        self.scrobbling = scrobbling
+        self.pushed = pushed
+        self.track_finished = track_finished
+        self.previous = PreviousState()
+        # a poll answered after a refresh stopped waiting for it is shown by the next tick
+        mb.on_late_poll = scheduler.wake
+        self.engine = ScrobbleEngine()
+        # the player of the previous refresh, players are reused by MusicBar while unchanged
+        self._player: Optional[Player] = None
+
+    def refresh(self, force: bool = False) -> str:
+        """Refresh the state of the foreground player, scrobbling the previous track if needed.
+
+        Keyword Arguments:
+            force {bool} -- Query the players even if the current snapshot is still fresh (default: {False})
+
+        Returns:
+            str -- The title to show in the menu bar
+        """
+        start = time.perf_counter()
+        try:
+            return self._refresh(force)
+        finally:
+            metrics.observe('refresh', time.perf_counter() - start)
+
+    def listen(self, source: PlayerEventSource, show_title: Callable[[str], None]) -> None:
+        """Refresh as soon as the given source reports a change, instead of waiting for the next tick.
+
+        The players the source supports are polled less often from then on.
+
+        Arguments:
+            source {PlayerEventSource} -- Reports changes of the players it supports
+            show_title {Callable[[str], None]} -- Called with the title of every refresh made for an event
+        """
+        self.pushed = source.supports
+        source.subscribe(lambda event: show_title(self.handle_event(event)))
+
+    def handle_event(self, event: PlayerEvent) -> str:
+        """Refresh right away after a player reported a change, discarding the current snapshot.
+
+        Arguments:
+            event {PlayerEvent} -- The reported change
+
+        Returns:
+            str -- The title to show in the menu bar
+        """
+        metrics.incr(f'events.{event.type.name.lower()}')
+        self.mb.invalidate_snapshot()
+        self.scheduler.wake()
+
+        return self.refresh(force=True)
+
+    def _refresh(self, force: bool) -> str:
+        snapshot = self.mb.get_snapshot(max_age=0 if force else SNAPSHOT_TTL)
+        player = snapshot.player
+        if not player:
+            self.scheduler.schedule(PlayerStatus.NOT_OPEN)
+            self._observe(None, 0, False)
+            self._player = None
+            if self.previous.status != PlayerStatus.NOT_OPEN:
+                self.previous = PreviousState()
+            return Icons.music
+
+        self.scheduler.schedule(player.status, snapshot.track, snapshot.position,
+                                pushed=self.pushed(player.app))
+        # listened time is accounted for on every refresh, even when nothing else changed
+        self._observe(snapshot.track, snapshot.position, player.status == PlayerStatus.PLAYING)
+
+        # nothing changed, so there is no new title to fit
+        if player is self._player:
+            return self.previous.title
+        self._player = player
+
+        data = player.get_title_data()
+        title, size = self.titles.fit(data['icons'], data['title'], data['artist'])
+        self.previous = PreviousState(
+            title=title, title_width=size, track=data['_track'], status=player.status)
+
+        return title
+
+    def _observe(self, track: Optional[Track], position: int, playing: bool) -> None:
+        """Update now playing and scrobble, based on the time listened to the current track."""
+        finished = self.engine.observe(track, position, playing)
+        scrobbling = self.scrobbling()
+        if finished is not None:
+            # eligible before the refresh scheduled for that moment came around
+            if scrobbling and self.engine.take_eligible(finished):
+                self.scrobble(finished.track, int(finished.position))
+            # a track which never got going was not really played
+            if finished.listened >= 1:
+                self.track_finished(finished.track, int(finished.listened), finished.scrobbled)
+
+        announcement = self.engine.take_announcement()
+        if announcement is not None:
+            self.update_now_playing(announcement)
+
+        if scrobbling and self.engine.take_eligible():
+            self.scrobble(self.engine.current.track, int(self.engine.current.position))
+
+        # a one-shot refresh at the moment the current track becomes eligible
+        self.scheduler.wake_at(self.engine.eligible_at())
@@ -0,0 +1,188 @@
+import threading
+import time
+from enum import Enum, auto
+from typing import Callable, Dict, Optional, Tuple
+
+# seconds a player gets to answer a single Apple Event, instead of the default two minutes
+SCRIPT_TIMEOUT = 3
+# seconds a single player gets within a poll plan, which polls every player in turn
+POLL_TIMEOUT = 1
+# seconds on top of the timeouts of a script, before giving up on a script run elsewhere, e.g. by a worker
+DEADLINE_SLACK = 1
+# seconds the menu bar waits for a script run elsewhere, before carrying on without its answer
+UI_DEADLINE = 0.25
+
+# AppleScript error number of an Apple Event which timed out
+TIMED_OUT = -1712
+
+# AppleScript error numbers meaning the player did not answer at all
+# (event timed out, connection invalid, application isn't running)
+UNRESPONSIVE_ERRORS = {-1712, -609, -600}
+
+ScriptKey = Tuple[str, str]
+
+
+class BreakerState(Enum):
+    """State of a circuit breaker"""
+    # calls go through
+    CLOSED = auto()
+    # calls are rejected until the cooldown is over
+    OPEN = auto()
+    # a single trial call goes through, deciding whether to close or open again
+    HALF_OPEN = auto()
+
+
+class CircuitBreaker:
+    """Stops calling a player which keeps failing to answer
+
+    Opens after a number of consecutive failures, then lets a single trial call
+    through once its cooldown is over. The cooldown doubles every time the trial
+    call fails as well."""
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 10.0,
+                 max_cooldown: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.clock = clock
+
+        self.failures = 0
+        self.cooldown = cooldown
+        self.opened_at: Optional[float] = None
+        self._trial = False
+
+    @property
+    def state(self) -> BreakerState:
+        if self.opened_at is None:
+            return BreakerState.CLOSED
+        if self.clock() - self.opened_at < self.cooldown:
+            return BreakerState.OPEN
+
+        return BreakerState.HALF_OPEN
+
+    @property
+    def retry_in(self) -> float:
+        """Seconds until the next trial call, 0 unless the breaker is open"""
+        if self.opened_at is None:
+            return 0.0
+
+        return max(0.0, self.opened_at + self.cooldown - self.clock())
+
+    def allow(self) -> bool:
+        """Return whether a call may be made now."""
+        state = self.state
+        if state == BreakerState.CLOSED:
+            return True
+        if state == BreakerState.HALF_OPEN and not self._trial:
+            self._trial = True
+            return True
+
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.cooldown = self.base_cooldown
+        self.opened_at = None
+        self._trial = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._trial:
+            # the trial call failed as well, back off further
+            self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+        if self._trial or self.failures >= self.failure_threshold:
+            self.opened_at = self.clock()
+        self._trial = False
+
+
+class Resilience:
+    """Keeps track of failing players and queries, to avoid calling them every refresh
+
+    Players which do not answer get a circuit breaker each, keyed by bundle id.
+    Queries which only read state and fail for other reasons, e.g. asking a stopped
+    player for its current track, are remembered as failing for a short while
+    instead. Controls are never remembered, so no button press is dropped."""
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 10.0,
+                 max_cooldown: float = 300.0, negative_ttl: float = 5.0,
+                 clock: Callable[[], float] = time.monotonic):
+        """Create an empty tracker.
+
+        Keyword Arguments:
+            failure_threshold {int} -- Consecutive unanswered calls which open a breaker (default: {3})
+            cooldown {float} -- Seconds a breaker stays open at first (default: {10.0})
+            max_cooldown {float} -- Upper bound of the doubling cooldown (default: {300.0})
+            negative_ttl {float} -- Seconds a failing query is not run again (default: {5.0})
+            clock {Callable[[], float]} -- Monotonic clock, replaceable for tests (default: {time.monotonic})
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self._failing: Dict[ScriptKey, float] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, app: str) -> CircuitBreaker:
+        breaker = self.breakers.get(app)
+        if breaker is None:
+            breaker = self.breakers[app] = CircuitBreaker(
+                self.failure_threshold, self.cooldown, self.max_cooldown, self.clock)
+
+        return breaker
+
+    def allow(self, key: ScriptKey) -> bool:
+        """Return whether the given (bundle id, query) may be run now."""
+        app, _ = key
+        with self._lock:
+            expires = self._failing.get(key)
+            if expires is not None:
+                if self.clock() < expires:
+                    return False
+                del self._failing[key]
+
+            return not app or self.breaker(app).allow()
+
+    def record(self, key: ScriptKey, error_number: Optional[int] = None, failed: bool = False,
+               negative_cache: bool = False) -> None:
+        """Record the outcome of running a (bundle id, query).
+
+        Arguments:
+            key {ScriptKey} -- The (bundle id, query) which was run
+
+        Keyword Arguments:
+            error_number {Optional[int]} -- The AppleScript error number, if it failed with one (default: {None})
+            failed {bool} -- Whether it failed (default: {False})
+            negative_cache {bool} -- Whether to remember a query which failed without timing out, only for queries which read state (default: {False})
+        """
+        app, _ = key
+        with self._lock:
+            if not failed:
+                if app:
+                    self.breaker(app).record_success()
+            elif error_number in UNRESPONSIVE_ERRORS:
+                if app:
+                    self.breaker(app).record_failure()
+            else:
+                # the player answered, but the query itself does not work right now
+                if negative_cache:
+                    self._failing[key] = self.clock() + self.negative_ttl
+                if app:
+                    self.breaker(app).record_success()
+
+    def reset(self) -> None:
+        """Close every breaker and forget every failing query."""
+        with self._lock:
+            self.breakers.clear()
+            self._failing.clear()
+
+    def unhealthy(self) -> Dict[str, CircuitBreaker]:
+        """Return the breakers which are not closed, by bundle id."""
+        with self._lock:
+            return {app: breaker for app, breaker in self.breakers.items()
+                    if breaker.state != BreakerState.CLOSED}
+
+
+resilience = Resilience()
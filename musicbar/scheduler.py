@@ -0,0 +1,113 @@
+import time
+from collections import deque
+from typing import Deque, Optional
+
+from .enums import PlayerStatus, Track
+
+
+class RefreshScheduler:
+    """Decides when the next refresh is due, based on the current playback state
+
+    Refreshes happen at the normal rate while playing, back off while paused or
+    while no player is open, and are brought forward to just before the predicted
+    end of the current track."""
+
+    def __init__(self,
+                 playing_interval: float = 1.0,
+                 pushed_interval: float = 15.0,
+                 paused_interval: float = 2.0,
+                 idle_interval: float = 2.0,
+                 min_interval: float = 1.0,
+                 max_interval: float = 30.0,
+                 backoff: float = 2.0,
+                 track_end_lead: float = 1.0):
+        """Create a scheduler with the given intervals and bounds.
+
+        Keyword Arguments:
+            playing_interval {float} -- Seconds between refreshes while playing (default: {1.0})
+            pushed_interval {float} -- Seconds between refreshes while playing, for players which notify us of changes (default: {15.0})
+            paused_interval {float} -- Initial seconds between refreshes while paused or stopped (default: {2.0})
+            idle_interval {float} -- Initial seconds between refreshes while no player is open (default: {2.0})
+            min_interval {float} -- Lower bound of any interval (default: {1.0})
+            max_interval {float} -- Upper bound of any interval, reached by backing off (default: {30.0})
+            backoff {float} -- Factor the paused and idle intervals grow by on each refresh (default: {2.0})
+            track_end_lead {float} -- Seconds before the predicted end of a track to refresh at (default: {1.0})
+        """
+        self.playing_interval = playing_interval
+        self.pushed_interval = pushed_interval
+        self.paused_interval = paused_interval
+        self.idle_interval = idle_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.track_end_lead = track_end_lead
+
+        self.interval: float = min_interval
+        self.next_due: float = 0.0
+        self._idle_refreshes = 0
+        self._ticks: Deque[float] = deque(maxlen=16)
+
+    def due(self, now: Optional[float] = None) -> bool:
+        """Return whether a refresh is due."""
+        return (time.monotonic() if now is None else now) >= self.next_due
+
+    def wake(self) -> None:
+        """Make a refresh due immediately, e.g. after the player notified us of a change."""
+        self.next_due = 0.0
+        self._idle_refreshes = 0
+
+    def wake_at(self, moment: Optional[float]) -> None:
+        """Make a refresh due at the given time.monotonic() at the latest, e.g. when a track becomes eligible for scrobbling."""
+        if moment is not None and moment < self.next_due:
+            self.next_due = moment
+
+    def schedule(self, status: PlayerStatus, track: Optional[Track] = None, position: int = 0,
+                 pushed: bool = False, now: Optional[float] = None) -> float:
+        """Schedule the next refresh, after a refresh which saw the given state.
+
+        Arguments:
+            status {PlayerStatus} -- Status of the foreground player
+
+        Keyword Arguments:
+            track {Optional[Track]} -- The current track of the foreground player (default: {None})
+            position {int} -- Seconds into the current track (default: {0})
+            pushed {bool} -- Whether the foreground player notifies us of changes (default: {False})
+            now {Optional[float]} -- Current time.monotonic() (default: {None})
+
+        Returns:
+            float -- Seconds until the next refresh
+        """
+        now = time.monotonic() if now is None else now
+        self._ticks.append(now)
+
+        if status == PlayerStatus.PLAYING:
+            self._idle_refreshes = 0
+            interval = self.pushed_interval if pushed else self.playing_interval
+
+            if track and track.duration > 0:
+                # wake up just before the track ends, to see the track change
+                remaining = track.duration - position - self.track_end_lead
+                if remaining > 0:
+                    interval = min(interval, remaining)
+        else:
+            base = self.idle_interval if status == PlayerStatus.NOT_OPEN else self.paused_interval
+            interval = base * self.backoff ** self._idle_refreshes
+            if interval < self.max_interval:
+                self._idle_refreshes += 1
+
+        self.interval = max(self.min_interval, min(self.max_interval, interval))
+        self.next_due = now + self.interval
+
+        return self.interval
+
+    @property
+    def effective_rate(self) -> float:
+        """Refreshes per second, measured over the most recent refreshes"""
+        if len(self._ticks) < 2:
+            return 1 / self.interval
+
+        elapsed = self._ticks[-1] - self._ticks[0]
+        if elapsed <= 0:
+            return 1 / self.interval
+
+        return (len(self._ticks) - 1) / elapsed
@@ -0,0 +1,230 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Callable, List, Optional
+
+from .enums import Track, dirs
+
+SCROBBLE_JOURNAL = os.path.join(dirs.user_data_dir, 'scrobbles.journal')
+
+# maximum number of scrobbles Last.fm accepts in a single request
+BATCH_SIZE = 50
+
+
+@dataclass
+class ScrobbleEntry:
+    """A scrobble waiting to be submitted"""
+    id: int
+    artist: str
+    title: str
+    album: str
+    timestamp: int
+    duration: int
+
+    @classmethod
+    def from_track(cls, entry_id: int, track: Track, timestamp: int) -> 'ScrobbleEntry':
+        return cls(entry_id, track.artist, track.title, track.album, timestamp, track.duration)
+
+
+class ScrobbleJournal:
+    """Durable, append-only journal of scrobbles which are yet to be submitted
+
+    Every queued scrobble and every acknowledgement of a submitted batch is appended
+    as a line of JSON, so the pending scrobbles can be replayed after a restart. The
+    journal is compacted once everything in it has been acknowledged."""
+
+    def __init__(self, path: str = SCROBBLE_JOURNAL, compact_after: int = 500):
+        self.path = path
+        self.compact_after = compact_after
+        self._lock = threading.Lock()
+        self._pending: 'OrderedDict[int, ScrobbleEntry]' = OrderedDict()
+        self._next_id = 1
+        self._lines = 0
+
+        self._replay()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def append(self, track: Track, timestamp: int) -> ScrobbleEntry:
+        """Queue a scrobble of the given track.
+
+        Arguments:
+            track {Track} -- The track to scrobble
+            timestamp {int} -- Unix time at which the track started playing
+
+        Returns:
+            ScrobbleEntry -- The queued scrobble
+        """
+        with self._lock:
+            entry = ScrobbleEntry.from_track(self._next_id, track, timestamp)
+            self._next_id += 1
+            self._pending[entry.id] = entry
+            self._write({'add': asdict(entry)})
+
+        return entry
+
+    def pending(self, limit: Optional[int] = None) -> List[ScrobbleEntry]:
+        """Return the oldest scrobbles which are yet to be submitted."""
+        with self._lock:
+            entries = list(self._pending.values())
+
+        return entries[:limit] if limit is not None else entries
+
+    def ack(self, entries: List[ScrobbleEntry]) -> None:
+        """Mark the given scrobbles as submitted."""
+        with self._lock:
+            for entry in entries:
+                self._pending.pop(entry.id, None)
+            self._write({'ack': [entry.id for entry in entries]})
+
+            if not self._pending or self._lines >= self.compact_after:
+                self._compact()
+
+    def _write(self, record: dict) -> None:
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._lines += 1
+
+    def _compact(self) -> None:
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            for entry in self._pending.values():
+                f.write(json.dumps({'add': asdict(entry)}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._lines = len(self._pending)
+
+    def _replay(self) -> None:
+        try:
+            with open(self.path) as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # a partial line from a crash mid-write
+                continue
+
+            if 'add' in record:
+                entry = ScrobbleEntry(**record['add'])
+                self._pending[entry.id] = entry
+                self._next_id = max(self._next_id, entry.id + 1)
+            for entry_id in record.get('ack', []):
+                self._pending.pop(entry_id, None)
+
+        self._lines = len(lines)
+
+
+class ScrobbleWorker(threading.Thread):
+    """Background thread which submits queued scrobbles in batches
+
+    Failed batches are retried with exponential backoff, so scrobbles made while
+    offline are submitted once the connection comes back."""
+
+    def __init__(self, journal: ScrobbleJournal, submit: Callable[[List[ScrobbleEntry]], None],
+                 batch_size: int = BATCH_SIZE, retry_delay: float = 5.0, max_retry_delay: float = 900.0):
+        """Create a worker draining the given journal.
+
+        Arguments:
+            journal {ScrobbleJournal} -- The journal to drain
+            submit {Callable[[List[ScrobbleEntry]], None]} -- Submits a batch, raising an exception on failure
+
+        Keyword Arguments:
+            batch_size {int} -- Maximum number of scrobbles per submission (default: {BATCH_SIZE})
+            retry_delay {float} -- Seconds to wait after the first failure (default: {5.0})
+            max_retry_delay {float} -- Upper bound of the wait between retries (default: {900.0})
+        """
+        super().__init__(name='ScrobbleWorker', daemon=True)
+        self.journal = journal
+        self.submit = submit
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+        self.submitted = 0
+        self.failures = 0
+        self._wake = threading.Event()
+        self._stopped = False
+        self._retry_now = False
+
+    def notify(self) -> None:
+        """Wake the worker up, e.g. after appending to the journal."""
+        self._wake.set()
+
+    def retry_now(self) -> None:
+        """Retry failed scrobbles immediately, instead of after the current backoff."""
+        self._retry_now = True
+        self._wake.set()
+
+    def stop(self) -> None:
+        """Stop the worker once its current submission is done."""
+        self._stopped = True
+        self._wake.set()
+
+    @property
+    def backoff(self) -> float:
+        """Seconds to wait before retrying after the current run of failures"""
+        if not self.failures:
+            return 0.0
+
+        return min(self.max_retry_delay, self.retry_delay * 2 ** (self.failures - 1))
+
+    def run(self) -> None:
+        while not self._stopped:
+            batch = self.journal.pending(self.batch_size)
+            if not batch:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+
+            if self.drain_once(batch):
+                continue
+
+            # newly queued scrobbles wake us up, but must not cut the backoff short
+            retry_at = time.monotonic() + self.backoff
+            self._retry_now = False
+            while not (self._stopped or self._retry_now) and time.monotonic() < retry_at:
+                self._wake.wait(retry_at - time.monotonic())
+                self._wake.clear()
+
+    def drain_once(self, batch: Optional[List[ScrobbleEntry]] = None) -> bool:
+        """Submit a single batch of pending scrobbles.
+
+        Keyword Arguments:
+            batch {Optional[List[ScrobbleEntry]]} -- The batch to submit, the oldest pending scrobbles by default
+
+        Returns:
+            bool -- Whether the batch was submitted
+        """
+        if batch is None:
+            batch = self.journal.pending(self.batch_size)
+        if not batch:
+            return True
+
+        try:
+            self.submit(batch)
+        except Exception as error:  # pylint: disable=W0703
+            if not getattr(error, 'retryable', True):
+                # retrying would be rejected in exactly the same way
+                print(f'error: dropping {len(batch)} rejected scrobbles: ', error)
+                self.journal.ack(batch)
+                return True
+
+            self.failures += 1
+            print(f'error: scrobbling {len(batch)} tracks failed, retrying in {self.backoff}s: ', error)
+            return False
+
+        self.journal.ack(batch)
+        self.submitted += len(batch)
+        self.failures = 0
+        return True
@@ -0,0 +1,99 @@
+import os
+import plistlib
+from enum import Enum
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from .enums import PlayerApp, ScrobbleApp
+from .settings import get_settings
+
+# the scrobblers which can scrobble each player
+PLAYER_SCROBBLERS: Dict[PlayerApp, List[Enum]] = {
+    PlayerApp.iTunes: [ScrobbleApp.MusicBar, ScrobbleApp.NepTunes, ScrobbleApp.LastFM, ScrobbleApp.Bowtie],
+    PlayerApp.Spotify: [ScrobbleApp.MusicBar, ScrobbleApp.NepTunes, ScrobbleApp.LastFM, ScrobbleApp.Bowtie],
+    PlayerApp.Vox: [ScrobbleApp.MusicBar, ScrobbleApp.LastFM],
+    PlayerApp.Swinsian: [ScrobbleApp.MusicBar, PlayerApp.Swinsian],
+    PlayerApp.Music: [ScrobbleApp.MusicBar]
+}
+
+SWINSIAN_PLIST = os.path.expanduser('~/Library/Preferences/com.swinsian.Swinsian.plist')
+
+
+class PlistCache:
+    """Parsed property lists, only read again once their modification time changed"""
+
+    def __init__(self):
+        self.reads = 0
+        self._entries: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+    def load(self, path: str) -> Dict[str, Any]:
+        """Return the contents of the given property list, or an empty dict if it cannot be read."""
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            self._entries.pop(path, None)
+            return {}
+
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+
+        self.reads += 1
+        try:
+            with open(path, 'rb') as f:
+                plist = plistlib.load(f)
+        except (IOError, plistlib.InvalidFileException) as error:
+            print('error: ', error)
+            plist = {}
+
+        self._entries[path] = (mtime, plist)
+        return plist
+
+
+class ScrobblerResolver:
+    """Answers which scrobblers are active for every player, from a single snapshot of the running apps
+
+    Whether each running scrobbler is actually scrobbling is checked once per
+    snapshot, however many players ask."""
+
+    def __init__(self, scrobble_enabled: Optional[Callable[[], bool]] = None,
+                 plists: Optional[PlistCache] = None, swinsian_plist: str = SWINSIAN_PLIST):
+        """Create a resolver.
+
+        Keyword Arguments:
+            scrobble_enabled {Optional[Callable[[], bool]]} -- Whether MusicBar itself scrobbles, from the settings by default (default: {None})
+            plists {Optional[PlistCache]} -- Caches the preferences of scrobbling players (default: {None})
+            swinsian_plist {str} -- The preferences of Swinsian (default: {SWINSIAN_PLIST})
+        """
+        self.scrobble_enabled = scrobble_enabled or (lambda: get_settings().scrobble)
+        self.plists = plists or PlistCache()
+        self.swinsian_plist = swinsian_plist
+        # number of snapshots resolved
+        self.checks = 0
+        self._running: Optional[Dict[Enum, bool]] = None
+        self._active: FrozenSet[Enum] = frozenset()
+
+    def active(self, running: Dict[Enum, bool]) -> FrozenSet[Enum]:
+        """Return the scrobblers which are running and scrobbling, for the given snapshot of running apps."""
+        if running is not self._running:
+            self._active = frozenset(app for app, app_running in running.items()
+                                     if app_running and self.is_scrobbling(app))
+            self._running = running
+            self.checks += 1
+
+        return self._active
+
+    def for_player(self, player: PlayerApp, running: Dict[Enum, bool]) -> List[Enum]:
+        """Return the active scrobblers which can scrobble the given player, in order of preference."""
+        active = self.active(running)
+        return [app for app in PLAYER_SCROBBLERS.get(player, []) if app in active]
+
+    def is_scrobbling(self, app: Enum) -> bool:
+        """Return whether the given running app scrobbles."""
+        if app == ScrobbleApp.MusicBar:
+            # exclude MusicBar if scrobbling is not enabled
+            return self.scrobble_enabled()
+        if app == PlayerApp.Swinsian:
+            # check if swinsian has lastfm configured
+            return bool(self.plists.load(self.swinsian_plist).get('LastFMConfigured', False))
+
+        return isinstance(app, ScrobbleApp)
@@ -0,0 +1,143 @@
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from .enums import Track
+
+# tracks shorter than this are never scrobbled, in seconds (from the Last.fm API documentation)
+MIN_DURATION = 30
+# a track is scrobbled once played for half its duration, or for this long, in seconds
+MAX_THRESHOLD = 240
+
+
+def scrobble_threshold(duration: int) -> Optional[float]:
+    """Return the seconds a track of the given duration has to be listened to, or None if it is never scrobbled."""
+    if duration < MIN_DURATION:
+        return None
+
+    return min(duration / 2, MAX_THRESHOLD)
+
+
+@dataclass
+class PlayInstance:
+    """A single play of a track, from when it started until another track started or it started over"""
+    track: Track
+    # seconds actually listened to, not counting pauses or the parts skipped by seeking
+    listened: float
+    # the position and time.monotonic() of the most recent observation
+    position: float
+    seen_at: float
+    playing: bool
+    scrobbled: bool = False
+    # whether the play was sent as now playing
+    announced: bool = False
+
+    @property
+    def eligible(self) -> bool:
+        """Whether this play was listened to long enough to be scrobbled"""
+        threshold = scrobble_threshold(self.track.duration)
+        return threshold is not None and self.listened >= threshold
+
+
+class ScrobbleEngine:
+    """Decides when to scrobble from the time actually listened to each play of a track
+
+    Listened time is accumulated between observations while playing, so pauses and
+    seeks are accounted for, and an observation every few seconds is as accurate as
+    one every second. The moment the current play becomes eligible is known up front,
+    so a refresh can be scheduled for exactly that moment."""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.current: Optional[PlayInstance] = None
+
+    def observe(self, track: Optional[Track], position: int, playing: bool,
+                now: Optional[float] = None) -> Optional[PlayInstance]:
+        """Account for the time listened since the previous observation.
+
+        Arguments:
+            track {Optional[Track]} -- The current track
+            position {int} -- Seconds into the current track
+            playing {bool} -- Whether the track is playing
+
+        Keyword Arguments:
+            now {Optional[float]} -- Current time.monotonic() (default: {None})
+
+        Returns:
+            Optional[PlayInstance] -- The previous play, if it just finished
+        """
+        now = self.clock() if now is None else now
+        current = self.current
+
+        if current is not None and track is not None and current.track.equals(track) \
+                and not self._repeated(current, track, position, now):
+            self._accumulate(current, position, now)
+            current.track = track
+            current.playing = playing
+            return None
+
+        if track is None:
+            self.current = None
+        else:
+            # the new track was listened to up to its position, e.g. since the previous observation
+            self.current = PlayInstance(track, float(position), position, now, playing)
+
+        if current is not None:
+            # the time since the previous observation went to the new track in part
+            self._accumulate(current, None, now - (position if track is not None else 0))
+        return current
+
+    def take_eligible(self, play: Optional[PlayInstance] = None) -> Optional[PlayInstance]:
+        """Return the given play, the current one by default, once, as soon as it is eligible for scrobbling."""
+        play = self.current if play is None else play
+        if play is None or play.scrobbled or not play.eligible:
+            return None
+
+        play.scrobbled = True
+        return play
+
+    def take_announcement(self) -> Optional[Track]:
+        """Return the current track once, as soon as it is playing, to send as now playing."""
+        current = self.current
+        if current is None or current.announced or not current.playing:
+            return None
+
+        current.announced = True
+        return current.track
+
+    def eligible_at(self) -> Optional[float]:
+        """Return the time.monotonic() at which the current play becomes eligible, or None if it does not while playing on."""
+        current = self.current
+        if current is None or current.scrobbled or not current.playing:
+            return None
+
+        threshold = scrobble_threshold(current.track.duration)
+        if threshold is None:
+            return None
+
+        return current.seen_at + max(0.0, threshold - current.listened)
+
+    @staticmethod
+    def _repeated(current: PlayInstance, track: Track, position: int, now: float) -> bool:
+        # started over, rather than seeked back: by now the previous play would have ended
+        elapsed = now - current.seen_at if current.playing else 0.0
+        return position < current.position and track.duration > 0 \
+            and current.position + elapsed >= track.duration - 1
+
+    @staticmethod
+    def _accumulate(current: PlayInstance, position: Optional[int], now: float) -> None:
+        elapsed = max(0.0, now - current.seen_at)
+        if current.playing:
+            if position is None and current.track.duration > 0:
+                # it did not play on past its end
+                elapsed = min(elapsed, max(0.0, current.track.duration - current.position))
+            if position is not None:
+                moved = position - current.position
+                # a pause in between moves less than the clock, a seek forward more than it,
+                # and after a seek back at most the new position was played
+                elapsed = min(elapsed, moved) if moved >= 0 else min(elapsed, position)
+            current.listened += elapsed
+
+        current.seen_at = max(current.seen_at, now)
+        if position is not None:
+            current.position = position
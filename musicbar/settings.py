@@ -0,0 +1,200 @@
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from .enums import DATABASE, dirs
+
+SETTINGS_FILE = os.path.join(dirs.user_data_dir, 'settings.json')
+
+SettingCallback = Callable[[Any], None]
+
+
+class Settings:
+    """Process-wide settings, loaded once and kept in memory
+
+    Changes are written back to disk after a short delay, replacing the settings file
+    atomically. Edits made to the file by something else are picked up by checking
+    its modification time, at most once per check_interval."""
+
+    def __init__(self, path: str = SETTINGS_FILE, save_delay: float = 1.0,
+                 check_interval: float = 5.0):
+        self.path = path
+        self.save_delay = save_delay
+        self.check_interval = check_interval
+
+        self._values: Dict[str, Any] = {}
+        self._callbacks: Dict[str, List[SettingCallback]] = {}
+        self._lock = threading.RLock()
+        self._save_timer: Optional[threading.Timer] = None
+        self._mtime: Optional[float] = None
+        self._checked_at = time.monotonic()
+
+        if os.path.exists(self.path):
+            self._values = self._read()
+        else:
+            self._values = self._migrate()
+            self.flush()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the value of a setting."""
+        if time.monotonic() - self._checked_at > self.check_interval:
+            self.reload()
+
+        return self._values.get(key, default)
+
+    def set(self, key: str, value: Any) -> None:
+        """Change the value of a setting, calling its change callbacks if it changed."""
+        with self._lock:
+            if key in self._values and self._values[key] == value:
+                return
+
+            self._values[key] = value
+            self._schedule_save()
+
+        self._changed(key, value)
+
+    def delete(self, key: str) -> None:
+        """Remove a setting, calling its change callbacks with None."""
+        with self._lock:
+            if key not in self._values:
+                return
+
+            del self._values[key]
+            self._schedule_save()
+
+        self._changed(key, None)
+
+    def on_change(self, key: str, callback: SettingCallback) -> None:
+        """Call the given callback with the new value whenever a setting changes."""
+        self._callbacks.setdefault(key, []).append(callback)
+
+    def flush(self) -> None:
+        """Write any pending changes to disk immediately."""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self._values, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._mtime = os.stat(self.path).st_mtime
+
+    def reload(self) -> None:
+        """Load the settings file again if it was changed by something else."""
+        self._checked_at = time.monotonic()
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return
+
+        with self._lock:
+            if mtime == self._mtime or self._save_timer is not None:
+                return
+
+            previous, self._values = self._values, self._read()
+
+        for key in set(previous) | set(self._values):
+            if previous.get(key) != self._values.get(key):
+                self._changed(key, self._values.get(key))
+
+    @property
+    def scrobble(self) -> bool:
+        """Whether MusicBar itself scrobbles to Last.fm"""
+        return bool(self.get('scrobble', False))
+
+    @scrobble.setter
+    def scrobble(self, value: bool) -> None:
+        self.set('scrobble', bool(value))
+
+    @property
+    def debug_menu(self) -> bool:
+        """Whether the debug menu is shown, only changed by editing the settings file"""
+        return bool(self.get('debug_menu', False))
+
+    @property
+    def script_worker(self) -> bool:
+        """Whether scripts are run in a separate worker process, instead of in the menu bar itself"""
+        return bool(self.get('script_worker', True))
+
+    @property
+    def lastfm_session_key(self) -> Optional[str]:
+        """Session key of the logged in Last.fm user"""
+        return self.get('lastfm_session_key')
+
+    @property
+    def lastfm_username(self) -> Optional[str]:
+        """Name of the logged in Last.fm user"""
+        return self.get('lastfm_username')
+
+    def set_lastfm_session(self, session_key: Optional[str], username: Optional[str]) -> None:
+        """Store the Last.fm session, or forget it if the session key is None."""
+        if session_key is None:
+            self.delete('lastfm_session_key')
+            self.delete('lastfm_username')
+        else:
+            self.set('lastfm_session_key', session_key)
+            self.set('lastfm_username', username)
+
+    def _changed(self, key: str, value: Any) -> None:
+        for callback in self._callbacks.get(key, []):
+            callback(value)
+
+    def _schedule_save(self) -> None:
+        if self._save_timer is not None:
+            self._save_timer.cancel()
+
+        self._save_timer = threading.Timer(self.save_delay, self.flush)
+        self._save_timer.daemon = True
+        self._save_timer.start()
+
+    def _read(self) -> Dict[str, Any]:
+        try:
+            self._mtime = os.stat(self.path).st_mtime
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, ValueError) as error:
+            print('error: unable to read settings: ', error)
+            return dict(self._values)
+
+    def _migrate(self) -> Dict[str, Any]:
+        """Import the settings stored by older versions in a shelve database."""
+        values: Dict[str, Any] = {'scrobble': False}
+        # depending on the dbm backend, the database may be split into several files
+        if not glob.glob(f'{DATABASE}*'):
+            return values
+
+        try:
+            import shelve
+
+            with shelve.open(DATABASE, flag='r') as shelf:
+                values['scrobble'] = bool(shelf.get('scrobble', False))
+                if 'network' in shelf:
+                    network = shelf['network']
+                    values['lastfm_session_key'] = network.session_key
+                    values['lastfm_username'] = network.username
+        except Exception as error:  # pylint: disable=W0703
+            # nothing to migrate, or written by a version we can no longer read
+            print('settings: nothing migrated: ', error)
+
+        return values
+
+
+_settings: Optional[Settings] = None
+
+
+def get_settings() -> Settings:
+    """Return the process-wide settings, loading them on first use."""
+    global _settings
+    if _settings is None:
+        _settings = Settings()
+        atexit.register(_settings.flush)
+
+    return _settings
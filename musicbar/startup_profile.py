@@ -0,0 +1,154 @@
+"""Reports how long importing MusicBar takes, per module
+
+Run as `python -m musicbar.startup_profile` to print the slowest imports of the core
+startup path. Exits with a non-zero status when the import takes longer than the
+budget, or when a subsystem which should be deferred until first use is imported.
+"""
+import argparse
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+# the modules imported before the menu bar is shown
+CORE_MODULE = 'musicbar.menubar'
+
+# maximum time importing the core startup path may take, in milliseconds
+IMPORT_BUDGET_MS = 400.0
+
+# subsystems which are only imported once they are first used
+DEFERRED_MODULES = ('pylast', 'http.client', 'http.server', 'webbrowser', 'musicbar.lastfm_auth',
+                    'musicbar.artcache')
+
+
+@dataclass
+class ImportTiming:
+    """Time spent importing a single module, as reported by `python -X importtime`"""
+    module: str
+    # time spent in the module itself, excluding the modules it imported, in microseconds
+    self_us: int
+    # time spent in the module and every module it imported, in microseconds
+    cumulative_us: int
+    # how deeply nested the import was, 0 for modules imported by the profiled import itself
+    depth: int
+
+
+def parse_importtime(output: str) -> List[ImportTiming]:
+    """Parse the output of `python -X importtime`.
+
+    Arguments:
+        output {str} -- What the interpreter wrote to stderr
+
+    Returns:
+        List[ImportTiming] -- The timing of every imported module, in the order they finished importing
+    """
+    timings = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            # the header line
+            continue
+
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        timings.append(ImportTiming(name.strip(), int(parts[0]), int(parts[1]), depth))
+
+    return timings
+
+
+def profile_imports(module: str = CORE_MODULE, python: str = sys.executable,
+                    setup: str = '') -> List[ImportTiming]:
+    """Import the given module in a fresh interpreter, timing every module it imports.
+
+    Keyword Arguments:
+        module {str} -- The module to import (default: {CORE_MODULE})
+        python {str} -- The interpreter to use (default: {sys.executable})
+        setup {str} -- Statements run before the import, e.g. to stand in for modules which are not installed (default: {''})
+
+    Raises:
+        ImportError -- If the module could not be imported
+
+    Returns:
+        List[ImportTiming] -- The timing of every imported module
+    """
+    process = subprocess.run([python, '-X', 'importtime', '-c', f'{setup}\nimport {module}'],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if process.returncode != 0:
+        raise ImportError(process.stderr.strip().splitlines()[-1], name=module)
+
+    return parse_importtime(process.stderr)
+
+
+def total_ms(timings: Iterable[ImportTiming], module: str = CORE_MODULE) -> float:
+    """Return the time spent importing the given module and its parent packages, in milliseconds."""
+    package = module.split('.')[0]
+
+    return sum(timing.cumulative_us for timing in timings
+               if timing.depth == 0 and (timing.module == package or
+                                         timing.module.startswith(f'{package}.'))) / 1000
+
+
+def check_budget(timings: List[ImportTiming], module: str = CORE_MODULE,
+                 budget_ms: float = IMPORT_BUDGET_MS,
+                 deferred: Iterable[str] = DEFERRED_MODULES) -> List[str]:
+    """Check the import of a module against the startup budget.
+
+    Arguments:
+        timings {List[ImportTiming]} -- The timings of the import, from profile_imports
+
+    Keyword Arguments:
+        module {str} -- The profiled module (default: {CORE_MODULE})
+        budget_ms {float} -- Maximum time the import may take, in milliseconds (default: {IMPORT_BUDGET_MS})
+        deferred {Iterable[str]} -- Modules which must not be imported (default: {DEFERRED_MODULES})
+
+    Returns:
+        List[str] -- A description of every violation, empty if the import is within budget
+    """
+    problems = []
+
+    total = total_ms(timings, module)
+    if total > budget_ms:
+        problems.append(f'importing {module} took {total:.1f}ms, over the budget of {budget_ms:.1f}ms')
+
+    imported = {timing.module for timing in timings}
+    for name in deferred:
+        if name in imported:
+            problems.append(f'{name} is imported at startup, but should be deferred until first use')
+
+    return problems
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('module', nargs='?', default=CORE_MODULE,
+                        help=f'module to profile (default: {CORE_MODULE})')
+    parser.add_argument('--budget', type=float, default=IMPORT_BUDGET_MS,
+                        help=f'import budget in milliseconds (default: {IMPORT_BUDGET_MS})')
+    parser.add_argument('--top', type=int, default=15,
+                        help='number of slowest modules to list (default: 15)')
+    args = parser.parse_args(argv)
+
+    try:
+        timings = profile_imports(args.module)
+    except ImportError as error:
+        print('error: ', error)
+        return 2
+
+    print(f'{"self [ms]":>10} {"total [ms]":>10}  module')
+    for timing in sorted(timings, key=lambda timing: timing.self_us, reverse=True)[:args.top]:
+        print(f'{timing.self_us / 1000:>10.1f} {timing.cumulative_us / 1000:>10.1f}  {timing.module}')
+    print(f'\nimporting {args.module} took {total_ms(timings, args.module):.1f}ms '
+          f'(budget {args.budget:.1f}ms)')
+
+    problems = check_budget(timings, args.module, args.budget)
+    for problem in problems:
+        print('error: ', problem)
+
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Dict, List, Optional, Tuple
+
+from .history import HISTORY_DB, Play
+from .history import SCHEMA as HISTORY_SCHEMA
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS stats (
+        period TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        name TEXT NOT NULL,
+        plays INTEGER NOT NULL,
+        seconds INTEGER NOT NULL,
+        PRIMARY KEY (period, kind, name)
+    );
+    CREATE INDEX IF NOT EXISTS stats_top ON stats (period, kind, plays DESC, seconds DESC);
+'''
+
+# adds to the counters of a name, creating them on its first play
+UPSERT = '''
+    INSERT INTO stats (period, kind, name, plays, seconds) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (period, kind, name) DO UPDATE
+    SET plays = plays + excluded.plays, seconds = seconds + excluded.seconds
+'''
+
+# kind of the single row per period counting every play, whatever it is counted under
+TOTAL_KIND = 'total'
+
+# formats of the day and week periods, shared by Python and SQLite's strftime
+DAY_FORMAT = '%Y-%m-%d'
+WEEK_FORMAT = '%Y-W%W'
+
+# separates the artist from the album or track in the names of albums and tracks
+SEPARATOR = ' ー '
+
+
+class Period(Enum):
+    """A span of time listening statistics are kept for"""
+    DAY = 'day'
+    WEEK = 'week'
+    ALL = 'all'
+
+
+class StatKind(Enum):
+    """What listening statistics are counted by"""
+    ARTIST = 'artist'
+    ALBUM = 'album'
+    TRACK = 'track'
+
+
+@dataclass(frozen=True)
+class StatEntry:
+    """The plays and listening time of a single artist, album or track"""
+    name: str
+    plays: int
+    seconds: int
+
+
+def period_key(period: Period, timestamp: Optional[float] = None) -> str:
+    """Return the key of the day, week or all time the given unix time falls in, now by default."""
+    if period == Period.ALL:
+        return 'all'
+
+    local = time.localtime(timestamp)
+    if period == Period.DAY:
+        return f'day:{time.strftime(DAY_FORMAT, local)}'
+
+    return f'week:{time.strftime(WEEK_FORMAT, local)}'
+
+
+def stat_names(play: Play) -> Dict[StatKind, Optional[str]]:
+    """Return the names a play is counted under, None for those it is not counted under."""
+    return {
+        StatKind.ARTIST: play.artist or None,
+        StatKind.ALBUM: f'{play.artist}{SEPARATOR}{play.album}' if play.album else None,
+        StatKind.TRACK: f'{play.artist}{SEPARATOR}{play.title}' if play.title else None
+    }
+
+
+class ListeningStats:
+    """Top artists, albums and tracks per day, week and all time
+
+    Counters are kept pre-aggregated next to the play history and updated with
+    every play, so a top list only reads as many rows as it returns, and a total
+    a single row. They can be rebuilt from the play history at any time."""
+
+    def __init__(self, path: str = HISTORY_DB):
+        self.path = path
+        # bumped on every change, so the menu knows when to rebuild its stats
+        self.version = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        # the play history is rebuilt from, in case the stats are opened first
+        self._db.executescript(HISTORY_SCHEMA + SCHEMA)
+
+    def add(self, play: Play) -> None:
+        """Count the given play."""
+        rows = []
+        for period in Period:
+            key = period_key(period, play.timestamp)
+            rows.append((key, TOTAL_KIND, '', 1, play.played))
+            for kind, name in stat_names(play).items():
+                if name is not None:
+                    rows.append((key, kind.value, name, 1, play.played))
+
+        with self._lock, self._db:
+            self._db.executemany(UPSERT, rows)
+        self.version += 1
+
+    def top(self, kind: StatKind, period: Period, limit: int = 5,
+            timestamp: Optional[float] = None) -> List[StatEntry]:
+        """Return the most played artists, albums or tracks.
+
+        Arguments:
+            kind {StatKind} -- Whether to return artists, albums or tracks
+            period {Period} -- The span of time to count plays in
+
+        Keyword Arguments:
+            limit {int} -- Maximum number of entries returned (default: {5})
+            timestamp {Optional[float]} -- Unix time within the day or week, now by default (default: {None})
+
+        Returns:
+            List[StatEntry] -- The most played entries, most played first
+        """
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT name, plays, seconds FROM stats WHERE period = ? AND kind = ? '
+                'ORDER BY plays DESC, seconds DESC LIMIT ?',
+                (period_key(period, timestamp), kind.value, limit)).fetchall()
+
+        return [StatEntry(*row) for row in rows]
+
+    def total(self, period: Period, timestamp: Optional[float] = None) -> Tuple[int, int]:
+        """Return the number of plays and seconds listened within the given period."""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT plays, seconds FROM stats WHERE period = ? AND kind = ? AND name = \'\'',
+                (period_key(period, timestamp), TOTAL_KIND)).fetchone()
+
+        return row if row is not None else (0, 0)
+
+    def prune(self, keep_days: int = 14) -> None:
+        """Forget the counters of days and weeks which ended more than the given number of days ago."""
+        cutoff = time.time() - keep_days * 24 * 60 * 60
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM stats WHERE (period LIKE \'day:%\' AND period < ?) '
+                             'OR (period LIKE \'week:%\' AND period < ?)',
+                             (period_key(Period.DAY, cutoff), period_key(Period.WEEK, cutoff)))
+        self.version += 1
+
+    def rebuild(self) -> None:
+        """Recount every counter from the play history."""
+        day = f"'day:' || strftime('{DAY_FORMAT}', timestamp, 'unixepoch', 'localtime')"
+        week = f"'week:' || strftime('{WEEK_FORMAT}', timestamp, 'unixepoch', 'localtime')"
+        names = {
+            StatKind.ARTIST: ('artist', "artist != ''"),
+            StatKind.ALBUM: (f"artist || '{SEPARATOR}' || album", "album != ''"),
+            StatKind.TRACK: (f"artist || '{SEPARATOR}' || title", "title != ''")
+        }
+
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM stats')
+            for period in (day, week, "'all'"):
+                self._db.execute(
+                    f'INSERT INTO stats (period, kind, name, plays, seconds) '
+                    f'SELECT {period}, ?, \'\', COUNT(*), SUM(played) FROM plays GROUP BY 1',
+                    (TOTAL_KIND,))
+                for kind, (name, condition) in names.items():
+                    self._db.execute(
+                        f'INSERT INTO stats (period, kind, name, plays, seconds) '
+                        f'SELECT {period}, ?, {name}, COUNT(*), SUM(played) FROM plays '
+                        f'WHERE {condition} GROUP BY 1, 3', (kind.value,))
+        self.version += 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,162 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Tuple
+
+# maximum width of the menu bar title, in points
+MAX_TITLE_WIDTH = 350.0
+
+
+def format_title(icons: str, title: str, artist: str) -> str:
+    """Build a "now-playing" string from its parts.
+
+    Arguments:
+        icons {str} -- Status icons shown before the track
+        title {str} -- Title of the track
+        artist {str} -- Artist of the track
+
+    Returns:
+        str -- The now-playing string
+    """
+    if title == '':
+        return f'{icons}'
+
+    if artist == '':
+        return f'{icons}  {title}'
+
+    return f'{icons}  {title} ー {artist}'
+
+
+class TextMeasurer:
+    """Measures the rendered width of text"""
+
+    # identifies the font text is measured in, so widths can be cached per font
+    font_key: Hashable = None
+
+    def width(self, text: str) -> float:
+        """Return the rendered width of the given text, in points."""
+        raise NotImplementedError
+
+
+class FixedWidthMeasurer(TextMeasurer):
+    """Deterministic measurer which gives every character the same width, for tests and benchmarks"""
+
+    def __init__(self, char_width: float = 7.0):
+        self.char_width = char_width
+        self.font_key = ('fixed', char_width)
+
+    def width(self, text: str) -> float:
+        return len(text) * self.char_width
+
+
+class AppKitMeasurer(TextMeasurer):
+    """Measures text as AppKit draws it in the given font, the menu bar font by default"""
+
+    def __init__(self, font: Any = None):
+        from AppKit import NSAttributedString
+        from Cocoa import NSFont, NSFontAttributeName
+        from PyObjCTools.Conversion import propertyListFromPythonCollection
+
+        self.font = font if font is not None else NSFont.menuFontOfSize_(0.0)
+        self.font_key = (self.font.fontName(), self.font.pointSize())
+        # built once and reused for every measurement
+        self._attributes = propertyListFromPythonCollection(
+            {NSFontAttributeName: self.font}, conversionHelper=lambda x: x)
+        self._string = NSAttributedString
+
+    def width(self, text: str) -> float:
+        return self._string.alloc().initWithString_attributes_(text, self._attributes).size().width
+
+
+class TitleFitter:
+    """Trims now-playing strings to fit the menu bar
+
+    Measured widths are kept in an LRU cache, so titles which were seen before cost
+    nothing to fit again."""
+
+    def __init__(self, measurer: TextMeasurer, max_width: float = MAX_TITLE_WIDTH,
+                 cache_size: int = 512):
+        self.measurer = measurer
+        self.max_width = max_width
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._widths: 'OrderedDict[Tuple[str, Hashable], float]' = OrderedDict()
+        # the most recent fit, as the same title is usually fitted on every refresh
+        self._last_fit: Tuple[Tuple[str, str, str], Tuple[str, float]] = (None, None)
+
+    def measure(self, text: str) -> float:
+        """Return the width of the given text, measuring it only if it is not cached."""
+        key = (text, self.measurer.font_key)
+        width = self._widths.get(key)
+        if width is not None:
+            self.hits += 1
+            self._widths.move_to_end(key)
+            return width
+
+        self.misses += 1
+        width = self._widths[key] = self.measurer.width(text)
+        if len(self._widths) > self.cache_size:
+            self._widths.popitem(last=False)
+
+        return width
+
+    def fit(self, icons: str, title: str, artist: str) -> Tuple[str, float]:
+        """Build a now-playing string which fits within the maximum width.
+
+        The longer of the title and artist is trimmed, using a binary search for the
+        smallest trim which fits.
+
+        Arguments:
+            icons {str} -- Status icons shown before the track
+            title {str} -- Title of the track
+            artist {str} -- Artist of the track
+
+        Returns:
+            Tuple[str, float] -- The (possibly trimmed) now-playing string and its width
+        """
+        parts = (icons, title, artist)
+        if self._last_fit[0] == parts:
+            return self._last_fit[1]
+
+        fitted = self._fit(icons, title, artist)
+        self._last_fit = (parts, fitted)
+
+        return fitted
+
+    def _fit(self, icons: str, title: str, artist: str) -> Tuple[str, float]:
+        text = format_title(icons, title, artist)
+        width = self.measure(text)
+        if width <= self.max_width:
+            return text, width
+
+        trim_title = not artist or len(title) > len(artist)
+        longest = title if trim_title else artist
+
+        def trimmed(trim: int) -> str:
+            if trim_title:
+                return format_title(icons, f'{title[:-trim]}…', artist)
+            return format_title(icons, title, f'{artist[:-trim]}…')
+
+        # the smallest trim in [low, high] which fits, or high if nothing fits
+        low, high = 1, max(1, len(longest))
+        while low < high:
+            middle = (low + high) // 2
+            if self.measure(trimmed(middle)) <= self.max_width:
+                high = middle
+            else:
+                low = middle + 1
+
+        text = trimmed(low)
+        return text, self.measure(text)
+
+    def clear(self) -> None:
+        """Forget every measured width and the most recent fit, e.g. after the font changed."""
+        self._widths.clear()
+        self._last_fit = (None, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the hit/miss counts and current size of the width cache."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._widths)
+        }
@@ -0,0 +1,241 @@
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from .metrics import metrics
+
+Origin = Tuple[str, str, int]
+
+
+def stale_connection_errors() -> Tuple[type, ...]:
+    """Return the errors of a kept-alive connection which the server closed in the meantime, the request never arrived."""
+    # the HTTP stack is only loaded once the first request is made, from a background thread
+    import http.client
+
+    return (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+
+@dataclass(frozen=True)
+class HttpResponse:
+    """The status and body of a response"""
+    status: int
+    body: bytes
+
+
+class HttpTransport:
+    """Sends HTTP requests on behalf of the Last.fm client"""
+
+    def request(self, method: str, url: str, body: Optional[bytes] = None,
+                headers: Optional[Dict[str, str]] = None) -> HttpResponse:
+        """Send a request and read its response.
+
+        Arguments:
+            method {str} -- The HTTP method, e.g. POST
+            url {str} -- The absolute URL
+
+        Keyword Arguments:
+            body {Optional[bytes]} -- The request body (default: {None})
+            headers {Optional[Dict[str, str]]} -- Additional request headers (default: {None})
+
+        Raises:
+            OSError -- If the server could not be reached, or did not answer in time
+            http.client.HTTPException -- If the server did not answer with a valid response
+
+        Returns:
+            HttpResponse -- The response, whatever its status
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Close any open connections."""
+
+
+class KeepAliveTransport(HttpTransport):
+    """Keeps connections open between requests, so each call does not pay for a new TLS handshake
+
+    Idle connections are pooled per origin, and dropped once they were idle for
+    longer than servers usually keep them open."""
+
+    def __init__(self, connect_timeout: float = 5.0, read_timeout: float = 10.0,
+                 max_idle: float = 30.0, pool_size: int = 2):
+        """Create a transport without any connections, they are opened on demand.
+
+        Keyword Arguments:
+            connect_timeout {float} -- Seconds to wait for a connection, including its TLS handshake (default: {5.0})
+            read_timeout {float} -- Seconds to wait for a response once connected (default: {10.0})
+            max_idle {float} -- Seconds a connection may be idle and still be reused (default: {30.0})
+            pool_size {int} -- Maximum number of idle connections kept per origin (default: {2})
+        """
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_idle = max_idle
+        self.pool_size = pool_size
+
+        self.connections_opened = 0
+        self.requests = 0
+        self._idle: Dict[Origin, List[Tuple['http.client.HTTPConnection', float]]] = {}
+        self._lock = threading.Lock()
+
+    def request(self, method: str, url: str, body: Optional[bytes] = None,
+                headers: Optional[Dict[str, str]] = None) -> HttpResponse:
+        parts = urllib.parse.urlsplit(url)
+        origin = (parts.scheme, parts.hostname or '', parts.port or (443 if parts.scheme == 'https' else 80))
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        start = time.perf_counter()
+        try:
+            connection, reused = self._acquire(origin)
+            try:
+                response, will_close = self._exchange(connection, method, path, body, headers)
+            except stale_connection_errors():
+                if not reused:
+                    raise
+                # closed by the server while idle, which is only known once it is used
+                connection = self._connect(origin)
+                response, will_close = self._exchange(connection, method, path, body, headers)
+        finally:
+            metrics.observe('http.request', time.perf_counter() - start)
+
+        with self._lock:
+            self.requests += 1
+        if will_close:
+            connection.close()
+        else:
+            self._release(origin, connection)
+
+        return response
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+
+        for connections in idle.values():
+            for connection, _ in connections:
+                connection.close()
+
+    def _exchange(self, connection: 'http.client.HTTPConnection', method: str, path: str,
+                  body: Optional[bytes], headers: Optional[Dict[str, str]]) -> Tuple[HttpResponse, bool]:
+        try:
+            connection.request(method, path, body, headers or {})
+            response = connection.getresponse()
+            # the whole body has to be read before the connection can be reused
+            return HttpResponse(response.status, response.read()), response.will_close
+        except Exception:
+            connection.close()
+            raise
+
+    def _acquire(self, origin: Origin) -> Tuple['http.client.HTTPConnection', bool]:
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.get(origin, [])
+            while idle:
+                connection, released_at = idle.pop()
+                if now - released_at < self.max_idle:
+                    return connection, True
+                connection.close()
+
+        return self._connect(origin), False
+
+    def _connect(self, origin: Origin) -> 'http.client.HTTPConnection':
+        import http.client
+
+        scheme, host, port = origin
+        if scheme == 'https':
+            connection = http.client.HTTPSConnection(host, port, timeout=self.connect_timeout)
+        else:
+            connection = http.client.HTTPConnection(host, port, timeout=self.connect_timeout)
+
+        connection.connect()
+        # connected, from now on only waiting for responses
+        connection.sock.settimeout(self.read_timeout)
+
+        with self._lock:
+            self.connections_opened += 1
+        metrics.incr('http.connections')
+
+        return connection
+
+    def _release(self, origin: Origin, connection: 'http.client.HTTPConnection') -> None:
+        with self._lock:
+            idle = self._idle.setdefault(origin, [])
+            if len(idle) < self.pool_size:
+                idle.append((connection, time.monotonic()))
+                return
+
+        connection.close()
+
+
+class CachingTransport(HttpTransport):
+    """Caches successful responses to GET requests for a while, passing everything else on
+
+    Only meant for idempotent reads, such as user info."""
+
+    def __init__(self, transport: HttpTransport, ttl: float = 300.0, maxsize: int = 32):
+        """Wrap the given transport.
+
+        Arguments:
+            transport {HttpTransport} -- Sends the requests which are not answered from the cache
+
+        Keyword Arguments:
+            ttl {float} -- Seconds a response is reused for (default: {300.0})
+            maxsize {int} -- Maximum number of cached responses (default: {32})
+        """
+        self.transport = transport
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._responses: 'OrderedDict[str, Tuple[HttpResponse, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def request(self, method: str, url: str, body: Optional[bytes] = None,
+                headers: Optional[Dict[str, str]] = None) -> HttpResponse:
+        if method != 'GET':
+            return self.transport.request(method, url, body, headers)
+
+        now = time.monotonic()
+        with self._lock:
+            cached = self._responses.get(url)
+            if cached is not None and now - cached[1] < self.ttl:
+                self.hits += 1
+                self._responses.move_to_end(url)
+                return cached[0]
+            self.misses += 1
+
+        response = self.transport.request(method, url, body, headers)
+        if response.status == 200:
+            with self._lock:
+                self._responses[url] = (response, now)
+                self._responses.move_to_end(url)
+                if len(self._responses) > self.maxsize:
+                    self._responses.popitem(last=False)
+
+        return response
+
+    def close(self) -> None:
+        with self._lock:
+            self._responses.clear()
+        self.transport.close()
+
+
+_transport: Optional[HttpTransport] = None
+
+
+def get_transport() -> HttpTransport:
+    """Return the transport shared by every Last.fm call, so its connections are reused."""
+    global _transport
+    if _transport is None:
+        _transport = CachingTransport(KeepAliveTransport())
+
+    return _transport
+
+
+def set_transport(transport: Optional[HttpTransport]) -> None:
+    """Send every Last.fm call with the given transport, or with the default one again if it is None."""
+    global _transport
+    _transport = transport
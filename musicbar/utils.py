@@ -1,9 +1,265 @@
-import os
-from typing import Any
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
-from applescript import AppleScript, ScriptError
+from .metrics import metrics
+from .resilience import DEADLINE_SLACK, SCRIPT_TIMEOUT, resilience
 
-apps_exist = AppleScript('''
+ScriptKey = Tuple[str, str]
+
+
+class ScriptFailed(Exception):
+    """A script failed to compile or run"""
+
+    def __init__(self, message: str, number: Optional[int] = None):
+        super().__init__(message)
+        # the AppleScript error number, if the script failed with one
+        self.number = number
+
+
+class ScriptSkipped(ScriptFailed):
+    """A script was not run, as its player is not responding or the script failed recently"""
+
+
+class ScriptCache:
+    """Bounded LRU cache of compiled scripts, keyed by (bundle id, query)"""
+
+    def __init__(self, compile_script: Callable[[str], Any], maxsize: int = 64):
+        """Create an empty cache.
+
+        Arguments:
+            compile_script {Callable[[str], Any]} -- Compiles the source of a script
+
+        Keyword Arguments:
+            maxsize {int} -- Maximum number of compiled scripts kept (default: {64})
+        """
+        self.compile_script = compile_script
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._scripts: 'OrderedDict[ScriptKey, Any]' = OrderedDict()
+
+    def get(self, key: ScriptKey, source: Callable[[], str]) -> Any:
+        """Return the compiled script for the given key, compiling it on a miss.
+
+        Arguments:
+            key {ScriptKey} -- The (bundle id, query) the script is cached under
+            source {Callable[[], str]} -- Builds the source of the script, only called on a miss
+
+        Returns:
+            Any -- The compiled script
+        """
+        script = self._scripts.get(key)
+        if script is not None:
+            self.hits += 1
+            self._scripts.move_to_end(key)
+            return script
+
+        self.misses += 1
+        script = self.compile_script(source())
+        self._scripts[key] = script
+        if len(self._scripts) > self.maxsize:
+            self._scripts.popitem(last=False)
+
+        return script
+
+    def clear(self) -> None:
+        """Remove every compiled script from the cache."""
+        self._scripts.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Return the hit/miss counts and current size of the cache."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._scripts)
+        }
+
+
+class ScriptBackend:
+    """Runs scripts on behalf of MusicBar"""
+
+    def execute(self, key: ScriptKey, source: Callable[[], str], args: Sequence[Any],
+                deadline: Optional[float] = None) -> Any:
+        """Run a script.
+
+        Arguments:
+            key {ScriptKey} -- The (bundle id, query) identifying the script
+            source {Callable[[], str]} -- Builds the source of the script
+            args {Sequence[Any]} -- Passed to the run handler of the script
+
+        Keyword Arguments:
+            deadline {Optional[float]} -- Seconds to wait for a script run elsewhere, the default of the backend if None (default: {None})
+
+        Raises:
+            ScriptFailed -- If the script fails to compile or run
+
+        Returns:
+            Any -- The output of the script, with missing values as None
+        """
+        raise NotImplementedError
+
+    def submit(self, key: ScriptKey, source: Callable[[], str], args: Sequence[Any]) -> Future:
+        """Start a script, without waiting for it if the backend runs it elsewhere.
+
+        Runs the script right away by default.
+
+        Arguments:
+            key {ScriptKey} -- The (bundle id, query) identifying the script
+            source {Callable[[], str]} -- Builds the source of the script
+            args {Sequence[Any]} -- Passed to the run handler of the script
+
+        Returns:
+            Future -- Resolved with the output of the script, or failed with ScriptFailed
+        """
+        future: Future = Future()
+        try:
+            future.set_result(self.execute(key, source, args))
+        except ScriptFailed as error:
+            future.set_exception(error)
+
+        return future
+
+
+class AppleScriptBackend(ScriptBackend):
+    """Runs scripts in-process with py-applescript, caching the compiled scripts"""
+
+    def __init__(self, maxsize: int = 64):
+        from applescript import AppleScript, ScriptError, kMissingValue
+
+        self.cache = ScriptCache(AppleScript, maxsize)
+        self._error = ScriptError
+        self._missing = kMissingValue
+
+    def execute(self, key: ScriptKey, source: Callable[[], str], args: Sequence[Any],
+                deadline: Optional[float] = None) -> Any:
+        # runs in-process, where the timeouts within the script are all there is
+        try:
+            return self._convert(self.cache.get(key, source).run(*args))
+        except self._error as error:
+            raise ScriptFailed(str(error), error.number) from error
+
+    def _convert(self, value: Any) -> Any:
+        if isinstance(value, list):
+            return [self._convert(item) for item in value]
+        if value == self._missing:
+            return None
+
+        return value
+
+
+_backend: Optional[ScriptBackend] = None
+
+
+def get_backend() -> ScriptBackend:
+    """Return the backend scripts are run with, AppleScript unless another one was set."""
+    global _backend
+    if _backend is None:
+        _backend = AppleScriptBackend()
+
+    return _backend
+
+
+def set_backend(backend: Optional[ScriptBackend]) -> None:
+    """Run scripts with the given backend, or with AppleScript again if it is None."""
+    global _backend
+    _backend = backend
+
+
+def execute(app: str, query: str, source: Callable[[], str], *args: Any, skippable: bool = False,
+            deadline: Optional[float] = None) -> Any:
+    """Run a script, compiling it only if it is not already in the script cache
+
+    Arguments:
+        app {str} -- Application ID the script targets, or '' if it targets no single app
+        query {str} -- Identifies the script within the given app
+        source {Callable[[], str]} -- Builds the source of the script
+        *args {Any} -- Passed to the run handler of the script
+
+    Keyword Arguments:
+        skippable {bool} -- Whether the script only reads the state of its app, so it may be skipped while the app is not responding, or after it failed recently (default: {False})
+        deadline {Optional[float]} -- Seconds to wait for the script, when the backend runs it elsewhere; UI_DEADLINE if None, so the menu bar never waits on a slow player (default: {None})
+
+    Raises:
+        ScriptSkipped -- If the app is not responding, or the script failed recently
+        ScriptFailed -- If the script fails to compile or run
+
+    Returns:
+        The output of the script
+    """
+    # poll plans are named after their players, but are recorded as a single kind of script
+    kind = 'poll' if query.startswith('poll ') else query
+    key = (app, query)
+    if skippable and not resilience.allow(key):
+        metrics.incr(f'script.{kind}.skipped')
+        raise ScriptSkipped(f'skipped {query} of {app or "MusicBar"}')
+
+    start = time.perf_counter()
+    try:
+        result = get_backend().execute(key, source, args, deadline)
+    except ScriptFailed as error:
+        _record(key, kind, start, error, skippable)
+        raise
+
+    _record(key, kind, start)
+    return result
+
+
+def submit(app: str, query: str, source: Callable[[], str], *args: Any) -> Future:
+    """Start a script without waiting for it, when the backend runs it elsewhere
+
+    Its outcome is recorded like that of execute once it finishes, from whichever
+    thread it finishes on.
+
+    Arguments:
+        app {str} -- Application ID the script targets, or '' if it targets no single app
+        query {str} -- Identifies the script within the given app
+        source {Callable[[], str]} -- Builds the source of the script
+        *args {Any} -- Passed to the run handler of the script
+
+    Raises:
+        ScriptFailed -- If the script could not be started
+
+    Returns:
+        Future -- Resolved with the output of the script, or failed with ScriptFailed
+    """
+    kind = 'poll' if query.startswith('poll ') else query
+    key = (app, query)
+
+    start = time.perf_counter()
+    try:
+        future = get_backend().submit(key, source, args)
+    except ScriptFailed as error:
+        _record(key, kind, start, error)
+        raise
+
+    def finished(future: Future) -> None:
+        error = future.exception()
+        _record(key, kind, start, error if isinstance(error, ScriptFailed) else None)
+
+    future.add_done_callback(finished)
+    return future
+
+
+def _record(key: ScriptKey, kind: str, start: float, error: Optional[ScriptFailed] = None,
+            skippable: bool = False) -> None:
+    app = key[0]
+    if error is not None:
+        resilience.record(key, error.number, failed=True, negative_cache=skippable)
+        metrics.incr(f'script.{kind}.errors')
+        if app:
+            metrics.incr(f'player.{app}.errors')
+    else:
+        resilience.record(key)
+
+    elapsed = time.perf_counter() - start
+    metrics.observe(f'script.{kind}', elapsed)
+    if app:
+        metrics.observe(f'player.{app}', elapsed)
+
+
+APPS_EXIST = '''
     on run {appList}
         repeat with a from 1 to length of appList
             set appname to item a of appList
@@ -17,9 +273,9 @@ apps_exist = AppleScript('''
 
         return appList
     end run
-''')
+'''
 
-apps_running = AppleScript('''
+APPS_RUNNING = '''
     on run {appList}
         repeat with a from 1 to length of appList
             set appname to item a of appList
@@ -28,95 +284,101 @@ apps_running = AppleScript('''
 
         return appList
     end run
-''')
-
-
-def get_itunes_art(app: str):
-    res = None
-
-    script_first = f'''
-try
-     tell application "{app}"
-         tell artwork 1 of current track
-             if format is JPEG picture then
-                 set imgFormat to ".jpg"
-             else
-                 set imgFormat to ".png"
-             end if
-         end tell
-         set albumName to album of current track
-         set albumArtist to album artist of current track
-         if length of albumArtist is 0
-             set albumArtist to artist of current track
-         end if
-         set fileName to (do shell script "echo " & quoted form of albumArtist & quoted form of albumName & " | sed \\"s/[^a-zA-Z0-9]/_/g\\"") & imgFormat
-     end tell
-     do shell script "echo " & (POSIX path of (path to temporary items from user domain)) & fileName
- on error errText
-     ""
- end try'''
-
-    script_second = f'''
-try
-    tell application "{app}"
-        tell artwork 1 of current track
-            set srcBytes to raw data
-            if format is JPEG picture then
-                set imgFormat to ".jpg"
-            else
-                set imgFormat to ".png"
-            end if
-        end tell
-        set albumName to album of current track
-        set albumArtist to album artist of current track
-        if length of albumArtist is 0
-            set albumArtist to artist of current track
-        end if
-        set fileName to (do shell script "echo " & quoted form of albumArtist & quoted form of albumName & " | sed \\"s/[^a-zA-Z0-9]/_/g\\"") & imgFormat
-    end tell
-    set tmpName to ((path to temporary items from user domain) as text) & fileName
-    set outFile to open for access file tmpName with write permission
-    set eof outFile to 0
-    write srcBytes to outFile
-    close access outFile
-    tell application "Image Events"
-        set resImg to open tmpName
-        scale resImg to size 300
-        save resImg
-        close resImg
-    end tell
-    do shell script "echo " & (POSIX path of (tmpName))
-on error errText
-    ""
-end try'''
+'''
 
-    try:
-        res = AppleScript(script_first).run()
-    except ScriptError:
-        pass
 
-    if res and not os.path.isfile(res):
-        try:
-            res = AppleScript(script_second).run()
-        except ScriptError:
-            pass
+def apps_exist(apps: List[str]) -> List[bool]:
+    """Return whether each of the given application IDs is installed."""
+    # asked before the first refresh, or from a background thread, where waiting on Finder freezes nothing
+    return execute('', 'apps_exist', lambda: APPS_EXIST, apps, deadline=SCRIPT_TIMEOUT + DEADLINE_SLACK)
+
+
+def apps_running(apps: List[str]) -> List[bool]:
+    """Return whether each of the given application IDs is running."""
+    return execute('', 'apps_running', lambda: APPS_RUNNING, apps)
 
-    return res
 
+def extract_artwork(app: str, out_path: str) -> Optional[str]:
+    """Write the artwork of the current track of a given application to disk, scaled to 300px
 
-def run(app: str, qry: str) -> Any:
+    Arguments:
+        app {str} -- Application ID of the app to get the artwork from
+        out_path {str} -- POSIX path to write the artwork to, without an extension
+
+    Returns:
+        Optional[str] -- The extension of the written artwork, '' if there is no artwork, or None if the app did not answer
+    """
+    def source():
+        return f'''
+on run {{outPath}}
+    try
+        with timeout of {SCRIPT_TIMEOUT} seconds
+            tell application id "{app}"
+                tell artwork 1 of current track
+                    set srcBytes to raw data
+                    if format is JPEG picture then
+                        set imgFormat to ".jpg"
+                    else
+                        set imgFormat to ".png"
+                    end if
+                end tell
+            end tell
+        end timeout
+        set tmpName to (POSIX file (outPath & imgFormat)) as text
+        set outFile to open for access file tmpName with write permission
+        set eof outFile to 0
+        write srcBytes to outFile
+        close access outFile
+        tell application "Image Events"
+            set resImg to open tmpName
+            scale resImg to size 300
+            save resImg
+            close resImg
+        end tell
+        return imgFormat
+    on error errText number errNum
+        -- a player which did not answer is reported, so it counts towards its circuit breaker
+        if errNum is -1712 then error errText number errNum
+        return ""
+    end try
+end run'''
+
+    # Image Events takes longer than UI_DEADLINE to scale the artwork, which is only extracted once per
+    # album when the menu is opened, and skipped while the player is not responding
+    try:
+        return execute(app, 'artwork', source, out_path, skippable=True,
+                       deadline=SCRIPT_TIMEOUT + DEADLINE_SLACK) or ''
+    except ScriptFailed:
+        return None
+
+
+def run(app: str, qry: str, *args: Any, skippable: bool = False) -> Any:
     """Tells a given application to perform a specific action
 
     Arguments:
         app {str} -- Application ID of the app to control
-        qry {str} -- The action to perform within the given app
+        qry {str} -- The action to perform within the given app, arguments are available as `argv`
+        *args {Any} -- Arguments passed to the action
+
+    Keyword Arguments:
+        skippable {bool} -- Whether the action only reads state, see execute (default: {False})
 
     Returns:
         The output of the given action
     """
-    script = f'tell application id "{app}" to {qry}'
+    def source():
+        return f'''
+    on run argv
+        with timeout of {SCRIPT_TIMEOUT} seconds
+            tell application id "{app}" to {qry}
+        end timeout
+    end run
+'''
+
     try:
-        return AppleScript(script).run()
-    except ScriptError as error:
+        return execute(app, qry, source, *args, skippable=skippable)
+    except ScriptSkipped:
+        return None
+    except ScriptFailed as error:
         print(error)
         return None
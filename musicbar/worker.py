@@ -0,0 +1,448 @@
+"""Runs scripts in a separate, long-lived process, so a slow player never blocks the menu bar
+
+Requests and responses are JSON documents, each framed by its length as a 4 byte
+big-endian integer. Requests are [id, bundle id, query, source, args], where the
+source is only sent the first time a script is run by a worker. Responses are
+[id, ok, value or error message, error number]. Scripts are run one at a time on
+the main thread of the worker, as NSAppleScript may only be used from the main
+thread, so responses come back in the order of the requests. Any number of
+requests can still be in flight at once.
+
+Run as `python -m musicbar.worker`, reading requests from stdin and writing
+responses to stdout.
+"""
+import json
+import os
+import struct
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, BinaryIO, Callable, Dict, Optional, Sequence, Set, Tuple
+
+from .metrics import metrics
+from .resilience import TIMED_OUT, UI_DEADLINE
+from .utils import AppleScriptBackend, ScriptBackend, ScriptFailed, ScriptKey
+
+HEADER = struct.Struct('>I')
+
+# seconds a request may stay unanswered before the worker is considered hung and restarted
+RESTART_AFTER = 10.0
+# workers in a row which may exit before answering anything, before scripts are run in-process instead
+MAX_START_FAILURES = 3
+# seconds to wait before starting a worker again after the first of those, doubling after each one
+START_BACKOFF = 1.0
+
+# the directory the musicbar package is imported from, which may be a zip file within an app bundle
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_frame(stream: BinaryIO, message: Any) -> None:
+    """Write a single framed message to the given stream."""
+    payload = json.dumps(message, separators=(',', ':'), default=str).encode('utf-8')
+    stream.write(HEADER.pack(len(payload)) + payload)
+    stream.flush()
+
+
+def read_frame(stream: BinaryIO) -> Optional[Any]:
+    """Read a single framed message from the given stream, or return None once it is closed."""
+    header = _read_exactly(stream, HEADER.size)
+    if header is None:
+        return None
+
+    payload = _read_exactly(stream, HEADER.unpack(header)[0])
+    if payload is None:
+        return None
+
+    return json.loads(payload.decode('utf-8'))
+
+
+def _read_exactly(stream: BinaryIO, size: int) -> Optional[bytes]:
+    data = b''
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+
+    return data
+
+
+def serve(requests: BinaryIO, responses: BinaryIO, backend: ScriptBackend) -> None:
+    """Answer requests with the given backend until the request stream is closed.
+
+    Scripts are run one at a time, on the calling thread, which has to be the main
+    thread for AppleScript. Requests sent in the meantime wait in the stream.
+
+    Arguments:
+        requests {BinaryIO} -- Stream framed requests are read from
+        responses {BinaryIO} -- Stream framed responses are written to
+        backend {ScriptBackend} -- Runs the requested scripts
+    """
+    sources: Dict[ScriptKey, str] = {}
+
+    while True:
+        request = read_frame(requests)
+        if request is None:
+            break
+
+        request_id, app, query, source, args = request
+        key = (app, query)
+        if source is not None:
+            sources[key] = source
+
+        try:
+            value = backend.execute(key, lambda: sources[key], args)
+            response = [request_id, True, value, None]
+        except ScriptFailed as error:
+            response = [request_id, False, str(error), error.number]
+        except Exception as error:  # pylint: disable=W0703
+            response = [request_id, False, f'{type(error).__name__}: {error}', None]
+
+        try:
+            write_frame(responses, response)
+        except (OSError, ValueError):
+            # the client went away, e.g. after restarting a hung worker
+            break
+
+    try:
+        responses.close()
+    except OSError:
+        pass
+
+
+class Worker:
+    """Starts and stops a process, or thread, which serves script requests"""
+
+    def start(self) -> Tuple[BinaryIO, BinaryIO]:
+        """Start serving.
+
+        Returns:
+            Tuple[BinaryIO, BinaryIO] -- The stream to write requests to, and the stream to read responses from
+        """
+        raise NotImplementedError
+
+    def stop(self) -> None:
+        """Stop serving, without waiting for running scripts."""
+        raise NotImplementedError
+
+
+class SubprocessWorker(Worker):
+    """Serves requests from a child process, running the scripts with AppleScript
+
+    The child imports musicbar from wherever this process did, whatever the working
+    directory MusicBar was launched from."""
+
+    def __init__(self, command: Optional[Sequence[str]] = None, root: str = PACKAGE_ROOT):
+        """Create a worker, without starting it.
+
+        Keyword Arguments:
+            command {Optional[Sequence[str]]} -- Starts the child, `python -m musicbar.worker` by default (default: {None})
+            root {str} -- The directory, or zip file, musicbar is imported from (default: {PACKAGE_ROOT})
+        """
+        self.command = list(command or [sys.executable, '-m', 'musicbar.worker'])
+        self.root = root
+        self._process: Optional[subprocess.Popen] = None
+
+    def start(self) -> Tuple[BinaryIO, BinaryIO]:
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [self.root, env.get('PYTHONPATH')]))
+        self._process = subprocess.Popen(
+            self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env,
+            cwd=self.root if os.path.isdir(self.root) else None)
+
+        return self._process.stdin, self._process.stdout
+
+    def stop(self) -> None:
+        process, self._process = self._process, None
+        if process is None:
+            return
+
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        for stream in (process.stdin, process.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+
+class LoopbackWorker(Worker):
+    """Serves requests from a thread of this process, with any backend
+
+    Exercises the whole protocol without a child process or AppleScript, e.g. with
+    a fake backend on Linux."""
+
+    def __init__(self, backend: ScriptBackend):
+        self.backend = backend
+        self._requests: Optional[BinaryIO] = None
+
+    def start(self) -> Tuple[BinaryIO, BinaryIO]:
+        request_read, request_write = os.pipe()
+        response_read, response_write = os.pipe()
+
+        thread = threading.Thread(
+            target=serve, name='LoopbackWorker', daemon=True,
+            args=(os.fdopen(request_read, 'rb'), os.fdopen(response_write, 'wb'), self.backend))
+        thread.start()
+
+        self._requests = os.fdopen(request_write, 'wb')
+        return self._requests, os.fdopen(response_read, 'rb')
+
+    def stop(self) -> None:
+        # closing the requests stops the serving thread, which closes the responses in turn
+        if self._requests is not None:
+            try:
+                self._requests.close()
+            except OSError:
+                pass
+            self._requests = None
+
+
+class Connection:
+    """Requests in flight to a single started worker"""
+
+    def __init__(self, requests: BinaryIO, responses: BinaryIO):
+        self.requests = requests
+        self.closed = False
+        # scripts whose source the worker already has
+        self.sent: Set[ScriptKey] = set()
+        # number of responses received, none when the worker exits right after starting
+        self.answered = 0
+        self.pending: Dict[int, Tuple[Future, float]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self._reader = threading.Thread(target=self._read, args=(responses,),
+                                        name='WorkerConnection', daemon=True)
+        self._reader.start()
+
+    def submit(self, key: ScriptKey, source: Callable[[], str], args: Sequence[Any]) -> Future:
+        """Send a request without waiting for its response.
+
+        Returns:
+            Future -- Resolved with the output of the script, or failed with ScriptFailed
+        """
+        future: Future = Future()
+        with self._lock:
+            if self.closed:
+                raise ScriptFailed('script worker is not running')
+
+            self._next_id += 1
+            request_id = self._next_id
+            self.pending[request_id] = (future, time.monotonic())
+            app, query = key
+            try:
+                write_frame(self.requests, [request_id, app, query,
+                                            None if key in self.sent else source(), list(args)])
+            except (OSError, ValueError) as error:
+                del self.pending[request_id]
+                self.closed = True
+                raise ScriptFailed(f'script worker is not running: {error}') from error
+            self.sent.add(key)
+
+        return future
+
+    def oldest(self) -> Optional[float]:
+        """Return the time.monotonic() at which the oldest unanswered request was sent."""
+        with self._lock:
+            return min((sent_at for _, sent_at in self.pending.values()), default=None)
+
+    def close(self, reason: str) -> None:
+        """Fail every unanswered request with the given reason."""
+        with self._lock:
+            self.closed = True
+            pending, self.pending = self.pending, {}
+
+        for future, _ in pending.values():
+            if not future.done():
+                future.set_exception(ScriptFailed(reason))
+
+    def _read(self, responses: BinaryIO) -> None:
+        while True:
+            try:
+                response = read_frame(responses)
+            except (OSError, ValueError):
+                response = None
+            if response is None:
+                break
+
+            request_id, ok, value, number = response
+            with self._lock:
+                self.answered += 1
+                future, _ = self.pending.pop(request_id, (None, 0))
+            if future is None:
+                continue
+
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(ScriptFailed(value, number))
+
+        self.close('script worker exited')
+
+
+class WorkerBackend(ScriptBackend):
+    """Runs scripts in a worker, restarting the worker when it exits or hangs
+
+    Waits on a response for UI_DEADLINE unless a script asks for longer, so a slow
+    player never freezes the menu bar. A script which misses its deadline fails as
+    if the player timed out, and counts towards its circuit breaker, while the
+    worker carries on running it. Polls are submitted instead, see PollPlan.
+
+    A worker which exits before answering anything is started again after a
+    growing delay, with scripts run in-process in the meantime. Once that happened
+    a few times in a row, e.g. because the worker cannot import musicbar, scripts
+    are run in-process for good."""
+
+    def __init__(self, worker: Optional[Worker] = None, deadline: float = UI_DEADLINE,
+                 restart_after: float = RESTART_AFTER,
+                 fallback: Callable[[], ScriptBackend] = AppleScriptBackend,
+                 max_start_failures: int = MAX_START_FAILURES, backoff: float = START_BACKOFF):
+        """Create a backend, starting the worker on the first script.
+
+        Keyword Arguments:
+            worker {Optional[Worker]} -- The worker to run scripts in, a child process by default (default: {None})
+            deadline {float} -- Seconds to wait for a script without a deadline of its own (default: {UI_DEADLINE})
+            restart_after {float} -- Seconds a request may stay unanswered before restarting the worker (default: {RESTART_AFTER})
+            fallback {Callable[[], ScriptBackend]} -- Creates the backend scripts are run with while there is no worker (default: {AppleScriptBackend})
+            max_start_failures {int} -- Workers in a row which may exit before answering, before falling back for good (default: {MAX_START_FAILURES})
+            backoff {float} -- Seconds to wait before starting a worker again, doubling after every failure (default: {START_BACKOFF})
+        """
+        self.worker = worker or SubprocessWorker()
+        self.deadline = deadline
+        self.restart_after = restart_after
+        self.fallback = fallback
+        self.max_start_failures = max_start_failures
+        self.backoff = backoff
+        self.restarts = 0
+        self.start_failures = 0
+        self._retry_at = 0.0
+        self._fallback: Optional[ScriptBackend] = None
+        self._connection: Optional[Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def fell_back(self) -> bool:
+        """Whether scripts are run in-process for good, as the worker kept failing to start"""
+        return self.start_failures >= self.max_start_failures
+
+    def submit(self, key: ScriptKey, source: Callable[[], str], args: Sequence[Any]) -> Future:
+        """Send a request to the worker without waiting for its response, e.g. to pipeline several."""
+        connection = self._connect()
+        if connection is None:
+            return self._fallback_backend().submit(key, source, args)
+
+        # nobody waits on submitted requests, so a hung worker is noticed when sending the next one
+        self._restart_if_hung(connection)
+        if connection.closed:
+            return self.submit(key, source, args)
+
+        return connection.submit(key, source, args)
+
+    def execute(self, key: ScriptKey, source: Callable[[], str], args: Sequence[Any],
+                deadline: Optional[float] = None) -> Any:
+        deadline = self.deadline if deadline is None else deadline
+        connection = self._connect()
+        if connection is None:
+            return self._fallback_backend().execute(key, source, args, deadline)
+
+        future = connection.submit(key, source, args)
+        try:
+            return future.result(timeout=deadline)
+        except FutureTimeout:
+            metrics.incr('worker.deadline')
+            self._restart_if_hung(connection)
+            raise ScriptFailed(f'no response from the script worker within {deadline}s',
+                               TIMED_OUT) from None
+
+    def restart(self, connection: Optional[Connection] = None) -> None:
+        """Stop the worker, failing its unanswered requests, and start it again on the next script.
+
+        Keyword Arguments:
+            connection {Optional[Connection]} -- Only restart if the worker still serves this connection (default: {None})
+        """
+        with self._lock:
+            if self._connection is None or (connection is not None and connection is not self._connection):
+                return
+
+            previous, self._connection = self._connection, None
+            self.worker.stop()
+            self.restarts += 1
+            metrics.incr('worker.restarts')
+
+        previous.close('script worker was restarted')
+
+    def close(self) -> None:
+        """Stop the worker."""
+        with self._lock:
+            previous, self._connection = self._connection, None
+            self.worker.stop()
+
+        if previous is not None:
+            previous.close('script worker was stopped')
+
+    def _restart_if_hung(self, connection: Connection) -> None:
+        oldest = connection.oldest()
+        if oldest is not None and time.monotonic() - oldest > self.restart_after:
+            self.restart(connection)
+
+    def _connect(self) -> Optional[Connection]:
+        with self._lock:
+            connection = self._connection
+            if connection is not None and not connection.closed:
+                return connection
+
+            if connection is not None:
+                # the worker exited by itself
+                self._connection = None
+                self.worker.stop()
+                self.restarts += 1
+                metrics.incr('worker.restarts')
+                if connection.answered:
+                    self.start_failures = 0
+                else:
+                    self._start_failed('script worker exited before answering')
+
+            if self.fell_back or time.monotonic() < self._retry_at:
+                return None
+
+            try:
+                self._connection = Connection(*self.worker.start())
+            except OSError as error:
+                self._start_failed(f'unable to start the script worker: {error}')
+                return None
+
+            return self._connection
+
+    def _start_failed(self, reason: str) -> None:
+        self.start_failures += 1
+        metrics.incr('worker.start_failures')
+        if self.fell_back:
+            print('error: ', f'{reason}, running scripts in-process from now on')
+            return
+
+        self._retry_at = time.monotonic() + self.backoff * 2 ** (self.start_failures - 1)
+        print('error: ', reason)
+
+    def _fallback_backend(self) -> ScriptBackend:
+        if self._fallback is None:
+            self._fallback = self.fallback()
+
+        return self._fallback
+
+
+def main() -> None:
+    # stdout carries the responses, anything printed goes to stderr instead
+    responses = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+
+    serve(sys.stdin.buffer, responses, AppleScriptBackend())
+
+
+if __name__ == "__main__":
+    main()